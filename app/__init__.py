@@ -1,12 +1,15 @@
 from flask import Flask
 from config import Config
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_bootstrap import Bootstrap
 from elasticsearch import Elasticsearch
+from app.search import create_backend
+from app.cache import create_cache
+from app.database import Database
+from app import profiling
 
 
-db = SQLAlchemy()
+db = Database()
 migrate = Migrate()
 bootstrap = Bootstrap()
 
@@ -18,7 +21,15 @@ def create_app(config_class=Config):
     db.init_app(app)
     migrate.init_app(app, db)
     bootstrap.init_app(app)
-    app.elasticsearch = Elasticsearch(app.config.get('ELASTICSEARCH_URL'))
+    app.elasticsearch = Elasticsearch([app.config['ELASTICSEARCH_URL']]) \
+        if app.config.get('ELASTICSEARCH_URL') else None
+    app.search_backend = create_backend(app)
+    app.cache = create_cache(app)
+    from app.columns import create_column_store
+    app.columns = create_column_store(app)
+    from app.tasks import TaskQueue
+    app.tasks = TaskQueue(app)
+    profiling.init_app(app)
 
     from app.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
@@ -26,4 +37,11 @@ def create_app(config_class=Config):
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
 
+    from app.api import bp as api_bp
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+
+    if app.config['PROFILING']:
+        from app.debug import bp as debug_bp
+        app.register_blueprint(debug_bp)
+
     return app
@@ -0,0 +1,61 @@
+from datetime import date, datetime
+
+from flask import request, jsonify
+
+from app.api import bp
+from app.api.errors import bad_request, error_response
+from app.database import read_replica
+from app.models import Account, Period
+
+
+@bp.route('/accounts', methods=['GET'])
+@read_replica
+def get_accounts():
+    """Lists accounts and their balances by name, `category=true` or `false` to only list one kind"""
+    accounts = Account.query.order_by(Account.name.asc())
+    if 'category' in request.args:
+        accounts = accounts.filter_by(is_category=request.args['category'].lower() in ('true', '1'))
+    return jsonify({'items': [a.to_dict() for a in accounts]})
+
+
+@bp.route('/accounts/<int:id>', methods=['GET'])
+@read_replica
+def get_account(id):
+    account = Account.query.get(id)
+    if account is None:
+        return error_response(404, f'unknown account {id}')
+    return jsonify(account.to_dict())
+
+
+@bp.route('/accounts/<int:id>/summaries', methods=['GET'])
+@read_replica
+def get_summaries(id):
+    """Inflow and outflow totals of an account per `period` (month or day), oldest first, from `since`"""
+    account = Account.query.get(id)
+    if account is None:
+        return error_response(404, f'unknown account {id}')
+    try:
+        period = Period[request.args.get('period', 'month')]
+    except KeyError:
+        return bad_request(f"unknown period {request.args['period']}")
+    try:
+        since = date.fromisoformat(request.args['since']) if 'since' in request.args else None
+    except ValueError:
+        return bad_request(f"invalid since {request.args['since']}")
+    return jsonify({'account': account.id, 'currency': account.currency,
+                    'items': [s.to_dict() for s in account.trend(period, since)]})
+
+
+@bp.route('/accounts/<int:id>/balance', methods=['GET'])
+@read_replica
+def get_balance(id):
+    """Balance of an account just before `at`, a date or time, from the journal, now by default"""
+    account = Account.query.get(id)
+    if account is None:
+        return error_response(404, f'unknown account {id}')
+    try:
+        at = datetime.fromisoformat(request.args['at']) if 'at' in request.args else datetime.utcnow()
+    except ValueError:
+        return bad_request(f"invalid at {request.args['at']}")
+    return jsonify({'account': account.id, 'currency': account.currency, 'at': at.isoformat(),
+                    'balance': str(account.balance_at(at))})
@@ -0,0 +1,33 @@
+from flask import request, jsonify, current_app
+
+from app.api import bp
+from app.api.errors import bad_request, error_response
+from app.models import Task
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+@bp.route('/tasks', methods=['GET'])
+def get_tasks():
+    """Lists the latest background tasks first, `status` to only list the tasks in one state"""
+    tasks = Task.query.order_by(Task.id.desc())
+    status = request.args.get('status')
+    if status:
+        if status not in STATUSES:
+            return bad_request(f'status must be one of {", ".join(STATUSES)}')
+        tasks = tasks.filter_by(status=status)
+    try:
+        limit = int(request.args.get('limit', current_app.config['API_PAGE_SIZE']))
+    except ValueError:
+        return bad_request('limit must be an integer')
+    if not 0 < limit <= current_app.config['API_MAX_PAGE_SIZE']:
+        return bad_request(f"limit must be between 1 and {current_app.config['API_MAX_PAGE_SIZE']}")
+    return jsonify({'items': [t.to_dict() for t in tasks.limit(limit)]})
+
+
+@bp.route('/tasks/<int:id>', methods=['GET'])
+def get_task(id):
+    task = Task.query.get(id)
+    if task is None:
+        return error_response(404, f'unknown task {id}')
+    return jsonify(task.to_dict())
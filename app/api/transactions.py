@@ -0,0 +1,186 @@
+from datetime import datetime
+from decimal import InvalidOperation
+from typing import Dict, List, Optional, Tuple
+
+from flask import request, jsonify, current_app, url_for, Response, stream_with_context
+
+from app import db
+from app.api import bp
+from app.api.errors import bad_request, error_response
+from app.database import read_replica
+from app.exporter import ExportError, arrow_schema, fetch, iter_csv, iter_arrow
+from app.ledger import Ledger, LedgerError
+from app.money import to_decimal
+from app.models import Account, Transaction, TransactionType
+from app.pagination import paginate_keyset
+
+
+def get_account(data: Dict, field: str, accounts: Dict[int, Account]) -> Account:
+    if field not in data:
+        raise ValueError(f'missing {field}')
+    if data[field] not in accounts:
+        raise ValueError(f'unknown {field} {data[field]}')
+    return accounts[data[field]]
+
+
+def from_dict(data: Dict, accounts: Dict[int, Account]) -> Tuple[Transaction, Optional[Account], Account]:
+    """Builds a transaction and its accounts from its JSON representation
+
+    Accounts are given by id, and currencies default to the ones of the accounts.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('transactions must be objects')
+    try:
+        transaction_type = TransactionType.from_str(data.get('type'))
+    except NotImplementedError:
+        raise ValueError(f"unknown type {data.get('type')}")
+    dest_account = get_account(data, 'dest_account', accounts)
+    src_account = get_account(data, 'src_account', accounts) if transaction_type != TransactionType.income else None
+    if 'value_src' not in data:
+        raise ValueError('missing value_src')
+    value_src = to_decimal(data['value_src'])
+    when = data.get('datetime')
+    transaction = Transaction(
+        type=transaction_type, datetime=datetime.fromisoformat(when) if when else None,
+        value_src=value_src, currency_src=data.get('currency_src', (src_account or dest_account).currency),
+        value_dest=to_decimal(data.get('value_dest', value_src)),
+        currency_dest=data.get('currency_dest', dest_account.currency),
+        description=data.get('description'), where=data.get('where'))
+    return transaction, src_account, dest_account
+
+
+def filters_from_args(args) -> List:
+    """Criteria of the `type`, `since` and `until` arguments, `until` being exclusive"""
+    filters = []
+    if 'type' in args:
+        try:
+            filters.append(Transaction.type == TransactionType.from_str(args['type']))
+        except NotImplementedError:
+            raise ValueError(f"unknown type {args['type']}")
+    for name, bound in (('since', Transaction.datetime.__ge__), ('until', Transaction.datetime.__lt__)):
+        if name in args:
+            try:
+                filters.append(bound(datetime.fromisoformat(args[name])))
+            except ValueError:
+                raise ValueError(f'invalid {name} {args[name]}')
+    return filters
+
+
+def account_from_args(args) -> Optional[Account]:
+    """Account of the `account` argument if there is one, raises LookupError for unknown ones"""
+    if 'account' not in args:
+        return None
+    account = Account.query.get(args.get('account', type=int) or 0)
+    if account is None:
+        raise LookupError(f"unknown account {args['account']}")
+    return account
+
+
+@bp.route('/transactions', methods=['GET'])
+@read_replica
+def get_transactions():
+    """Lists transactions newest first, a page at a time
+
+    Filters by `account` (on either side), `type`, `since` and `until`. Pages
+    hold up to `limit` transactions, the next and previous ones are linked
+    with cursors in `_links`.
+    """
+    args = request.args
+    try:
+        limit = int(args.get('limit', current_app.config['API_PAGE_SIZE']))
+    except ValueError:
+        return bad_request('limit must be an integer')
+    if not 0 < limit <= current_app.config['API_MAX_PAGE_SIZE']:
+        return bad_request(f"limit must be between 1 and {current_app.config['API_MAX_PAGE_SIZE']}")
+    try:
+        filters = filters_from_args(args)
+        account = account_from_args(args)
+    except ValueError as e:
+        return bad_request(str(e))
+    except LookupError as e:
+        return error_response(404, str(e))
+
+    if account:
+        page = paginate_keyset(Transaction.query, limit, after=args.get('after'), before=args.get('before'),
+                               partitions=[db.and_(side, *filters) for side in account.sides()])
+    else:
+        page = paginate_keyset(Transaction.query.filter(*filters), limit,
+                               after=args.get('after'), before=args.get('before'))
+
+    query = {k: v for k, v in args.items() if k not in ('after', 'before')}
+    return jsonify({
+        'items': [t.to_dict() for t in page.items],
+        '_meta': {'limit': limit},
+        '_links': {
+            'self': url_for('api.get_transactions', **args),
+            'next': url_for('api.get_transactions', after=page.next_cursor, **query) if page.next_cursor else None,
+            'prev': url_for('api.get_transactions', before=page.prev_cursor, **query) if page.prev_cursor else None,
+        },
+    })
+
+
+@bp.route('/transactions/export', methods=['GET'])
+def export_transactions():
+    """Streams the transactions matching the filters of GET /transactions, oldest first
+
+    Written in the `;` delimited format read by import.py, or as an Arrow IPC
+    stream with `format=arrow`, a chunk at a time so that memory use does not
+    depend on the size of the ledger.
+    """
+    args = request.args
+    format = args.get('format', 'csv')
+    if format not in ('csv', 'arrow'):
+        return bad_request(f'unknown format {format}')
+    try:
+        criteria = filters_from_args(args)
+        account = account_from_args(args)
+    except ValueError as e:
+        return bad_request(str(e))
+    except LookupError as e:
+        return error_response(404, str(e))
+    if account:
+        criteria.append(db.or_(*account.sides()))
+
+    chunks = fetch(criteria, current_app.config['EXPORT_CHUNK_SIZE'])
+    if format == 'csv':
+        return Response(stream_with_context(iter_csv(chunks)), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=transactions.csv'})
+    try:
+        arrow_schema()
+    except ExportError as e:
+        return error_response(501, str(e))
+    return Response(stream_with_context(iter_arrow(chunks)), mimetype='application/vnd.apache.arrow.stream',
+                    headers={'Content-Disposition': 'attachment; filename=transactions.arrows'})
+
+
+@bp.route('/transactions', methods=['POST'])
+def create_transactions():
+    """Posts a batch of transactions atomically, either all of them are stored or none
+
+    Expects `{"transactions": [{"type", "src_account", "dest_account", "value_src", ...}, ...]}`
+    and returns the ids of the stored transactions, in order.
+    """
+    data = request.get_json(silent=True) or {}
+    entries = data.get('transactions')
+    if not isinstance(entries, list) or not entries:
+        return bad_request('must include a non-empty list of transactions')
+    if len(entries) > current_app.config['API_MAX_BATCH_SIZE']:
+        return bad_request(f"at most {current_app.config['API_MAX_BATCH_SIZE']} transactions per request")
+
+    ids = {e.get(field) for e in entries if isinstance(e, dict) for field in ('src_account', 'dest_account')}
+    accounts = {a.id: a for a in Account.query.filter(Account.id.in_(
+        [i for i in ids if isinstance(i, int)]))}
+    ledger = Ledger()
+    for index, entry in enumerate(entries):
+        try:
+            ledger.post(*from_dict(entry, accounts))
+        except InvalidOperation:
+            ledger.rollback()
+            return bad_request('invalid amount', index=index)
+        except (LedgerError, TypeError, ValueError) as e:
+            ledger.rollback()
+            return bad_request(str(e), index=index)
+    posted = ledger.commit()
+    response = jsonify({'count': len(posted), 'ids': [t.id for t in posted]})
+    response.status_code = 201
+    return response
@@ -0,0 +1,13 @@
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+
+class ThreadPoolInstance(WsgiToAsgiInstance):
+    # asgiref runs thread sensitive functions, its default, one at a time in a single thread
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """ASGI adapter running the requests of a WSGI app concurrently, in the thread pool of the event loop"""
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolInstance(self.wsgi_application)(scope, receive, send)
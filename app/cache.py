@@ -0,0 +1,196 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Dict, Optional
+
+from flask import current_app, request, session, g, make_response
+from flask_wtf.csrf import generate_csrf
+
+# Stands for the CSRF token of the request in cached pages, which are shared across sessions
+CSRF_PLACEHOLDER = '\x00csrf\x00'
+
+
+class CacheBackend:
+    """Interface of the page cache stores
+
+    Values are strings expiring after `timeout` seconds. Keys include the
+    ledger version, which is bumped by every commit writing the ledger, so
+    entries rendered from older data are never served again and are cleared by
+    the bump.
+    """
+    def __init__(self, timeout: int):
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, timeout: Optional[int] = None):
+        raise NotImplementedError
+
+    def version(self) -> int:
+        raise NotImplementedError
+
+    def bump(self) -> int:
+        """Increments the ledger version, returning the new one"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {'backend': type(self).__name__, 'version': self.version(), 'hits': self.hits, 'misses': self.misses}
+
+
+class MemoryCache(CacheBackend):
+    """Least recently used entries of this process, up to `size` of them"""
+    def __init__(self, size: int, timeout: int):
+        super().__init__(timeout)
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self._version = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, timeout=None):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + (timeout or self.timeout), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def version(self):
+        return self._version
+
+    def bump(self):
+        with self.lock:
+            self._version += 1
+            self.entries.clear()
+            return self._version
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileSystemCache(CacheBackend):
+    """Entries stored as files of a directory, shared by the processes serving the app
+
+    Files are written to a temporary name and renamed, so readers never see
+    a partial entry. The version is kept in its own file, bumped under an
+    exclusive lock so processes committing at the same time never write the
+    same version.
+    """
+    VERSION_FILE = 'version'
+    LOCK_FILE = 'version.lock'
+
+    def __init__(self, directory: str, timeout: int):
+        super().__init__(timeout)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def write(self, path: str, content: str):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as file:
+                expires = float(file.readline())
+                value = file.read() if expires >= time.time() else None
+        except (OSError, ValueError):
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.write(self.path(key), f'{time.time() + (timeout or self.timeout)}\n{value}')
+
+    def version(self):
+        try:
+            with open(os.path.join(self.directory, self.VERSION_FILE), 'r') as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self):
+        with open(os.path.join(self.directory, self.LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            version = self.version() + 1
+            self.write(os.path.join(self.directory, self.VERSION_FILE), str(version))
+        self.clear()
+        return version
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name not in (self.VERSION_FILE, self.LOCK_FILE) and not name.startswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+def create_cache(app) -> Optional[CacheBackend]:
+    backend = app.config.get('CACHE_BACKEND')
+    if backend == 'memory':
+        return MemoryCache(app.config['CACHE_SIZE'], app.config['CACHE_TIMEOUT'])
+    if backend == 'filesystem':
+        return FileSystemCache(app.config['CACHE_DIR'], app.config['CACHE_TIMEOUT'])
+    return None
+
+
+def cached_page(view):
+    """Serves the rendered page from the cache until the ledger changes
+
+    Only pages without query arguments are cached, like the first page of a
+    feed, and never while flashed messages are waiting to be shown. The CSRF
+    token of the request is swapped in and out of the cached body. Pages read
+    from a lagging replica only live for REPLICA_CACHE_TIMEOUT seconds.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = current_app.cache
+        if cache is None or request.args or session.get('_flashes'):
+            return view(*args, **kwargs)
+        key = f'page:{cache.version()}:{request.path}'
+        body = cache.get(key)
+        if body is not None:
+            if CSRF_PLACEHOLDER in body:
+                body = body.replace(CSRF_PLACEHOLDER, generate_csrf())
+            response = make_response(body)
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and response.mimetype == 'text/html':
+            body = response.get_data(as_text=True)
+            token = g.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'))
+            timeout = current_app.config['REPLICA_CACHE_TIMEOUT'] if g.get('read_from_replica') else None
+            cache.set(key, body.replace(token, CSRF_PLACEHOLDER) if token else body, timeout)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    return wrapper
@@ -0,0 +1,249 @@
+import csv
+import re
+from collections import Counter
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.models import TransactionType
+from app.money import to_decimal
+
+# Transaction fields rules match text against
+FIELDS = ('description', 'where')
+
+
+class RuleError(ValueError):
+    pass
+
+
+class Rule:
+    """Assigns a category to the expenses matching all of its conditions
+
+    Keywords match anywhere in the text, patterns are regular expressions
+    searched in it, both ignoring case, in `field` or in either field if unset.
+    Amounts are the source value, within [min_amount, max_amount].
+    """
+    def __init__(self, category: str, keyword: str = None, pattern: str = None, field: str = None,
+                 min_amount: Decimal = None, max_amount: Decimal = None, source: str = None):
+        if keyword and pattern:
+            raise RuleError('a rule matches either a keyword or a pattern')
+        if field and field not in FIELDS:
+            raise RuleError(f"unknown field {field}, expected one of {', '.join(FIELDS)}")
+        self.category = category
+        self.keyword = keyword.lower() if keyword else None
+        try:
+            self.regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+        except re.error as e:
+            raise RuleError(f'invalid pattern {pattern}: {e}')
+        self.fields = (field,) if field else FIELDS
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.source = source
+
+    def __repr__(self):
+        condition = self.keyword or (self.regex.pattern if self.regex else '*')
+        return f'<Rule {condition} -> {self.category}>'
+
+    def accepts(self, values: Dict) -> bool:
+        """Whether the amount and source account of parsed transaction values meet the rule"""
+        amount = values['value_src']
+        return (self.min_amount is None or amount >= self.min_amount) and \
+            (self.max_amount is None or amount <= self.max_amount) and \
+            (self.source is None or values['src'] == self.source)
+
+    def matches(self, values: Dict) -> bool:
+        """Tests every condition of the rule on its own, as the categorizer does in a single pass for all rules"""
+        if self.keyword:
+            found = any(self.keyword in values[field].lower() for field in self.fields)
+        elif self.regex:
+            found = any(self.regex.search(values[field]) for field in self.fields)
+        else:
+            found = True
+        return found and self.accepts(values)
+
+
+def read_rules(csv_file: str) -> List[Rule]:
+    """Rules of a `;` delimited Category;Keyword;Pattern;Field;Min amount;Max amount;Source file, in order"""
+    rules = []
+    with open(csv_file, 'r', encoding="utf-8-sig") as file:
+        # The header is line 1
+        for line, row in enumerate(csv.DictReader(file, delimiter=';'), 2):
+            try:
+                if not row.get('Category'):
+                    raise RuleError('missing category')
+                rules.append(Rule(row['Category'], row.get('Keyword') or None, row.get('Pattern') or None,
+                                  row.get('Field') or None,
+                                  to_decimal(row['Min amount']) if row.get('Min amount') else None,
+                                  to_decimal(row['Max amount']) if row.get('Max amount') else None,
+                                  row.get('Source') or None))
+            except (RuleError, ArithmeticError) as e:
+                raise RuleError(f'{csv_file}, line {line}: {e}')
+    return rules
+
+
+def trie_pattern(words: Iterable[str]) -> str:
+    """Regular expression matching the longest of the words at a position, factored as a trie
+
+    Words sharing a prefix share its branch, so the regular expression engine
+    reads each character once per position instead of trying every word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        # The end of a word
+        node[''] = {}
+
+    def pattern(node: Dict) -> str:
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        alternation = '(?:' + '|'.join(branches) + ')'
+        return alternation + '?' if '' in node else alternation
+    return pattern(trie)
+
+
+class Matcher:
+    """The keywords and patterns of the rules matching one field, compiled into two regular expressions
+
+    Lookaheads report a match at every position, overlapping ones included: the
+    longest keyword, which the table of keyword rules maps to the rules of its
+    prefixes as well, and the first pattern in rule order.
+    """
+    def __init__(self, rules: List[Tuple[int, Rule]]):
+        keywords = {}
+        patterns = []
+        for i, rule in rules:
+            if rule.keyword:
+                keywords.setdefault(rule.keyword, []).append(i)
+            elif rule.regex:
+                patterns.append((i, rule))
+        # Rules of a keyword and of the keywords it starts with
+        self.keyword_rules = {keyword: {i for n in range(1, len(keyword) + 1) for i in keywords.get(keyword[:n], ())}
+                              for keyword in keywords}
+        self.keywords = re.compile(f'(?=({trie_pattern(keywords)}))') if keywords else None
+        self.patterns = None
+        if patterns:
+            alternation = '|'.join(f'(?P<r{i}>{rule.regex.pattern})' for i, rule in patterns)
+            try:
+                self.patterns = re.compile(f'(?={alternation})', re.IGNORECASE)
+            except re.error as e:
+                raise RuleError(f'patterns cannot be combined, they may hold flags or backreferences: {e}')
+
+    def scan(self, text: str) -> Tuple[Set[int], Set[int]]:
+        """Indexes of the rules whose keywords, and whose patterns, are found in the text"""
+        keyword_hits, pattern_hits = set(), set()
+        if self.keywords and text:
+            for match in self.keywords.finditer(text.lower()):
+                keyword_hits |= self.keyword_rules[match.group(1)]
+        if self.patterns and text:
+            for match in self.patterns.finditer(text):
+                pattern_hits.add(int(match.lastgroup[1:]))
+        return keyword_hits, pattern_hits
+
+
+class CategorizationReport:
+    """Counts of the categories assigned to the expenses of an import"""
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.rows = 0
+        self.expenses = 0
+        self.changed = 0
+        self.by_rule = Counter()
+        self.by_category = Counter()
+        # Descriptions of the expenses no rule matched
+        self.unmatched = Counter()
+
+    @property
+    def matched(self) -> int:
+        return sum(self.by_rule.values())
+
+    def add(self, values: Dict, index: Optional[int]):
+        self.rows += 1
+        if values['type'] != TransactionType.expense:
+            return
+        self.expenses += 1
+        if index is None:
+            self.unmatched[values['description']] += 1
+            return
+        rule = self.rules[index]
+        self.by_rule[index] += 1
+        self.by_category[rule.category] += 1
+        if rule.category != values['dest']:
+            self.changed += 1
+
+    def lines(self, unmatched: int = 10) -> Iterator[str]:
+        yield f'{self.matched} of {self.expenses} expenses matched a rule, ' \
+              f'{self.changed} of them with a category other than the export\'s'
+        for category, count in self.by_category.most_common():
+            yield f'  {category:<30} {count:10}'
+        yield 'Rules:'
+        for i, rule in enumerate(self.rules):
+            yield f'  {i + 1:4} {rule!r:<50} {self.by_rule[i]:10}'
+        if self.unmatched:
+            yield 'Most frequent unmatched descriptions:'
+            for description, count in self.unmatched.most_common(unmatched):
+                yield f'  {description:<50} {count:10}'
+
+
+class Categorizer:
+    """Assigns expenses the category of the first of an ordered list of rules they match
+
+    All keywords and patterns matching a field are compiled into a single
+    matcher, so each row is read once whatever the number of rules, and only
+    the rules found in its text, along with the rules without text conditions,
+    have their amount and source checked. A pattern hides the patterns after it
+    matching at the same position, which are only tried on their own when the
+    rules found all fail their amount or source.
+    """
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.matchers = {field: Matcher([(i, rule) for i, rule in enumerate(rules) if field in rule.fields])
+                         for field in FIELDS}
+        self.unconditional = {i for i, rule in enumerate(rules) if not rule.keyword and not rule.regex}
+        self.pattern_rules = [i for i, rule in enumerate(rules) if rule.regex]
+        self.report = CategorizationReport(rules)
+
+    @classmethod
+    def from_csv(cls, csv_file: str) -> "Categorizer":
+        return cls(read_rules(csv_file))
+
+    def classify(self, values: Dict) -> Optional[int]:
+        """Index of the first rule matching parsed transaction values, None if none does"""
+        candidates = set(self.unconditional)
+        patterns_found = set()
+        for field, matcher in self.matchers.items():
+            keyword_hits, pattern_hits = matcher.scan(values[field])
+            candidates |= keyword_hits | pattern_hits
+            patterns_found |= pattern_hits
+        best = None
+        rejected_pattern = False
+        for i in sorted(candidates):
+            if self.rules[i].accepts(values):
+                best = i
+                break
+            rejected_pattern = rejected_pattern or i in patterns_found
+        if rejected_pattern:
+            for i in self.pattern_rules:
+                if best is not None and i > best:
+                    break
+                if i not in patterns_found and self.rules[i].matches(values):
+                    return i
+        return best
+
+    def apply(self, values: Dict) -> Dict:
+        """Parsed values of a transaction, an expense getting the `category` of the rule it matches
+
+        The destination of the export is kept, as it identifies the transaction
+        whichever rules categorized it.
+        """
+        if values['type'] != TransactionType.expense:
+            self.report.add(values, None)
+            return values
+        index = self.classify(values)
+        self.report.add(values, index)
+        if index is None:
+            return values
+        return dict(values, category=self.rules[index].category)
@@ -0,0 +1,140 @@
+from decimal import Decimal
+
+import click
+from flask import current_app
+
+from app import db
+from app.categorizer import Categorizer, RuleError
+from app.columns import ColumnStore
+from app.currency import load_rates_csv
+from app.exporter import FORMATS, ExportError, export
+from app.importer import categorize_files
+from app.ledger import reconcile
+from app.models import Account, AccountSummary, BalanceSnapshot, Transaction, TransactionType
+
+
+def register(app):
+    @app.cli.group()
+    def ledger():
+        """Ledger maintenance commands."""
+        pass
+
+    @ledger.command('rebuild-summaries')
+    def rebuild_summaries():
+        """Recompute the per-day and per-month account summaries."""
+        count = AccountSummary.rebuild()
+        click.echo(f'Rebuilt {count} account summaries')
+
+    @ledger.command('snapshot')
+    @click.option('--interval', type=int, help='Postings between snapshots, BALANCE_SNAPSHOT_INTERVAL by default.')
+    @click.option('--rebuild', is_flag=True, help='Take every snapshot again over the whole journal.')
+    def snapshot(interval, rebuild):
+        """Snapshot account balances every interval postings journaled since the latest snapshots."""
+        count = BalanceSnapshot.take(interval or current_app.config['BALANCE_SNAPSHOT_INTERVAL'], rebuild=rebuild)
+        click.echo(f'Took {count} balance snapshots')
+
+    @ledger.command('recompute')
+    @click.option('--repair', is_flag=True, help='Correct the drifting balances in place.')
+    @click.option('--tolerance', type=Decimal, default='0', show_default=True, help='Largest drift ignored.')
+    @click.pass_context
+    def recompute(ctx, repair, tolerance):
+        """Recompute every account balance from the transactions and report drift."""
+        drifts = reconcile(repair=repair, tolerance=tolerance)
+        for drift in drifts:
+            click.echo(f'{drift.account.name}: stored {drift.stored:.2f}, computed {drift.computed:.2f} '
+                       f'{drift.account.currency} ({drift.delta:+.2f})')
+        if not drifts:
+            click.echo('All balances match their transactions')
+        elif repair:
+            click.echo(f'Repaired {len(drifts)} account balances')
+        else:
+            click.echo(f'{len(drifts)} account balances drifted, run with --repair to correct them')
+            ctx.exit(1)
+
+    @ledger.command('export')
+    @click.argument('output', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--format', type=click.Choice(FORMATS), default='csv', show_default=True)
+    @click.option('--account', help='Only transactions from or to the accounts of this name.')
+    @click.option('--type', 'transaction_type', type=click.Choice([t.name for t in TransactionType]))
+    @click.option('--since', type=click.DateTime(), help='Only transactions from this time on.')
+    @click.option('--until', type=click.DateTime(), help='Only transactions before this time.')
+    def export_transactions(output, format, account, transaction_type, since, until):
+        """Exports transactions oldest first, as a file import.py reads or as Parquet or Arrow."""
+        criteria = []
+        if account:
+            accounts = Account.query.filter_by(name=account).all()
+            if not accounts:
+                raise click.BadParameter(f'no account named {account}', param_hint='--account')
+            criteria.append(db.or_(*(side for a in accounts for side in a.sides())))
+        if transaction_type:
+            criteria.append(Transaction.type == TransactionType[transaction_type])
+        if since:
+            criteria.append(Transaction.datetime >= since)
+        if until:
+            criteria.append(Transaction.datetime < until)
+        try:
+            count = export(output, criteria, format, current_app.config['EXPORT_CHUNK_SIZE'])
+        except ExportError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'Exported {count} transactions to {output}')
+
+    @ledger.command('column-memory')
+    def column_memory():
+        """Report the memory the column store takes, per column and per million transactions."""
+        memory = (current_app.columns or ColumnStore()).memory()
+        for name, size in memory['columns'].items():
+            click.echo(f'{name:<16} {size / 2 ** 20:10.2f} MiB')
+        click.echo(f"{memory['rows']} transactions in {memory['bytes'] / 2 ** 20:.2f} MiB, "
+                   f"{memory['bytes_per_million_rows'] / 2 ** 20:.1f} MiB per million transactions")
+
+    @ledger.command('categorize')
+    @click.argument('rules', type=click.Path(exists=True, dir_okay=False))
+    @click.argument('csv_files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+    @click.option('--unmatched', type=int, default=10, show_default=True,
+                  help='Most frequent unmatched descriptions listed.')
+    def categorize(rules, csv_files, unmatched):
+        """Report the categories a rules file assigns to the expenses of exports, without importing them."""
+        try:
+            categorizer = Categorizer.from_csv(rules)
+        except RuleError as e:
+            raise click.ClickException(str(e))
+        for line in categorize_files(list(csv_files), categorizer).lines(unmatched):
+            click.echo(line)
+
+    @ledger.command('load-rates')
+    @click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+    def load_rates(csv_file):
+        """Load exchange rates from a ';' delimited Date;Currency;Rate file."""
+        count = load_rates_csv(csv_file)
+        click.echo(f'Loaded {count} exchange rates')
+
+    @app.cli.group()
+    def tasks():
+        """Background task commands."""
+        pass
+
+    @tasks.command('worker')
+    @click.option('--threads', type=int, help='Worker threads, TASK_WORKERS by default.')
+    def worker(threads):
+        """Run queued tasks until interrupted."""
+        queue = current_app.tasks
+        queue.workers = threads or queue.workers or 1
+        queue.start()
+        click.echo(f'Running tasks with {len(queue.threads)} workers, press Ctrl+C to stop')
+        try:
+            while any(thread.is_alive() for thread in queue.threads):
+                queue.stopping.wait(1)
+        except KeyboardInterrupt:
+            queue.stop()
+
+    @tasks.command('run')
+    def run_tasks():
+        """Run the due tasks in this process and exit."""
+        count = current_app.tasks.run_pending()
+        click.echo(f'Ran {count} tasks')
+
+    @tasks.command('reindex')
+    def reindex():
+        """Queue a rebuild of the transaction search index."""
+        task = current_app.tasks.submit('reindex', index=Transaction.__tablename__)
+        click.echo(f'Queued reindex as task {task.id}')
@@ -0,0 +1,151 @@
+import threading
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+
+from app import db
+from app.models import Transaction
+from app.money import to_cents
+from app.reports import COLUMNS, Columns, read_columns, to_datetime64
+
+# Staged row of a transaction, (datetime, type, src_account_id, dest_account_id,
+# value_src, value_dest, currency_src, currency_dest) keyed by its id
+Row = Tuple
+
+
+class ColumnStore:
+    """Process-wide copy of the transaction table as NumPy columns, sorted by datetime then id
+
+    Loaded once on first use, then kept current with the transactions committed
+    by the sessions of this process, staged by the commit hooks of app.models
+    and merged by the next query. Before each query the largest id of the
+    table, read from its primary key index, catches up with bulk inserts like
+    the importer's. Updates and deletes of other processes show in the ledger
+    version of a filesystem page cache, which the commits of this process
+    advance, and reload the columns; without a shared cache they are not seen.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.columns = None
+        self.staged = {}
+        self.removed = set()
+        # Ledger version of the page cache the columns reflect, None without a cache
+        self.version = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.columns is not None
+
+    @staticmethod
+    def row(transaction: Transaction) -> Row:
+        return (transaction.datetime, transaction.type.value,
+                -1 if transaction.src_account_id is None else transaction.src_account_id,
+                transaction.dest_account_id, to_cents(transaction.value_src), to_cents(transaction.value_dest),
+                transaction.currency_src, transaction.currency_dest)
+
+    def stage(self, rows: Dict[int, Row], removed: Iterable[int]):
+        """Records committed transactions, rows written and ids removed, for the next query to merge"""
+        with self.lock:
+            if self.columns is None:
+                return
+            for id in removed:
+                self.staged.pop(id, None)
+                self.removed.add(id)
+            self.staged.update(rows)
+
+    def advance(self, version: int):
+        """Follows the ledger version bumped by a commit of this process, unless another one bumped it before"""
+        with self.lock:
+            if self.version is not None and self.version + 1 == version:
+                self.version = version
+
+    def load(self):
+        # Read before the rows, so a commit meanwhile reloads them again rather than going unseen
+        version = ledger_version()
+        columns = read_columns()
+        with self.lock:
+            self.version = version
+            # Changes staged meanwhile are merged again, dropping and adding the same rows
+            self.columns = columns.take(np.lexsort((columns.id, columns.datetime)))
+
+    def between(self, start: date = None, end: date = None) -> Columns:
+        """Columns of the transactions in [start, end], views into the store rather than copies"""
+        columns = self.current()
+        low = np.searchsorted(columns.datetime, np.datetime64(start, 'us')) if start else 0
+        high = np.searchsorted(columns.datetime, np.datetime64(end + timedelta(days=1), 'us')) if end \
+            else len(columns)
+        return columns.take(slice(low, high))
+
+    def current(self) -> Columns:
+        """The columns with the staged changes merged, caught up with the rows written outside of sessions"""
+        if self.columns is None or ledger_version() != self.version:
+            self.load()
+        self.merge()
+        last_id = db.session.query(db.func.max(Transaction.id)).scalar()
+        columns = self.columns
+        known = int(columns.id.max()) if len(columns) else 0
+        if last_id is not None and last_id > known:
+            self.append(read_columns(after_id=known))
+        return self.columns
+
+    def merge(self):
+        with self.lock:
+            if not self.staged and not self.removed:
+                return
+            staged, removed = self.staged, self.removed
+            self.staged, self.removed = {}, set()
+            columns = self.columns
+            dropped = np.fromiter(removed | staged.keys(), dtype=np.int64)
+            self.columns = columns.take(~np.isin(columns.id, dropped))
+        if staged:
+            ids = np.fromiter(staged, dtype=np.int64, count=len(staged))
+            when, type, src, dest, value_src, value_dest, currency_src, currency_dest = zip(*staged.values())
+            currencies, codes = np.unique(np.array(currency_src + currency_dest, dtype='U5'), return_inverse=True)
+            self.append(Columns(
+                ids, to_datetime64(when), np.array(type, dtype=np.int8), np.array(src, dtype=np.int64),
+                np.array(dest, dtype=np.int64), np.array(value_src, dtype=np.int64),
+                np.array(value_dest, dtype=np.int64), codes[:len(ids)].astype(np.int16),
+                codes[len(ids):].astype(np.int16), currencies))
+
+    def append(self, new: Columns):
+        """Adds rows to the columns, merging the currency dictionaries and sorting only if rows are backdated"""
+        with self.lock:
+            columns = self.columns
+            currencies = np.union1d(columns.currencies, new.currencies).astype('U5')
+            remap = np.searchsorted(currencies, columns.currencies).astype(np.int16)
+            remap_new = np.searchsorted(currencies, new.currencies).astype(np.int16)
+            new = new.take(np.lexsort((new.id, new.datetime)))
+            arrays = {}
+            for name in COLUMNS:
+                old, added = getattr(columns, name), getattr(new, name)
+                if name.startswith('currency_'):
+                    old, added = remap[old], remap_new[added]
+                arrays[name] = np.concatenate([old, added])
+            merged = Columns(*(arrays[name] for name in COLUMNS), currencies)
+            if len(columns) and len(new) and \
+                    (new.datetime[0], new.id[0]) < (columns.datetime[-1], columns.id[-1]):
+                merged = merged.take(np.lexsort((merged.id, merged.datetime)))
+            self.columns = merged
+
+    def memory(self) -> Dict:
+        """Bytes used by each column, in total and extrapolated to a million transactions
+
+        The currency dictionary does not grow with the transactions, so it is
+        left out of the extrapolation.
+        """
+        columns = self.current()
+        sizes = {name: getattr(columns, name).nbytes for name in COLUMNS}
+        per_row = sum(getattr(columns, name).itemsize for name in COLUMNS)
+        sizes['currencies'] = columns.currencies.nbytes
+        return {'rows': len(columns), 'columns': sizes, 'bytes': sum(sizes.values()),
+                'bytes_per_million_rows': per_row * 10 ** 6}
+
+
+def ledger_version() -> Optional[int]:
+    return current_app.cache.version() if current_app.cache else None
+
+
+def create_column_store(app) -> Optional[ColumnStore]:
+    return ColumnStore() if app.config.get('COLUMN_STORE') else None
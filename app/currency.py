@@ -0,0 +1,155 @@
+import csv
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, Tuple, Union
+
+import numpy as np
+from flask import current_app
+
+from app import db
+from app.models import Account, ExchangeRate, mark_ledger_changed
+from app.money import Amount, to_decimal, to_cents, from_cents
+
+
+class MissingRateError(LookupError):
+    pass
+
+
+class RateTable:
+    """Historical exchange rates indexed by currency and date
+
+    Each currency holds sorted arrays of dates and rates against the base
+    currency. The rate on a date is the latest one published on or before it.
+    Scalar conversion rates are memoized in an LRU cache.
+    """
+    def __init__(self, base: str, rates: Dict[str, Tuple[np.ndarray, np.ndarray]], cache_size: int = 4096):
+        self.base = base
+        self.rates = rates
+        self._rate = lru_cache(maxsize=cache_size)(self._cross_rate)
+
+    @classmethod
+    def load(cls, base: str, cache_size: int = 4096) -> "RateTable":
+        rows = db.session.query(ExchangeRate.currency, ExchangeRate.date, ExchangeRate.rate) \
+            .order_by(ExchangeRate.currency, ExchangeRate.date).all()
+        rates = {}
+        if rows:
+            currencies, days, values = zip(*rows)
+            currencies = np.array(currencies)
+            days = np.array(days, dtype='datetime64[D]')
+            values = np.array(values, dtype=np.float64)
+            for currency in np.unique(currencies):
+                mask = currencies == currency
+                rates[str(currency)] = (days[mask], values[mask])
+        return cls(base, rates, cache_size)
+
+    def per_base(self, currency: str, days: np.ndarray) -> np.ndarray:
+        """Rates of a currency against the base currency on each day"""
+        days = np.asarray(days).astype('datetime64[D]')
+        if currency == self.base:
+            return np.ones(days.shape)
+        if currency not in self.rates:
+            raise MissingRateError(f"No exchange rates for {currency}")
+        known, rates = self.rates[currency]
+        index = np.searchsorted(known, days, side='right') - 1
+        if (index < 0).any():
+            raise MissingRateError(f"No {currency} rate on or before {days[index < 0].min()}")
+        return rates[index]
+
+    def _cross_rate(self, src: str, dest: str, day: date) -> float:
+        day = np.array([day], dtype='datetime64[D]')
+        return float(self.per_base(dest, day)[0] / self.per_base(src, day)[0])
+
+    def rate(self, src: str, dest: str, day: Union[date, datetime]) -> float:
+        """Units of dest worth one unit of src on a day"""
+        if src == dest:
+            return 1.0
+        if isinstance(day, datetime):
+            day = day.date()
+        return self._rate(src, dest, day)
+
+    def convert(self, amount: Amount, src: str, dest: str, day: Union[date, datetime]) -> Decimal:
+        """Converts an amount, rounded to cents"""
+        return to_decimal(float(amount) * self.rate(src, dest, day))
+
+    def convert_array(self, amounts: np.ndarray, currencies: np.ndarray, days: np.ndarray, dest: str) -> np.ndarray:
+        """Converts amounts in many currencies on many days to one currency
+
+        Rates are looked up with one binary search per currency present.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        currencies = np.asarray(currencies)
+        days = np.asarray(days).astype('datetime64[D]')
+        converted = np.empty(amounts.shape)
+        for currency in np.unique(currencies):
+            mask = currencies == currency
+            if currency == dest:
+                converted[mask] = amounts[mask]
+            else:
+                converted[mask] = amounts[mask] / self.per_base(str(currency), days[mask]) \
+                    * self.per_base(dest, days[mask])
+        return converted
+
+    def convert_cents(self, cents: np.ndarray, currencies: np.ndarray, days: np.ndarray, dest: str) -> np.ndarray:
+        """Converts integer amounts of cents like `convert_array`, rounding each amount to cents"""
+        return np.rint(self.convert_array(cents, currencies, days, dest)).astype(np.int64)
+
+
+def rates_version() -> Tuple:
+    """Count, latest date and sum of the stored rates, changed by loads of any process"""
+    return tuple(db.session.query(db.func.count(), db.func.max(ExchangeRate.date),
+                                  db.func.sum(ExchangeRate.rate)).one())
+
+
+def rate_table() -> RateTable:
+    """Rate table of the application, loaded from the database on first use
+
+    Rates are loaded by `flask ledger load-rates` in its own process, so the
+    table is loaded again whenever the stored rates no longer match it.
+    """
+    version = rates_version()
+    cached = current_app.extensions.get('rate_table')
+    if cached is None or cached[0] != version:
+        cached = current_app.extensions['rate_table'] = (
+            version, RateTable.load(current_app.config['BASE_CURRENCY'],
+                                    current_app.config['EXCHANGE_RATE_CACHE_SIZE']))
+    return cached[1]
+
+
+def load_rates_csv(csv_file: str) -> int:
+    """Stores the rates of a `;` delimited file with Date (YYYY-MM-DD), Currency and Rate columns
+
+    Rates already stored for the same date and currency are replaced.
+    Returns the number of rates loaded.
+    """
+    with open(csv_file, 'r', encoding="utf-8-sig") as file:
+        rates = {(datetime.strptime(line['Date'], '%Y-%m-%d').date(), line['Currency']): float(line['Rate'])
+                 for line in csv.DictReader(file, delimiter=';')}
+    table = ExchangeRate.__table__
+    for currency in {currency for _, currency in rates}:
+        days = [day for day, c in rates if c == currency]
+        db.session.execute(table.delete().where(table.c.currency == currency).where(table.c.date.in_(days)))
+    # Totals of the cached pages are converted with the rates
+    mark_ledger_changed()
+    if rates:
+        db.session.execute(table.insert(), [{'date': day, 'currency': currency, 'rate': rate}
+                                            for (day, currency), rate in rates.items()])
+    db.session.commit()
+    current_app.extensions.pop('rate_table', None)
+    return len(rates)
+
+
+def net_worth(currency: str = None, day: date = None) -> Decimal:
+    """Sum of the balances of every account (not category) in one currency
+
+    Each balance is converted and rounded to cents, then summed exactly.
+    """
+    currency = currency or current_app.config['BASE_CURRENCY']
+    day = day or date.today()
+    balances = db.session.query(Account.balance, Account.currency).filter_by(is_category=False).all()
+    if not balances:
+        return Decimal('0.00')
+    amounts, currencies = zip(*balances)
+    cents = np.array([to_cents(a) for a in amounts], dtype=np.int64)
+    days = np.full(len(amounts), np.datetime64(day, 'D'))
+    return from_cents(rate_table().convert_cents(cents, currencies, days, currency).sum())
@@ -0,0 +1,145 @@
+import threading
+import time
+from functools import wraps
+from typing import Dict
+
+from flask import g, has_request_context, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+# Key of the read replica in SQLALCHEMY_BINDS
+REPLICA = 'replica'
+# Session key holding the time until which the reads of a client go to the primary
+PRIMARY_UNTIL = '_primary_until'
+
+
+class PoolStats:
+    """Counts of the connections opened, checked out and invalidated by the pool of an engine"""
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidated = 0
+        for name in ('connect', 'checkout', 'invalidate'):
+            event.listen(engine, name, getattr(self, f'on_{name}'))
+
+    def count(self, name: str):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        self.count('connects')
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.count('checkouts')
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.count('invalidated')
+
+    def to_dict(self) -> Dict:
+        pool = self.engine.pool
+        stats = {'pool': type(pool).__name__, 'connects': self.connects, 'checkouts': self.checkouts,
+                 'invalidated': self.invalidated}
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                         overflow=max(pool.overflow(), 0))
+        return stats
+
+
+def set_sqlite_pragmas(pragmas: Dict):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+    return on_connect
+
+
+class RoutingSession(SignallingSession):
+    """Session reading from the replica in `read_replica` views, and writing to the primary
+
+    Flushes and INSERT, UPDATE or DELETE statements always go to the primary,
+    as do the reads of a client for `REPLICA_STICKY_SECONDS` after it wrote, so
+    it sees its own changes despite replication lag.
+    """
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase) or not reads_from_replica(self.app):
+            return super().get_bind(mapper, clause)
+        g.read_from_replica = True
+        return get_state(self.app).db.get_engine(self.app, bind=REPLICA)
+
+
+def reads_from_replica(app) -> bool:
+    return has_request_context() and g.get('read_replica', False) \
+        and REPLICA in (app.config['SQLALCHEMY_BINDS'] or {}) \
+        and session.get(PRIMARY_UNTIL, 0) < time.time()
+
+
+def read_replica(view):
+    """Runs the queries of a read-only view on the replica bind, if one is configured"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.read_replica = False
+    return wrapper
+
+
+def stick_to_primary(db_session):
+    """Sends the reads of the client that committed to the primary for a while"""
+    app = db_session.app
+    if has_request_context() and REPLICA in (app.config['SQLALCHEMY_BINDS'] or {}):
+        session[PRIMARY_UNTIL] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+
+
+class Database(SQLAlchemy):
+    """Flask-SQLAlchemy with pooled connections, SQLite pragmas and a read replica
+
+    Server databases and SQLite files get a connection pool sized by the
+    DATABASE_POOL_* settings, SQLite files instead of a new connection per
+    checkout, each running SQLITE_PRAGMAS once when opened.
+    """
+    def create_session(self, options):
+        factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+        event.listen(factory, 'after_commit', stick_to_primary)
+        return factory
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        config = app.config
+        sqlite = sa_url.drivername.startswith('sqlite')
+        if sqlite and sa_url.database in (None, '', ':memory:'):
+            return super().apply_driver_hacks(app, sa_url, options)
+        if sqlite:
+            options.setdefault('poolclass', QueuePool)
+            # Read back by create_engine, which has no access to the app
+            options['_pragmas'] = config['SQLITE_PRAGMAS']
+        else:
+            options.setdefault('pool_recycle', config['DATABASE_POOL_RECYCLE'])
+            options.setdefault('pool_pre_ping', config['DATABASE_POOL_PRE_PING'])
+        options.setdefault('pool_size', config['DATABASE_POOL_SIZE'])
+        options.setdefault('max_overflow', config['DATABASE_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', config['DATABASE_POOL_TIMEOUT'])
+        return super().apply_driver_hacks(app, sa_url, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('_pragmas', None)
+        if pragmas is not None:
+            # SQLite connections are handed from thread to thread by the pool, never shared,
+            # set here as SQLALCHEMY_ENGINE_OPTIONS replace the connect_args of apply_driver_hacks
+            engine_opts['connect_args'] = dict(engine_opts.get('connect_args', {}), check_same_thread=False)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas:
+            event.listen(engine, 'connect', set_sqlite_pragmas(pragmas))
+        engine.pool_stats = PoolStats(engine)
+        return engine
+
+    def pool_stats(self, app=None) -> Dict:
+        """Pool counters of the primary and replica engines"""
+        app = self.get_app(app)
+        binds = [None] + [bind for bind in (app.config['SQLALCHEMY_BINDS'] or {}) if bind == REPLICA]
+        return {bind or 'primary': self.get_engine(app, bind).pool_stats.to_dict() for bind in binds}
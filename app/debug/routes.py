@@ -0,0 +1,20 @@
+from flask import render_template, jsonify, current_app
+
+from app import db
+from app.debug import bp
+
+
+def profile():
+    cache = current_app.cache
+    return dict(current_app.extensions['profiler'].to_dict(), cache=cache.stats() if cache else None,
+                pools=db.pool_stats())
+
+
+@bp.route('/debug/perf')
+def perf():
+    return render_template('debug/perf.html', title='Performance', profile=profile())
+
+
+@bp.route('/debug/perf.json')
+def perf_json():
+    return jsonify(profile())
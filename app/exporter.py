@@ -0,0 +1,160 @@
+import csv
+import io
+import itertools
+from typing import BinaryIO, Iterable, Iterator, List, Union
+
+from app import db
+from app.models import Transaction, TransactionType, Account
+
+# Columns of the `;` delimited export read by import.py
+HEADER = ['Type', 'Time', 'Source', 'Destination', 'Currency', 'Amount', 'Comment',
+          'Source category currency', 'Source value', 'Destination category currency', 'Destination value']
+TYPE_LABELS = {TransactionType.expense: 'Expenses', TransactionType.income: 'Income',
+               TransactionType.transfer: 'Transfer'}
+FORMATS = ('csv', 'arrow', 'parquet')
+
+
+class ExportError(RuntimeError):
+    pass
+
+
+def fetch(criteria: List = (), chunk_size: int = 1000) -> Iterator[List]:
+    """Yields chunks of transactions matching the criteria, oldest first
+
+    Rows are (type, datetime, source name, destination name, value_src,
+    currency_src, value_dest, currency_dest, description, where) tuples,
+    fetched `chunk_size` at a time from a streaming cursor, so memory use
+    does not depend on the number of transactions.
+    """
+    names = dict(db.session.query(Account.id, Account.name))
+    query = db.session.query(
+        Transaction.type, Transaction.datetime, Transaction.src_account_id, Transaction.dest_account_id,
+        Transaction.value_src, Transaction.currency_src, Transaction.value_dest, Transaction.currency_dest,
+        Transaction.description, Transaction.where) \
+        .filter(*criteria).order_by(Transaction.datetime.asc(), Transaction.id.asc()) \
+        .execution_options(stream_results=True).yield_per(chunk_size)
+    rows = iter(query)
+    while True:
+        chunk = [(t, when, names.get(src, ''), names.get(dest, ''), *rest)
+                 for t, when, src, dest, *rest in itertools.islice(rows, chunk_size)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def to_entry(row) -> List[str]:
+    """Row of the export, with the values of both sides only when they differ like the original exports"""
+    (transaction_type, when, src, dest, value_src, currency_src, value_dest, currency_dest,
+     description, where) = row
+    comment = f'{description or ""} @ {where}' if where else description or ''
+    # Fractional seconds kept, as they are part of the hash identifying the transaction on import
+    time = when.strftime('%d/%m/%Y %H:%M:%S.%f' if when.microsecond else '%d/%m/%Y %H:%M:%S')
+    entry = [TYPE_LABELS[transaction_type], time, src, dest,
+             currency_src, str(value_src), comment]
+    if currency_src != currency_dest or value_src != value_dest:
+        return entry + [currency_src, str(value_src), currency_dest, str(value_dest)]
+    return entry + ['', '', '', '']
+
+
+def iter_csv(chunks: Iterable[List]) -> Iterator[str]:
+    """Yields the export as text, the header and then one piece per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(HEADER)
+    for chunk in chunks:
+        writer.writerows(to_entry(row) for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def arrow_schema():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ExportError('arrow and parquet exports require pyarrow')
+    amount = pa.decimal128(18, 2)
+    return pa.schema([('type', pa.string()), ('datetime', pa.timestamp('us')), ('source', pa.string()),
+                      ('destination', pa.string()), ('value_src', amount), ('currency_src', pa.string()),
+                      ('value_dest', amount), ('currency_dest', pa.string()), ('description', pa.string()),
+                      ('where', pa.string())])
+
+
+def to_batch(chunk: List, schema):
+    import pyarrow as pa
+    columns = [list(column) for column in zip(*chunk)]
+    columns[0] = [t.name for t in columns[0]]
+    return pa.RecordBatch.from_arrays([pa.array(c, f.type) for c, f in zip(columns, schema)], schema=schema)
+
+
+def write_columnar(sink: Union[str, BinaryIO], chunks: Iterable[List], format: str = 'parquet') -> int:
+    """Writes the chunks as a Parquet file or an Arrow IPC stream, one row group or batch per chunk
+
+    Returns the number of transactions written.
+    """
+    schema = arrow_schema()
+    import pyarrow as pa
+    count = 0
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        with pq.ParquetWriter(sink, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_batches([to_batch(chunk, schema)]))
+                count += len(chunk)
+    else:
+        with pa.ipc.new_stream(sink, schema) as writer:
+            for chunk in chunks:
+                writer.write_batch(to_batch(chunk, schema))
+                count += len(chunk)
+    return count
+
+
+class ChunkSink:
+    """Write-only file keeping the bytes written since the last `take`, to stream the output of a writer"""
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def iter_arrow(chunks: Iterable[List]) -> Iterator[bytes]:
+    """Yields an Arrow IPC stream as it is written, the schema and then one record batch per chunk"""
+    schema = arrow_schema()
+    import pyarrow as pa
+    sink = ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_batch(to_batch(chunk, schema))
+            yield sink.take()
+    yield sink.take()
+
+
+def export(path: str, criteria: List = (), format: str = 'csv', chunk_size: int = 1000) -> int:
+    """Writes the transactions matching the criteria to a file, returns the number written"""
+    if format not in FORMATS:
+        raise ExportError(f'unknown format {format}')
+    if format == 'csv':
+        count = 0
+
+        def counted():
+            nonlocal count
+            for chunk in fetch(criteria, chunk_size):
+                count += len(chunk)
+                yield chunk
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            for piece in iter_csv(counted()):
+                file.write(piece)
+        return count
+    return write_columnar(path, fetch(criteria, chunk_size), format)
@@ -0,0 +1,59 @@
+import colorsys
+import os
+import re
+import tempfile
+from hashlib import md5
+
+from flask import current_app
+
+# Keys are the md5 digest of the lower-cased account name, like gravatar hashes
+KEY = re.compile(r'^[0-9a-f]{32}$')
+GRID = 5
+# Names of the icons of rows without an account
+SHARED_ICONS = ('Income',)
+
+
+def icon_key(name: str) -> str:
+    return md5(name.lower().encode('utf-8')).hexdigest()
+
+
+def render_identicon(key: str, size: int = 50) -> str:
+    """Symmetric 5x5 identicon of a key, as an SVG document
+
+    Cells of the left half and the middle column are set by the bits of the
+    key and mirrored, the hue comes from its last bytes.
+    """
+    digest = bytes.fromhex(key)
+    hue = int.from_bytes(digest[-2:], 'big') / 0xffff
+    r, g, b = (round(c * 255) for c in colorsys.hls_to_rgb(hue, 0.5, 0.6))
+    bits = int.from_bytes(digest[:4], 'big')
+    cell = size / (GRID + 1)
+    offset = cell / 2
+    rects = []
+    for column in range((GRID + 1) // 2):
+        for row in range(GRID):
+            if not bits >> (column * GRID + row) & 1:
+                continue
+            for x in {column, GRID - 1 - column}:
+                rects.append(f'<rect x="{offset + x * cell:.2f}" y="{offset + row * cell:.2f}" '
+                             f'width="{cell:.2f}" height="{cell:.2f}"/>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+            f'viewBox="0 0 {size} {size}"><rect width="{size}" height="{size}" fill="#f0f0f0"/>'
+            f'<g fill="#{r:02x}{g:02x}{b:02x}">{"".join(rects)}</g></svg>')
+
+
+def icon_path(key: str) -> str:
+    return os.path.join(current_app.config['ICON_DIR'], f'{key}.svg')
+
+
+def write_icon(key: str) -> str:
+    """Renders the icon of a key into ICON_DIR unless it is there, returns its path"""
+    path = icon_path(key)
+    if not os.path.exists(path):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(render_identicon(key))
+        os.replace(tmp, path)
+    return path
@@ -0,0 +1,253 @@
+import csv
+import itertools
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from flask import current_app
+
+from app import db
+from app.categorizer import CategorizationReport, Categorizer
+from app.money import to_decimal
+from app.models import Transaction, TransactionType, Account, AccountSummary, Posting, BalanceSnapshot
+
+
+def read_csv(csv_file: str) -> Iterator[Dict]:
+    """Lazily yields the rows of a `;` delimited export"""
+    with open(csv_file, 'r', encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file, delimiter=';')
+        for line in reader:
+            yield line
+
+
+def extract_where(entry) -> Tuple[str, str]:
+    description, _, where = entry.get('Comment').partition(" @ ")
+    return description, where
+
+
+def extract_participants(entry) -> Tuple[str, List[str]]:
+    participants = []
+    description = entry.get('Comment')
+    return description, participants
+
+
+def parse_time(text: str) -> datetime:
+    """Time of an exported row, down to the microseconds exports of this ledger keep"""
+    return datetime.strptime(text, '%d/%m/%Y %H:%M:%S.%f' if '.' in text else '%d/%m/%Y %H:%M:%S')
+
+
+def parse_entry(entry: Dict) -> Dict:
+    """Converts an exported row to transaction column values and account names"""
+    transaction_type = TransactionType.from_str(entry['Type'])
+    description, where = extract_where(entry)
+    # TODO Extract participants e.g. (Person1, Person2, ...)
+    return {
+        'type': transaction_type,
+        'datetime': parse_time(entry['Time']),
+        'value_src': to_decimal(entry.get('Source value') or entry['Amount']),
+        'currency_src': entry.get('Source category currency') or entry['Currency'],
+        'value_dest': to_decimal(entry.get('Destination value') or entry['Amount']),
+        'currency_dest': entry.get('Destination category currency') or entry['Currency'],
+        'description': description,
+        'where': where,
+        'src': entry['Source'],
+        'dest': entry['Destination'],
+    }
+
+
+class AccountCache:
+    """In-memory lookup of account ids by (name, currency)
+
+    Accounts missing from the database are created on first use and flushed, so
+    their ids are available without committing.
+    """
+    def __init__(self):
+        self.ids = {(a.name, a.currency): a.id for a in Account.query}
+        self.created = []
+
+    def get(self, name: str, currency: str, is_category=False) -> int:
+        key = (name, currency)
+        if key not in self.ids:
+            account = Account(name=name, currency=currency, balance=0.0, is_category=is_category)
+            db.session.add(account)
+            db.session.flush()
+            self.ids[key] = account.id
+            self.created.append(account)
+        return self.ids[key]
+
+
+# A single expanding parameter, cheaper to compile than one parameter per hash
+STORED_HASHES = db.select([Transaction.content_hash, db.func.count()]) \
+    .where(Transaction.content_hash.in_(db.bindparam('hashes', expanding=True))) \
+    .group_by(Transaction.content_hash)
+
+
+def parse_file(csv_file: str) -> List[Dict]:
+    """Parsed rows of an export, run in the worker processes of `Importer.run_files`"""
+    return [parse_entry(entry) for entry in read_csv(csv_file)]
+
+
+def parse_ahead(pool: Executor, parse: Callable[[str], List[Dict]], csv_files: List[str],
+                ahead: int) -> Iterator[List[Dict]]:
+    """Parsed exports in order, submitting the next ones to the pool only up to `ahead` of the one yielded"""
+    files = iter(csv_files)
+    pending = deque(pool.submit(parse, csv_file) for csv_file in itertools.islice(files, ahead))
+    while pending:
+        parsed = pending.popleft().result()
+        for csv_file in itertools.islice(files, 1):
+            pending.append(pool.submit(parse, csv_file))
+        yield parsed
+
+
+class Importer:
+    """Imports transactions in chunks, with one commit per chunk
+
+    Transactions are written with a single bulk insert per chunk, and the account
+    balances and summaries with in-place increments of the touched rows, bypassing
+    the ORM. Their postings are journaled from the inserted rows.
+
+    Transactions are identified by their content hash. Identical rows within one
+    export are distinct transactions, while rows found again in another export,
+    like a transfer listed by both banks or an export imported twice, are skipped.
+
+    With a categorizer, expenses matching its rules are stored in their category
+    instead of the export's. The hash of an expense leaves its category out, so
+    exports imported again under other rules are skipped all the same.
+    """
+    def __init__(self, chunk_size: int = 1000, progress: Callable[[int, float], None] = None,
+                 categorizer: Categorizer = None):
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.categorizer = categorizer
+        self.accounts = AccountCache()
+        self.count = 0
+        self.skipped = 0
+        self.start = None
+
+    def run(self, entries: Iterable[Dict]) -> int:
+        """Imports the rows of an export, returns the number of imported transactions"""
+        return self.merge(parse_entry(entry) for entry in entries)
+
+    def run_files(self, csv_files: List[str], workers: int = None) -> int:
+        """Imports several exports, written in order while a pool of `workers` processes parses the next ones
+
+        Writes go through a single connection, so the pool only overlaps parsing
+        with writing. At most `workers` exports are parsed ahead of the one
+        written, bounding the parsed rows held in memory. With a single worker,
+        exports are streamed in this process.
+        """
+        workers = workers or current_app.config['IMPORT_WORKERS']
+        if len(csv_files) < 2 or workers < 2:
+            for csv_file in csv_files:
+                self.run(read_csv(csv_file))
+            return self.count
+        with ProcessPoolExecutor(workers) as pool:
+            for parsed in parse_ahead(pool, parse_file, csv_files, workers):
+                self.merge(parsed)
+        return self.count
+
+    def merge(self, parsed: Iterable[Dict]) -> int:
+        """Writes the parsed rows of one export, skipping those already in the ledger"""
+        self.start = self.start or time.perf_counter()
+        # Per content hash, the rows of this export seen so far and the transactions stored before it
+        occurrences = {}
+        chunk = []
+        for values in parsed:
+            if self.categorizer:
+                values = self.categorizer.apply(values)
+            chunk.append(values)
+            if len(chunk) >= self.chunk_size:
+                self.write(chunk, occurrences)
+                chunk = []
+        if chunk:
+            self.write(chunk, occurrences)
+        return self.count
+
+    def write(self, chunk: List[Dict], occurrences: Dict[str, List[int]]):
+        rows = []
+        for values in chunk:
+            values = dict(values)
+            src, dest = values.pop('src'), values.pop('dest')
+            dest = values.pop('category', None) or dest
+            is_category = values['type'] == TransactionType.expense
+            dest_id = self.accounts.get(dest, values['currency_dest'], is_category)
+            src_id = None
+            if values['type'] != TransactionType.income:
+                src_id = self.accounts.get(src, values['currency_src'], is_category)
+            row = dict(values, src_account_id=src_id, dest_account_id=dest_id)
+            row['content_hash'] = Transaction.digest(row)
+            rows.append(row)
+        rows = self.deduplicate(rows, occurrences)
+
+        deltas = defaultdict(Decimal)
+        summaries = defaultdict(lambda: [Decimal(0), Decimal(0), 0])
+        changes = []
+        for row in rows:
+            deltas[row['dest_account_id']] += row['value_dest']
+            AccountSummary.add_delta(summaries, row['dest_account_id'], row['datetime'], inflow=row['value_dest'])
+            changes.append((row['dest_account_id'], row['datetime'], row['value_dest']))
+            if row['src_account_id'] is not None:
+                deltas[row['src_account_id']] -= row['value_src']
+                AccountSummary.add_delta(summaries, row['src_account_id'], row['datetime'],
+                                         outflow=row['value_src'])
+                changes.append((row['src_account_id'], row['datetime'], -row['value_src']))
+
+        if rows:
+            db.session.execute(Transaction.__table__.insert(), rows)
+            Posting.record(Transaction.content_hash.in_(db.bindparam('hashes', expanding=True)),
+                           {'hashes': list({row['content_hash'] for row in rows})})
+        Account.apply_balance_deltas(deltas)
+        AccountSummary.apply_deltas(summaries)
+        BalanceSnapshot.shift(changes)
+        self.count += len(rows)
+        # Before the commit, so progress stored in the database is written with the chunk
+        self.report()
+        db.session.commit()
+
+    def deduplicate(self, rows: List[Dict], occurrences: Dict[str, List[int]]) -> List[Dict]:
+        """Rows to insert, the n-th row of an export with a hash only if fewer than n were stored before it"""
+        unseen = list({row['content_hash'] for row in rows} - occurrences.keys())
+        for i in range(0, len(unseen), 500):
+            batch = unseen[i:i + 500]
+            stored = dict(db.session.execute(STORED_HASHES, {'hashes': batch}).fetchall())
+            occurrences.update((h, [0, stored.get(h, 0)]) for h in batch)
+        kept = []
+        for row in rows:
+            seen = occurrences[row['content_hash']]
+            seen[0] += 1
+            if seen[0] > seen[1]:
+                kept.append(row)
+        self.skipped += len(rows) - len(kept)
+        return kept
+
+    def report(self):
+        if self.progress:
+            self.progress(self.count, self.count / max(time.perf_counter() - self.start, 1e-9))
+
+
+def import_files(csv_files: List[str], chunk_size: int = 1000, workers: int = None,
+                 progress: Callable[[int, float], None] = None, reindex: bool = True, rules: str = None) -> Importer:
+    """Imports exports, then snapshots balances and rebuilds the search index if transactions were added
+
+    Bulk inserts bypass the session commit hooks, so the index is rebuilt at once.
+    Snapshots are taken even if nothing was added, to complete an import that
+    failed after its last commit. Expenses are categorized by the rules file, if any.
+    """
+    importer = Importer(chunk_size=chunk_size, progress=progress,
+                        categorizer=Categorizer.from_csv(rules) if rules else None)
+    importer.run_files(csv_files, workers=workers)
+    BalanceSnapshot.take(current_app.config['BALANCE_SNAPSHOT_INTERVAL'])
+    if reindex and importer.count and current_app.search_backend:
+        Transaction.reindex()
+    return importer
+
+
+def categorize_files(csv_files: List[str], categorizer: Categorizer) -> CategorizationReport:
+    """Reports the categories the rules assign to the expenses of exports, without importing them"""
+    for csv_file in csv_files:
+        for entry in read_csv(csv_file):
+            categorizer.apply(parse_entry(entry))
+    return categorizer.report
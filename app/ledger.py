@@ -0,0 +1,183 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List
+
+from flask import current_app
+
+from app import db
+from app.models import Transaction, TransactionType, Account, AccountSummary, Posting, BalanceSnapshot
+from app.money import Money
+
+
+class LedgerError(RuntimeError):
+    pass
+
+
+class Ledger:
+    """Unit of work posting and removing batches of transactions with a single commit
+
+    Should be used as follows
+    ```
+    with Ledger() as ledger:
+        ledger.post(expense, src_account, dest_category)
+        ledger.post(income, dest_account=dest_account)
+        ledger.remove(transfer)
+    ```
+    Currencies are validated once per account pair, and on commit each touched
+    account balance is changed by a single atomic increment. Changes are kept
+    by account object, so accounts created in the same batch get their ids by
+    the flush of the commit. Posted transactions are journaled and removed ones
+    reversed in the journal, and touched accounts with BALANCE_SNAPSHOT_INTERVAL
+    postings since their latest snapshot get a new one. Nothing is written if
+    the block raises.
+    """
+    def __init__(self):
+        self.posted = []
+        self.removed = []
+        # Balance changes by account object
+        self.balances = defaultdict(Decimal)
+        self.validated = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def check(self, transaction: Transaction, src_account: Account, dest_account: Account):
+        """Checks the currencies of a transaction, once per accounts and currencies"""
+        key = (transaction.type, src_account, dest_account, transaction.currency_src, transaction.currency_dest)
+        if key in self.validated:
+            return
+        try:
+            if transaction.type == TransactionType.income:
+                dest_account.check_valid_currency(transaction)
+            else:
+                src_account.check_valid_currency(transaction, dest_account)
+        except RuntimeError as e:
+            raise LedgerError(str(e))
+        self.validated.add(key)
+
+    def post(self, transaction: Transaction, src_account: Account = None, dest_account: Account = None) -> Transaction:
+        """Adds a transaction between accounts, incomes have no source account"""
+        if dest_account is None:
+            raise LedgerError("No destination account provided")
+        if transaction.type != TransactionType.income and src_account is None:
+            raise LedgerError("No source account provided")
+        self.check(transaction, src_account, dest_account)
+        transaction.datetime = transaction.datetime or datetime.utcnow()
+        transaction.dest_account = dest_account
+        self.balances[dest_account] += transaction.value_dest
+        if transaction.type != TransactionType.income:
+            transaction.src_account = src_account
+            self.balances[src_account] -= transaction.value_src
+        self.posted.append(transaction)
+        return transaction
+
+    def remove(self, transaction: Transaction):
+        """Deletes a stored transaction, reverting its effect on the accounts with reversing postings"""
+        self.balances[transaction.dest_account] -= transaction.value_dest
+        if transaction.src_account_id is not None:
+            self.balances[transaction.src_account] += transaction.value_src
+        self.removed.append(transaction)
+
+    def commit(self) -> List[Transaction]:
+        """Writes the batch in one database transaction, returns the posted transactions"""
+        posted = self.posted
+        try:
+            summaries = AccountSummary.deltas(self.removed, sign=-1)
+            changes = Posting.changes(self.removed, sign=-1)
+            if self.removed:
+                Posting.record(Transaction.id.in_([t.id for t in self.removed]), reverse=True)
+            for transaction in self.removed:
+                db.session.delete(transaction)
+            db.session.add_all(posted)
+            db.session.flush()
+            if posted:
+                Posting.record(Transaction.id.in_([t.id for t in posted]))
+            changes += Posting.changes(posted)
+            for key, (inflow, outflow, count) in AccountSummary.deltas(posted).items():
+                delta = summaries[key]
+                delta[0] += inflow
+                delta[1] += outflow
+                delta[2] += count
+            deltas = defaultdict(Decimal)
+            for account, delta in self.balances.items():
+                deltas[account.id] += delta
+            Account.apply_balance_deltas(deltas)
+            AccountSummary.apply_deltas(summaries)
+            BalanceSnapshot.shift(changes)
+            BalanceSnapshot.take_due({account_id for account_id, _, _ in changes},
+                                     current_app.config['BALANCE_SNAPSHOT_INTERVAL'])
+            db.session.commit()
+        except Exception:
+            self.rollback()
+            raise
+        self.reset()
+        return posted
+
+    def rollback(self):
+        db.session.rollback()
+        self.reset()
+
+    def reset(self):
+        self.posted, self.removed = [], []
+        self.balances.clear()
+
+
+class Drift:
+    """Difference between the stored balance of an account and the one computed from its transactions"""
+    def __init__(self, account: Account, stored: Decimal, computed: Decimal):
+        self.account = account
+        self.stored = stored
+        self.computed = computed
+
+    @property
+    def delta(self) -> Decimal:
+        return self.computed - self.stored
+
+    def __repr__(self):
+        return f'<Drift {self.account.name}: {self.stored:.2f} -> {self.computed:.2f} {self.account.currency}>'
+
+
+def computed_postings():
+    """Grouped sum of both sides of the transactions by account, as `account_id` and `amount` columns
+
+    The sum runs over the integer cents as stored, so it is exact.
+    """
+    t = Transaction.__table__.c
+    postings = db.union_all(
+        db.select([t.dest_account_id.label('account_id'), t.value_dest.label('amount')]),
+        db.select([t.src_account_id, -t.value_src]).where(t.src_account_id.isnot(None))).alias('postings')
+    return db.select([postings.c.account_id, db.func.sum(postings.c.amount, type_=Money).label('amount')]) \
+        .group_by(postings.c.account_id)
+
+
+def computed_balances() -> Dict[int, Decimal]:
+    """Balance of every account with transactions, from one grouped sum over both sides of the transactions"""
+    return dict(db.session.execute(computed_postings()).fetchall())
+
+
+def reconcile(repair: bool = False, tolerance: Decimal = Decimal(0)) -> List[Drift]:
+    """Compares every stored balance with the one computed from the transactions
+
+    Stored and computed balances are read by one statement, so a commit landing
+    in between on a READ COMMITTED database is not mistaken for drift. Returns
+    the accounts drifting by more than `tolerance`. With `repair`, their
+    balances are corrected by the drift with atomic increments, so changes
+    committed meanwhile by other writers are kept.
+    """
+    computed = computed_postings().alias('computed')
+    rows = db.session.query(Account, computed.c.amount).outerjoin(computed, computed.c.account_id == Account.id) \
+        .order_by(Account.id).populate_existing()
+    drifts = [Drift(account, account.balance or Decimal('0.00'), amount or Decimal('0.00'))
+              for account, amount in rows]
+    drifts = [d for d in drifts if abs(d.delta) > tolerance]
+    if repair and drifts:
+        Account.apply_balance_deltas({d.account.id: d.delta for d in drifts})
+        db.session.commit()
+    return drifts
@@ -1,9 +1,11 @@
 from flask_wtf import FlaskForm
-from wtforms import SelectField, DecimalField, StringField, TextAreaField, SubmitField, DateTimeField
-from wtforms.validators import DataRequired
+from wtforms import SelectField, DecimalField, StringField, TextAreaField, SubmitField, DateTimeField, DateField
+from wtforms.validators import DataRequired, Optional
 
 from flask import request
 
+from app.reports import GRANULARITIES
+
 
 class EmptyForm(FlaskForm):
     submit = SubmitField('Submit')
@@ -20,6 +22,21 @@ class SearchForm(FlaskForm):
         super(SearchForm, self).__init__(*args, **kwargs)
 
 
+class ReportForm(FlaskForm):
+    start = DateField('From', format='%Y-%m-%d', validators=[Optional()])
+    end = DateField('To', format='%Y-%m-%d', validators=[Optional()])
+    granularity = SelectField('Granularity', choices=[(g, g.capitalize()) for g in GRANULARITIES], default='month')
+    currency = StringField('Convert to', validators=[Optional()])
+    submit = SubmitField('Update')
+
+    def __init__(self, *args, **kwargs):
+        if 'formdata' not in kwargs:
+            kwargs['formdata'] = request.args
+        if 'csrf_enabled' not in kwargs:
+            kwargs['csrf_enabled'] = False
+        super(ReportForm, self).__init__(*args, **kwargs)
+
+
 # TODO: Reduce number of forms, somewhat redundant?
 
 class AddExpenseForm(FlaskForm):
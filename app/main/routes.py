@@ -1,11 +1,23 @@
+import os
 from typing import List
 
-from flask import g, render_template, request, url_for, current_app, redirect
+from datetime import date, timedelta
+
+from flask import g, render_template, request, url_for, current_app, redirect, abort, jsonify, flash, \
+    send_from_directory
+from flask_sqlalchemy import get_debug_queries
 
 from app import db
+from app.cache import cached_page
+from app.currency import net_worth, MissingRateError
+from app.database import read_replica
+from app.icons import KEY, icon_key, icon_path, write_icon
 from app.main import bp
-from app.main.forms import AddExpenseForm, AddTransferForm, AddIncomeForm, EmptyForm, SearchForm
+from app.main.forms import AddExpenseForm, AddTransferForm, AddIncomeForm, EmptyForm, SearchForm, ReportForm
+from app.ledger import Ledger
 from app.models import Account, Transaction, TransactionType
+from app.pagination import paginate_keyset
+from app.reports import REPORTS
 
 
 def get_all_accounts() -> List[Account]:
@@ -15,47 +27,107 @@ def get_all_accounts() -> List[Account]:
 def get_all_categories() -> List[Account]:
     return Account.query.filter_by(is_category=True).order_by(Account.name.asc())
 
+
+def with_accounts(query):
+    """Eager loads the accounts of each transaction in the same SELECT"""
+    return query.options(db.joinedload(Transaction.src_account), db.joinedload(Transaction.dest_account))
+
+
 @bp.before_app_request
 def before_request():
     g.search_form = SearchForm()
 
 
+@bp.after_app_request
+def after_request(response):
+    if current_app.config['SQLALCHEMY_RECORD_QUERIES']:
+        queries = get_debug_queries()
+        duration = sum(query.duration for query in queries)
+        response.headers['X-SQL-Queries'] = str(len(queries))
+        response.headers['X-SQL-Time'] = f'{duration * 1000:.3f}ms'
+        if len(queries) > current_app.config['SQL_QUERIES_WARNING_COUNT']:
+            current_app.logger.warning(f'{request.endpoint} issued {len(queries)} SQL queries '
+                                       f'in {duration * 1000:.1f}ms')
+    return response
+
+
 @bp.route('/')
 @bp.route('/index')
+@cached_page
+@read_replica
 def index():
     form = EmptyForm()
-    page = request.args.get('page', 1, type=int)
-    transactions = Transaction.query.order_by(Transaction.datetime.desc()).paginate(
-        page, current_app.config['TRANSACTIONS_PER_PAGE'], False)
-    next_url = url_for('main.index', page=transactions.next_num) \
-        if transactions.has_next else None
-    prev_url = url_for('main.index', page=transactions.prev_num) \
-        if transactions.has_prev else None
-    return render_template('index.html', title='Home', transactions=transactions.items,
+    page = paginate_keyset(with_accounts(Transaction.query), current_app.config['TRANSACTIONS_PER_PAGE'],
+                           after=request.args.get('after'), before=request.args.get('before'))
+    next_url = url_for('main.index', after=page.next_cursor) if page.next_cursor else None
+    prev_url = url_for('main.index', before=page.prev_cursor) if page.prev_cursor else None
+    return render_template('index.html', title='Home', transactions=page.items,
                            next_url=next_url, prev_url=prev_url, form=form)
 
 
 @bp.route('/accounts')
+@cached_page
+@read_replica
 def view_accounts():
     accounts = get_all_accounts()
     categories = get_all_categories()
-    return render_template('accounts.html', title='Accounts', accounts=accounts, categories=categories)
+    try:
+        total = net_worth()
+    except MissingRateError:
+        total = None
+    return render_template('accounts.html', title='Accounts', accounts=accounts, categories=categories,
+                           net_worth=total, base_currency=current_app.config['BASE_CURRENCY'])
 
 
 @bp.route('/account/<id>')
+@cached_page
+@read_replica
 def view_account(id):
-    account = Account.query.filter_by(id=id).first()
-    transactions = account.transactions_cur_month()
-    return render_template('account.html', title='Account', account=account, transactions=transactions)
+    account = Account.query.filter_by(id=id).first_or_404()
+    page = paginate_keyset(with_accounts(Transaction.query), current_app.config['TRANSACTIONS_PER_PAGE'],
+                           after=request.args.get('after'), before=request.args.get('before'),
+                           partitions=account.sides())
+    next_url = url_for('main.view_account', id=id, after=page.next_cursor) if page.next_cursor else None
+    prev_url = url_for('main.view_account', id=id, before=page.prev_cursor) if page.prev_cursor else None
+    return render_template('account.html', title='Account', account=account, transactions=page.items,
+                           next_url=next_url, prev_url=prev_url)
+
+
+@bp.route('/icon/<key>.svg')
+def icon(key):
+    """Identicon of an account, rendered to ICON_DIR when it is created and cached by browsers as it never changes
+
+    Only the icons of accounts are served, others are not found rather than
+    written, those missing from ICON_DIR being rendered once.
+    """
+    if not KEY.match(key):
+        abort(404)
+    if not os.path.exists(icon_path(key)):
+        if not Account.icon_exists(key):
+            abort(404)
+        write_icon(key)
+    response = send_from_directory(current_app.config['ICON_DIR'], f'{key}.svg', mimetype='image/svg+xml',
+                                   cache_timeout=current_app.config['ICON_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@bp.app_template_global()
+def icon_url(name: str) -> str:
+    """Url of the identicon of a name, for rows without an account"""
+    return url_for('main.icon', key=icon_key(name))
 
 
 @bp.route('/search')
+@read_replica
 def search():
     form = EmptyForm()
     if not g.search_form.validate():
         return redirect(url_for('main.index'))
     page = request.args.get('page', 1, type=int)
     transactions, total = Transaction.search(g.search_form.q.data, page, current_app.config['TRANSACTIONS_PER_PAGE'])
+    transactions = with_accounts(transactions)
     next_url = url_for('main.search', q=g.search_form.q.data, page=page + 1) \
         if total > page * current_app.config['TRANSACTIONS_PER_PAGE'] else None
     prev_url = url_for('main.search', q=g.search_form.q.data, page=page - 1) \
@@ -64,6 +136,31 @@ def search():
                            next_url=next_url, prev_url=prev_url, form=form)
 
 
+@bp.route('/reports/<name>')
+def view_report(name):
+    if name not in REPORTS:
+        abort(404)
+    form = ReportForm()
+    if not form.validate():
+        if request.args.get('format') == 'json':
+            abort(400)
+        # Invalid arguments fall back to their defaults
+        for field, errors in form.errors.items():
+            flash(f"{form[field].label.text}: {' '.join(errors)}")
+            form[field].data = form[field].default
+    end = form.end.data or date.today()
+    start = form.start.data or (end - timedelta(days=365)).replace(day=1)
+    form.start.data, form.end.data = start, end
+    try:
+        report = REPORTS[name](start, end, form.granularity.data, currency=(form.currency.data or '').upper() or None)
+    except MissingRateError as e:
+        flash(str(e))
+        report = REPORTS[name](start, end, form.granularity.data)
+    if request.args.get('format') == 'json':
+        return jsonify(report.to_dict())
+    return render_template('report.html', title=report.title, report=report, form=form)
+
+
 @bp.route('/add/expense', methods=['GET', 'POST'])
 def add_expense():
     form = AddExpenseForm()
@@ -77,12 +174,12 @@ def add_expense():
         category = Account.query.filter_by(name=form.dest_account.data).first()
         transaction = Transaction(
             type=TransactionType.expense, datetime=form.datetime.data,
-            value_src=float(form.value_src.data), currency_src=account.currency,
-            value_dest=float(form.value_dest.data), currency_dest=category.currency,
+            value_src=form.value_src.data, currency_src=account.currency,
+            value_dest=form.value_dest.data, currency_dest=category.currency,
             description=form.description.data, where=form.where.data
         )
-        account.add_transaction(transaction=transaction, dest_account=category)
-        db.session.commit()
+        with Ledger() as ledger:
+            ledger.post(transaction, account, category)
         return redirect(url_for('main.index'))
 
     form.src_account.data = accounts[0].name
@@ -102,12 +199,12 @@ def add_transfer():
         dest_account = Account.query.filter_by(name=form.dest_account.data).first()
         transaction = Transaction(
             type=TransactionType.transfer, datetime=form.datetime.data,
-            value_src=float(form.value_src.data), currency_src=src_account.currency,
-            value_dest=float(form.value_dest.data), currency_dest=dest_account.currency,
+            value_src=form.value_src.data, currency_src=src_account.currency,
+            value_dest=form.value_dest.data, currency_dest=dest_account.currency,
             description=form.description.data, where=form.where.data
         )
-        src_account.add_transaction(transaction=transaction, dest_account=dest_account)
-        db.session.commit()
+        with Ledger() as ledger:
+            ledger.post(transaction, src_account, dest_account)
         return redirect(url_for('main.index'))
 
     form.src_account.data = accounts[0].name
@@ -125,12 +222,12 @@ def add_income():
         dest_account = Account.query.filter_by(name=form.dest_account.data).first()
         transaction = Transaction(
             type=TransactionType.income, datetime=form.datetime.data,
-            value_src=float(form.value_src.data), currency_src=dest_account.currency,
-            value_dest=float(form.value_dest.data), currency_dest=dest_account.currency,
+            value_src=form.value_src.data, currency_src=dest_account.currency,
+            value_dest=form.value_dest.data, currency_dest=dest_account.currency,
             description=form.description.data, where=form.where.data
         )
-        dest_account.add_transaction(transaction=transaction)
-        db.session.commit()
+        with Ledger() as ledger:
+            ledger.post(transaction, dest_account=dest_account)
         return redirect(url_for('main.index'))
 
     form.dest_account.data = accounts[0].name
@@ -144,10 +241,8 @@ def remove_transaction(id: int):
         transaction = Transaction.query.filter_by(id=id).first()
         if not transaction:
             return redirect(url_for('main.index'))
-        if transaction.type == TransactionType.income:
-            transaction.dest_account.remove_transaction(transaction)
-        else:
-            transaction.src_account.remove_transaction(transaction)
+        with Ledger() as ledger:
+            ledger.remove(transaction)
 
     return redirect(url_for('main.index'))
 
@@ -1,9 +1,20 @@
 import enum
+import itertools
+import json
+from collections import defaultdict
 from datetime import datetime, date, timedelta
-from hashlib import md5
+from decimal import Decimal
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app, has_app_context, url_for
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.exc import IntegrityError
 
 from app import db
-from app.search import add_to_index, remove_from_index, query_index
+from app.icons import SHARED_ICONS, icon_key, write_icon
+from app.money import Money, to_decimal, to_cents, from_cents
+from app.search import BulkIndexer, payload, query_index
 
 
 class TransactionType(enum.Enum):
@@ -23,6 +34,11 @@ class TransactionType(enum.Enum):
             raise NotImplementedError
 
 
+class Period(enum.Enum):
+    day = 1
+    month = 2
+
+
 class SearchableMixin:
     """Mixin for handling indexing and querying"""
     @classmethod
@@ -34,54 +50,166 @@ class SearchableMixin:
         when = [(id, idx) for idx, id in enumerate(ids)]
         return cls.query.filter(cls.id.in_(ids)).order_by(db.case(when, value=cls.id)), total
 
+    @classmethod
+    def after_flush(cls, session, flush_context):
+        """Collects the objects written by each flush, including the ones flushed before the commit"""
+        changes = session.info.setdefault('search_changes', {'index': {}, 'delete': {}})
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, SearchableMixin):
+                changes['index'][obj] = None
+        for obj in session.deleted:
+            if isinstance(obj, SearchableMixin):
+                changes['index'].pop(obj, None)
+                changes['delete'][obj] = None
+
     @classmethod
     def before_commit(cls, session):
-        session._changes = {
-            'add': list(session.new),
-            'update': list(session.dirty),
-            'delete': list(session.deleted)
-        }
+        """Queues the index updates of the commit as a task written in the same transaction
+
+        Unless the task queue is eager, in which case the documents are built
+        here, while their relationships can still be loaded, and sent by
+        `after_commit`. Nothing is written without a search backend.
+        """
+        if not has_app_context() or current_app.search_backend is None:
+            session.info.pop('search_changes', None)
+            return
+        # The objects written by the final flush of the commit are collected too
+        session.flush()
+        changes = session.info.pop('search_changes', None)
+        if not changes:
+            return
+        if current_app.tasks.eager:
+            session.info['search_actions'] = \
+                [('index', obj.__tablename__, obj.id, payload(obj)) for obj in changes['index']] + \
+                [('delete', obj.__tablename__, obj.id, None) for obj in changes['delete']]
+        else:
+            current_app.tasks.enqueue_index(session, changes['index'], changes['delete'])
 
     @classmethod
     def after_commit(cls, session):
-        for obj in session._changes['add']:
-            if isinstance(obj, SearchableMixin):
-                add_to_index(obj.__tablename__, obj)
-        for obj in session._changes['update']:
-            if isinstance(obj, SearchableMixin):
-                add_to_index(obj.__tablename__, obj)
-        for obj in session._changes['delete']:
-            if isinstance(obj, SearchableMixin):
-                remove_from_index(obj.__tablename__, obj)
-        session._changes = None
+        actions = session.info.pop('search_actions', None)
+        if not actions:
+            return
+        with BulkIndexer() as indexer:
+            for action in actions:
+                indexer.append(action)
 
     @classmethod
-    def reindex(cls):
-        for obj in cls.query:
-            add_to_index(cls.__tablename__, obj)
+    def after_rollback(cls, session):
+        session.info.pop('search_changes', None)
+        session.info.pop('search_actions', None)
+
+    @classmethod
+    def reindex(cls, batch_size: int = None):
+        """Indexes every row, paging through the table by primary key
+
+        Each page is sent as bulk requests and then expunged from the session,
+        so memory use is bounded by `batch_size` rather than the table size.
+        """
+        batch_size = batch_size or current_app.config['SEARCH_BULK_SIZE']
+        last_id = 0
+        with BulkIndexer(batch_size) as indexer:
+            while True:
+                batch = cls.query.filter(cls.id > last_id).order_by(cls.id).limit(batch_size).all()
+                if not batch:
+                    break
+                for obj in batch:
+                    indexer.add(cls.__tablename__, obj)
+                    db.session.expunge(obj)
+                last_id = batch[-1].id
 
 
+db.event.listen(db.session, 'after_flush', SearchableMixin.after_flush)
 db.event.listen(db.session, 'before_commit', SearchableMixin.before_commit)
 db.event.listen(db.session, 'after_commit', SearchableMixin.after_commit)
+db.event.listen(db.session, 'after_rollback', SearchableMixin.after_rollback)
+
+
+def mark_ledger_changed():
+    """Records that the current transaction of the session writes the ledger, for writes bypassing the ORM"""
+    db.session.info['ledger_changed'] = True
+
+
+def collect_ledger_changes(session, flush_context):
+    """Records flushes writing transactions, accounts or postings"""
+    if any(isinstance(obj, (Transaction, Account, Posting))
+           for obj in itertools.chain(session.new, session.dirty, session.deleted)):
+        session.info['ledger_changed'] = True
+
+
+def invalidate_cache(session):
+    """Bumps the ledger version of the page cache once a commit writing the ledger is durable
+
+    Commits writing nothing else, like the polls of the task workers, keep the cache.
+    The column store learns the version, as the rows of the commit are staged for it.
+    """
+    if session.info.pop('ledger_changed', None) and has_app_context() and current_app.cache:
+        version = current_app.cache.bump()
+        store = column_store()
+        if store is not None:
+            store.advance(version)
+
+
+def forget_ledger_changes(session):
+    session.info.pop('ledger_changed', None)
+
+
+db.event.listen(db.session, 'after_flush', collect_ledger_changes)
+db.event.listen(db.session, 'after_commit', invalidate_cache)
+db.event.listen(db.session, 'after_rollback', forget_ledger_changes)
 
 
 class Transaction(db.Model, SearchableMixin):
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.Enum(TransactionType), nullable=False)
-    datetime = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    datetime = db.Column(db.DateTime, default=datetime.utcnow)
     src_account_id = db.Column(db.Integer, db.ForeignKey('account.id'))
     dest_account_id = db.Column(db.Integer, db.ForeignKey('account.id'))
     # Value in source account currency
-    value_src = db.Column(db.Float, nullable=False)
+    value_src = db.Column(Money, nullable=False)
     currency_src = db.Column(db.String(5), default="EUR")
     # Value in destination account currency
-    value_dest = db.Column(db.Float, nullable=False)
+    value_dest = db.Column(Money, nullable=False)
     currency_dest = db.Column(db.String(5), default="EUR")
     # TODO Maybe convert to generic tags?
     where = db.Column(db.String(50))
     description = db.Column(db.String(140))
+    # Digest of the hashed columns, identifies transactions already imported
+    content_hash = db.Column(db.String(32), index=True)
 
     __searchable__ = ['description', 'where', "src_account.name", "dest_account.name"]
+    __hashed__ = ['type', 'datetime', 'src_account_id', 'dest_account_id', 'value_src', 'currency_src',
+                  'value_dest', 'currency_dest', 'description', 'where']
+    # Feeds are ordered by (datetime, id) newest first, globally or within an account
+    __table_args__ = (
+        db.Index('ix_transaction_datetime_id', 'datetime', 'id'),
+        db.Index('ix_transaction_src_account_id_datetime', 'src_account_id', 'datetime'),
+        db.Index('ix_transaction_dest_account_id_datetime', 'dest_account_id', 'datetime'),
+    )
+
+    @db.validates('value_src', 'value_dest')
+    def validate_value(self, key, value):
+        return to_decimal(value)
+
+    @classmethod
+    def digest(cls, values: Dict) -> str:
+        """Content hash of the column values of a transaction, the same for rows exported twice
+
+        The destination of an expense is its category, which categorization
+        rules or edits change, so it is left out.
+        """
+        expense = values.get('type') == TransactionType.expense
+        parts = []
+        for column in cls.__hashed__:
+            value = None if expense and column == 'dest_account_id' else values.get(column)
+            if isinstance(value, TransactionType):
+                value = value.name
+            elif isinstance(value, datetime):
+                value = value.isoformat(sep=' ')
+            elif column.startswith('value_'):
+                value = to_decimal(value)
+            parts.append('' if value is None else str(value))
+        return blake2b('\x1f'.join(parts).encode(), digest_size=16).hexdigest()
 
     def __repr__(self):
         if self.type != TransactionType.income:
@@ -91,12 +219,79 @@ class Transaction(db.Model, SearchableMixin):
         return f"<{self.type.name} {self.datetime} {self.value_src} {self.currency_src}:" \
                f"{self.description} @ {self.where}>"
 
+    def to_dict(self) -> Dict:
+        """JSON representation, with accounts by id and amounts as exact decimal strings"""
+        return {
+            'id': self.id,
+            'type': self.type.name,
+            'datetime': self.datetime.isoformat(),
+            'src_account': self.src_account_id,
+            'dest_account': self.dest_account_id,
+            'value_src': str(self.value_src),
+            'currency_src': self.currency_src,
+            'value_dest': str(self.value_dest),
+            'currency_dest': self.currency_dest,
+            'where': self.where,
+            'description': self.description,
+        }
+
+
+def assign_content_hash(mapper, connection, transaction):
+    # Column defaults are applied by the INSERT itself, after this hook
+    transaction.datetime = transaction.datetime or datetime.utcnow()
+    transaction.currency_src = transaction.currency_src or 'EUR'
+    transaction.currency_dest = transaction.currency_dest or 'EUR'
+    transaction.content_hash = Transaction.digest({c: getattr(transaction, c) for c in Transaction.__hashed__})
+
+
+db.event.listen(Transaction, 'before_insert', assign_content_hash)
+db.event.listen(Transaction, 'before_update', assign_content_hash)
+
+
+def column_store():
+    store = current_app.columns if has_app_context() else None
+    return store if store is not None and store.loaded else None
+
+
+def collect_column_changes(session, flush_context):
+    """Collects the transactions written by each flush, for the column store"""
+    store = column_store()
+    if store is None:
+        return
+    rows, removed = session.info.setdefault('column_changes', ({}, set()))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Transaction):
+            rows[obj.id] = store.row(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Transaction):
+            rows.pop(obj.id, None)
+            removed.add(obj.id)
+
+
+def stage_column_changes(session):
+    """Hands the committed transactions to the column store"""
+    changes = session.info.pop('column_changes', None)
+    store = column_store()
+    if changes and store is not None:
+        store.stage(*changes)
+
+
+def discard_column_changes(session):
+    session.info.pop('column_changes', None)
+
+
+db.event.listen(db.session, 'after_flush', collect_column_changes)
+db.event.listen(db.session, 'after_commit', stage_column_changes)
+db.event.listen(db.session, 'after_rollback', discard_column_changes)
+
 
 class Account(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(30), nullable=False)
     description = db.Column(db.String(140))
-    balance = db.Column(db.Float, default=0.0)
+    balance = db.Column(Money, default=Decimal(0))
+    # Incremented by every change of the account, including balance changes
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     currency = db.Column(db.String(5), default="EUR")
     is_category = db.Column(db.Boolean, default=False)
     icon = db.Column(db.String(140))
@@ -110,9 +305,26 @@ class Account(db.Model):
         db.relationship('Transaction', backref='dest_account', lazy='dynamic',
                         foreign_keys='Transaction.dest_account_id')
 
+    __mapper_args__ = {'version_id_col': version}
+
+    @db.validates('balance')
+    def validate_balance(self, key, value):
+        return to_decimal(value)
+
     def __repr__(self):
         return f'<Account {self.name}: {self.balance:.2f} {self.currency}>'
 
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'balance': str(self.balance),
+            'currency': self.currency,
+            'is_category': self.is_category,
+            'icon': self.get_icon(),
+        }
+
     def check_valid_currency(self, transaction: Transaction, dest_account: "Account" = None):
         """Checks if transaction has the correct currency"""
         if transaction.type == TransactionType.income:
@@ -136,18 +348,28 @@ class Account(db.Model):
         `src_account.add_transaction(expense, dest_category)`
         `src_account.add_transaction(transfer, dest_account)`
         `dest_account.add_transaction(income)`
+        The transaction is journaled like the ones posted by `app.ledger.Ledger`,
+        used to post batches. Changes are committed by the caller.
         """
         self.check_valid_currency(transaction, dest_account)
+        transaction.datetime = transaction.datetime or datetime.utcnow()
         if transaction.type == TransactionType.income:
-            self.balance += transaction.value_dest
             self.transactions_to.append(transaction)
         elif transaction.type in (TransactionType.expense, TransactionType.transfer):
-            self.balance -= transaction.value_src
-            dest_account.balance += transaction.value_dest
             dest_account.transactions_to.append(transaction)
             self.transactions_from.append(transaction)
         db.session.add(transaction)
-        db.session.commit()
+        # Accounts added with the transaction get their ids
+        db.session.flush()
+        if transaction.type == TransactionType.income:
+            deltas = {self.id: transaction.value_dest}
+        else:
+            deltas = {self.id: -transaction.value_src}
+            deltas[dest_account.id] = deltas.get(dest_account.id, 0) + transaction.value_dest
+        Posting.record(Transaction.id == transaction.id)
+        Account.apply_balance_deltas(deltas)
+        AccountSummary.apply_deltas(AccountSummary.deltas([transaction]))
+        BalanceSnapshot.shift(Posting.changes([transaction]))
 
     def remove_transaction(self, transaction: Transaction):
         """Removes the association of a transaction with respective accounts
@@ -155,44 +377,468 @@ class Account(db.Model):
         Should be used as follows
         `src_account.remove_transaction(expense/transfer)`
         `dest_account.remove_transaction(income)`
+        The transaction is deleted and its postings reversed in the journal.
+        Changes are committed by the caller.
         """
         dest_account = transaction.dest_account
         self.check_valid_currency(transaction, dest_account)
+        AccountSummary.apply_deltas(AccountSummary.deltas([transaction], sign=-1))
+        changes = Posting.changes([transaction], sign=-1)
+        Posting.record(Transaction.id == transaction.id, reverse=True)
         if transaction.type == TransactionType.income:
-            self.balance -= transaction.value_dest
             self.transactions_to.remove(transaction)
+            deltas = {self.id: -transaction.value_dest}
         elif transaction.type in (TransactionType.expense, TransactionType.transfer):
-            self.balance += transaction.value_src
-            dest_account.balance -= transaction.value_dest
             dest_account.transactions_to.remove(transaction)
             self.transactions_from.remove(transaction)
+            deltas = {self.id: transaction.value_src}
+            deltas[dest_account.id] = deltas.get(dest_account.id, 0) - transaction.value_dest
         db.session.delete(transaction)
-        db.session.commit()
+        db.session.flush()
+        Account.apply_balance_deltas(deltas)
+        BalanceSnapshot.shift(changes)
+
+    @classmethod
+    def apply_balance_deltas(cls, deltas: Dict[int, Decimal]):
+        """Changes balances with atomic in-place increments, `balance = balance + delta`
+
+        Concurrent writers cannot lose each other's changes, as no balance is read
+        and written back. Each increment also bumps the version of the account,
+        so flushing an account loaded before a concurrent change raises
+        StaleDataError. Accounts loaded in the session are reloaded on next access.
+        """
+        table = cls.__table__
+        # Rows are always locked in the same order, so concurrent batches cannot deadlock
+        rows = [{'b_id': account_id, 'b_delta': delta} for account_id, delta in sorted(deltas.items()) if delta]
+        if rows:
+            db.session.execute(table.update().where(table.c.id == db.bindparam('b_id')).values(
+                balance=table.c.balance + db.bindparam('b_delta'), version=table.c.version + 1), rows)
+            mark_ledger_changed()
+        mapper = db.inspect(cls)
+        for account_id in deltas:
+            account = db.session.identity_map.get(mapper.identity_key_from_primary_key([account_id]))
+            if account is not None:
+                db.session.expire(account, ['balance', 'version'])
+
+    def sides(self) -> Tuple:
+        """Criteria of the transactions from and of the transactions to this account"""
+        return Transaction.src_account_id == self.id, Transaction.dest_account_id == self.id
+
+    def transactions(self):
+        """Query for the transactions from or to this account"""
+        return Transaction.query.filter(db.or_(*self.sides()))
 
     def transactions_cur_month(self):
         today = date.today()
         first = today.replace(day=1)
         last_month = first - timedelta(days=1)
-        transactions_to = self.transactions_to.filter(Transaction.datetime >= last_month)
-        transactions_from = self.transactions_from.filter(Transaction.datetime >= last_month)
-        return transactions_to.union(transactions_from).order_by(Transaction.datetime.desc()).all()
+        return self.transactions().filter(Transaction.datetime >= last_month).order_by(Transaction.datetime.desc()) \
+            .options(db.joinedload(Transaction.src_account), db.joinedload(Transaction.dest_account)).all()
 
     def sum_cur_month(self):
         today = date.today()
         first = today.replace(day=1)
         last_month = first - timedelta(days=1)
-        transactions_to = self.transactions_to.filter(Transaction.datetime >= last_month).all()
-        transactions_from = self.transactions_from.filter(Transaction.datetime >= last_month).all()
-        sum_cur_month = sum([t.value_dest for t in transactions_to])
-        sum_cur_month += sum([-t.value_src for t in transactions_from])
-        return sum_cur_month
-
-    def generate_icon(self, size: int = 50):
-        digest = md5(self.name.lower().encode('utf-8')).hexdigest()
-        self.icon = f'https://www.gravatar.com/avatar/{digest}?d=identicon&s={size}'
+        # Same window as transactions_cur_month, which includes the last day of the previous month
+        summaries = AccountSummary.query.filter_by(account_id=self.id).filter(db.or_(
+            db.and_(AccountSummary.period == Period.month, AccountSummary.start == first),
+            db.and_(AccountSummary.period == Period.day, AccountSummary.start == last_month)))
+        total = summaries.with_entities(db.func.sum(AccountSummary.inflow - AccountSummary.outflow, type_=Money)).scalar()
+        return total if total is not None else Decimal('0.00')
+
+    def trend(self, period: Period = Period.month, since: date = None) -> List["AccountSummary"]:
+        """Inflow and outflow totals per day or month, oldest first"""
+        summaries = AccountSummary.query.filter_by(account_id=self.id, period=period)
+        if since:
+            summaries = summaries.filter(AccountSummary.start >= since)
+        return summaries.order_by(AccountSummary.start.asc()).all()
+
+    def balance_at(self, when: datetime) -> Decimal:
+        """Balance just before a time, from the latest snapshot before it and the postings since"""
+        snapshot = BalanceSnapshot.query.filter(BalanceSnapshot.account_id == self.id,
+                                                BalanceSnapshot.datetime < when) \
+            .order_by(BalanceSnapshot.datetime.desc(), BalanceSnapshot.posting_id.desc()).first()
+        replay = db.session.query(db.func.sum(Posting.amount, type_=Money)) \
+            .filter(Posting.account_id == self.id, Posting.datetime < when)
+        if snapshot:
+            replay = replay.filter(Posting.datetime >= snapshot.datetime, db.or_(
+                Posting.datetime > snapshot.datetime, Posting.id > snapshot.posting_id))
+        start = snapshot.balance if snapshot else Decimal('0.00')
+        return start + (replay.scalar() or Decimal('0.00'))
+
+    def generate_icon(self):
+        """Sets the key of the identicon of the account and renders it, done when the account is inserted"""
+        self.icon = icon_key(self.name)
+        write_icon(self.icon)
+
+    @staticmethod
+    def icon_exists(key: str) -> bool:
+        """Whether a key is the icon of an account, or of rows without one"""
+        if key in {icon_key(name) for name in SHARED_ICONS} or Account.query.filter_by(icon=key).first():
+            return True
+        # Accounts stored before icons were assigned on insert
+        return any(icon_key(name) == key for name, in
+                   db.session.query(Account.name).filter(Account.icon.is_(None)))
+
+    def get_icon(self) -> str:
+        """Url of the identicon of the account, never written while rendering"""
+        return url_for('main.icon', key=self.icon or icon_key(self.name))
+
+
+def assign_icon(mapper, connection, account):
+    if account.icon:
+        write_icon(account.icon)
+    else:
+        account.generate_icon()
+
+
+db.event.listen(Account, 'before_insert', assign_icon)
+
+
+class AccountSummary(db.Model):
+    """Inflow and outflow totals of an account over a day or a month
+
+    Maintained incrementally as transactions are added and removed, and rebuilt
+    from the transaction table with `flask ledger rebuild-summaries`.
+    """
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    period = db.Column(db.Enum(Period), primary_key=True)
+    start = db.Column(db.Date, primary_key=True)
+    inflow = db.Column(Money, nullable=False, default=Decimal(0))
+    outflow = db.Column(Money, nullable=False, default=Decimal(0))
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<AccountSummary {self.account_id} {self.period.name} {self.start}: ' \
+               f'+{self.inflow:.2f} -{self.outflow:.2f}>'
+
+    def to_dict(self) -> Dict:
+        return {
+            'period': self.period.name,
+            'start': self.start.isoformat(),
+            'inflow': str(self.inflow),
+            'outflow': str(self.outflow),
+            'net': str(self.inflow - self.outflow),
+            'count': self.count,
+        }
+
+    @staticmethod
+    def add_delta(deltas: Dict[Tuple, List], account_id: int, when: datetime,
+                  inflow: Decimal = 0, outflow: Decimal = 0, count: int = 1):
+        """Accumulates a change of the day and month summaries of an account"""
+        day = when.date()
+        for key in ((account_id, Period.day, day), (account_id, Period.month, day.replace(day=1))):
+            delta = deltas[key]
+            delta[0] += inflow
+            delta[1] += outflow
+            delta[2] += count
+
+    @classmethod
+    def deltas(cls, transactions, sign: int = 1) -> Dict[Tuple, List]:
+        """Summary changes of adding (or with sign -1 removing) transactions"""
+        deltas = defaultdict(lambda: [Decimal(0), Decimal(0), 0])
+        for t in transactions:
+            cls.add_delta(deltas, t.dest_account_id, t.datetime, inflow=sign * t.value_dest, count=sign)
+            if t.src_account_id is not None:
+                cls.add_delta(deltas, t.src_account_id, t.datetime, outflow=sign * t.value_src, count=sign)
+        return deltas
+
+    @classmethod
+    def apply_deltas(cls, deltas: Dict[Tuple, List]):
+        """Applies accumulated changes with in-place increments, inserting missing summaries
+
+        PostgreSQL and MySQL insert or increment every summary with one upsert
+        executemany. Elsewhere existing summaries are looked up with one SELECT,
+        then incremented and inserted with one executemany each, and summaries
+        another transaction inserted since the SELECT are incremented instead.
+        """
+        if not deltas:
+            return
+        mark_ledger_changed()
+        table = cls.__table__
+        rows = [{'account_id': account_id, 'period': period, 'start': start,
+                 'inflow': inflow, 'outflow': outflow, 'count': count}
+                for (account_id, period, start), (inflow, outflow, count) in deltas.items()]
+        dialect = db.session.get_bind(clause=table.insert()).dialect.name
+        if dialect == 'postgresql':
+            insert = postgresql.insert(table)
+            db.session.execute(insert.on_conflict_do_update(
+                index_elements=[table.c.account_id, table.c.period, table.c.start],
+                set_={name: table.c[name] + insert.excluded[name] for name in ('inflow', 'outflow', 'count')}), rows)
+        elif dialect == 'mysql':
+            insert = mysql.insert(table)
+            db.session.execute(insert.on_duplicate_key_update(
+                {name: table.c[name] + insert.inserted[name] for name in ('inflow', 'outflow', 'count')}), rows)
+        else:
+            inserts = cls.increment_existing(rows)
+            if inserts:
+                # A savepoint of the connection, as the session's would trigger its commit events
+                connection = db.session.connection(clause=table.insert())
+                try:
+                    with connection.begin_nested():
+                        connection.execute(table.insert(), inserts)
+                except IntegrityError:
+                    # Inserted by another transaction since the SELECT, raises again if not
+                    inserts = cls.increment_existing(inserts)
+                    if inserts:
+                        db.session.execute(table.insert(), inserts)
+        # Summaries loaded in the session are reloaded on next access
+        mapper = db.inspect(cls)
+        for key in deltas:
+            summary = db.session.identity_map.get(mapper.identity_key_from_primary_key(key))
+            if summary is not None:
+                db.session.expire(summary)
+
+    @classmethod
+    def increment_existing(cls, rows: List[Dict]) -> List[Dict]:
+        """Increments the stored summaries of rows, returns the rows without one"""
+        table = cls.__table__
+        starts = [row['start'] for row in rows]
+        existing = {tuple(row) for row in db.session.execute(
+            db.select([table.c.account_id, table.c.period, table.c.start])
+            .where(table.c.account_id.in_({row['account_id'] for row in rows}))
+            .where(table.c.start.between(min(starts), max(starts))))}
+        updates = [{f'b_{name}': value for name, value in row.items()} for row in rows
+                   if (row['account_id'], row['period'], row['start']) in existing]
+        if updates:
+            db.session.execute(table.update().where(db.and_(
+                table.c.account_id == db.bindparam('b_account_id'), table.c.period == db.bindparam('b_period'),
+                table.c.start == db.bindparam('b_start'))).values(
+                inflow=table.c.inflow + db.bindparam('b_inflow'), outflow=table.c.outflow + db.bindparam('b_outflow'),
+                count=table.c.count + db.bindparam('b_count')), updates)
+        return [row for row in rows if (row['account_id'], row['period'], row['start']) not in existing]
+
+    @classmethod
+    def rebuild(cls, yield_per: int = 10000) -> int:
+        """Recomputes every summary from the transaction table, returns the number of summaries
+
+        Amounts are summed as integer cents, as stored.
+        """
+        deltas = defaultdict(lambda: [0, 0, 0])
+        rows = db.session.query(Transaction.datetime, Transaction.src_account_id, Transaction.dest_account_id,
+                                db.type_coerce(Transaction.value_src, db.BigInteger),
+                                db.type_coerce(Transaction.value_dest, db.BigInteger)).yield_per(yield_per)
+        for when, src_account_id, dest_account_id, value_src, value_dest in rows:
+            cls.add_delta(deltas, dest_account_id, when, inflow=value_dest)
+            if src_account_id is not None:
+                cls.add_delta(deltas, src_account_id, when, outflow=value_src)
+        db.session.execute(cls.__table__.delete())
+        mark_ledger_changed()
+        if deltas:
+            db.session.execute(cls.__table__.insert(), [
+                {'account_id': account_id, 'period': period, 'start': start,
+                 'inflow': from_cents(inflow), 'outflow': from_cents(outflow), 'count': count}
+                for (account_id, period, start), (inflow, outflow, count) in deltas.items()])
         db.session.commit()
+        return len(deltas)
+
+
+class Posting(db.Model):
+    """Entry of the append-only journal, the change of the balance of an account by a transaction
+
+    Each side of a transaction is journaled when it is stored, and removing it
+    appends reversing postings, so the balance of an account at any time is the
+    sum of its postings until then. Postings are never updated or deleted.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    # Kept once the transaction is removed
+    transaction_id = db.Column(db.Integer, index=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    amount = db.Column(Money, nullable=False)
+    recorded = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Time of the transaction, the journal is replayed in (datetime, id) order
+    datetime = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_posting_account_id_datetime_id', 'account_id', 'datetime', 'id'),
+    )
 
-    def get_icon(self):
-        if not self.icon:
-            self.generate_icon()
-        return self.icon
+    def __repr__(self):
+        return f'<Posting {self.account_id} {self.datetime}: {self.amount:+.2f}>'
+
+    @classmethod
+    def record(cls, criterion, params: Dict = None, reverse: bool = False):
+        """Journals the transactions matching the criterion, or with `reverse` their reversing postings
+
+        Postings are copied from the transaction table by a single INSERT ... SELECT,
+        transactions already journaled are skipped unless reversed.
+        """
+        t = Transaction.__table__.c
+        posting = cls.__table__
+        sign = -1 if reverse else 1
+        now = datetime.utcnow()
+        # Amounts are copied as the integer cents stored
+        value_src, value_dest = (db.type_coerce(c, db.BigInteger) for c in (t.value_src, t.value_dest))
+        dest = db.select([t.id, t.dest_account_id, t.datetime, sign * value_dest, db.literal(now)])
+        src = db.select([t.id, t.src_account_id, t.datetime, -sign * value_src, db.literal(now)]) \
+            .where(t.src_account_id.isnot(None))
+        criteria = [criterion]
+        if not reverse:
+            criteria.append(~db.exists().where(posting.c.transaction_id == t.id))
+        sides = db.union_all(dest.where(db.and_(*criteria)), src.where(db.and_(*criteria)))
+        db.session.execute(posting.insert().from_select(
+            ['transaction_id', 'account_id', 'datetime', 'amount', 'recorded'], sides), params or {})
+        mark_ledger_changed()
+
+    @staticmethod
+    def changes(transactions: Iterable, sign: int = 1) -> List[Tuple]:
+        """(account id, datetime, amount) of the postings of transactions, reversed with sign -1"""
+        changes = []
+        for t in transactions:
+            changes.append((t.dest_account_id, t.datetime, sign * t.value_dest))
+            if t.src_account_id is not None:
+                changes.append((t.src_account_id, t.datetime, -sign * t.value_src))
+        return changes
+
+
+class BalanceSnapshot(db.Model):
+    """Balance of an account after its postings up to one of them, in (datetime, id) order
+
+    Taken every `BALANCE_SNAPSHOT_INTERVAL` postings of an account by `take`, and
+    by the ledger for the accounts it posts to, so a balance at any time is one
+    snapshot lookup and a replay of fewer postings.
+    Postings dated before a snapshot shift its balance when they are journaled.
+    """
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    datetime = db.Column(db.DateTime, primary_key=True)
+    posting_id = db.Column(db.Integer, primary_key=True)
+    balance = db.Column(Money, nullable=False)
+
+    def __repr__(self):
+        return f'<BalanceSnapshot {self.account_id} {self.datetime}: {self.balance:.2f}>'
+
+    @classmethod
+    def shift(cls, changes: Iterable[Tuple]):
+        """Adds postings dated before the latest snapshots of their accounts to the snapshots after them"""
+        changes = list(changes)
+        if not changes:
+            return
+        table = cls.__table__
+        latest = dict(db.session.execute(
+            db.select([table.c.account_id, db.func.max(table.c.datetime)])
+            .where(table.c.account_id.in_({account_id for account_id, _, _ in changes}))
+            .group_by(table.c.account_id)).fetchall())
+        rows = [{'b_account_id': account_id, 'b_datetime': when, 'b_amount': amount}
+                for account_id, when, amount in changes
+                if account_id in latest and when < latest[account_id] and amount]
+        if rows:
+            db.session.execute(table.update().where(db.and_(
+                table.c.account_id == db.bindparam('b_account_id'), table.c.datetime > db.bindparam('b_datetime')))
+                .values(balance=table.c.balance + db.bindparam('b_amount')), rows)
+
+    @classmethod
+    def take(cls, interval: int = 500, rebuild: bool = False, yield_per: int = 10000) -> int:
+        """Snapshots every `interval` postings of each account after its latest snapshot
+
+        Returns the number of snapshots taken. With `rebuild`, every snapshot is
+        dropped and taken again over the whole journal, also splitting the spans
+        that grew past the interval with postings dated before later snapshots.
+        """
+        if rebuild:
+            db.session.execute(cls.__table__.delete())
+        taken = sum(cls.take_account(account_id, cls.latest(account_id), interval, yield_per)
+                    for (account_id,) in db.session.query(Account.id).order_by(Account.id).all())
+        db.session.commit()
+        return taken
+
+    @classmethod
+    def take_due(cls, account_ids: Iterable[int], interval: int = 500) -> int:
+        """Snapshots the accounts with `interval` postings since their latest snapshot, without committing
+
+        Postings are counted on the journal index first, so accounts not due
+        read no postings.
+        """
+        taken = 0
+        for account_id in sorted(set(account_ids)):
+            latest = cls.latest(account_id)
+            if db.session.query(db.func.count(Posting.id)).filter(*cls.since(account_id, latest)).scalar() >= interval:
+                taken += cls.take_account(account_id, latest, interval)
+        return taken
+
+    @classmethod
+    def latest(cls, account_id: int) -> Optional["BalanceSnapshot"]:
+        return cls.query.filter_by(account_id=account_id) \
+            .order_by(cls.datetime.desc(), cls.posting_id.desc()).first()
+
+    @staticmethod
+    def since(account_id: int, latest: Optional["BalanceSnapshot"]) -> List:
+        """Criteria of the postings of an account after a snapshot"""
+        criteria = [Posting.account_id == account_id]
+        if latest:
+            criteria += [Posting.datetime >= latest.datetime,
+                         db.or_(Posting.datetime > latest.datetime, Posting.id > latest.posting_id)]
+        return criteria
+
+    @classmethod
+    def take_account(cls, account_id: int, latest: Optional["BalanceSnapshot"], interval: int,
+                     yield_per: int = 10000) -> int:
+        """Snapshots every `interval` postings of an account after its latest snapshot, returns how many"""
+        balance = to_cents(latest.balance) if latest else 0
+        postings = db.session.query(Posting.id, Posting.datetime, db.type_coerce(Posting.amount, db.BigInteger)) \
+            .filter(*cls.since(account_id, latest))
+        snapshots, count = [], 0
+        for posting_id, when, cents in postings.order_by(Posting.datetime, Posting.id).yield_per(yield_per):
+            balance += cents
+            count += 1
+            if count == interval:
+                snapshots.append({'account_id': account_id, 'datetime': when, 'posting_id': posting_id,
+                                  'balance': from_cents(balance)})
+                count = 0
+        if snapshots:
+            db.session.execute(cls.__table__.insert(), snapshots)
+        return len(snapshots)
+
+
+class ExchangeRate(db.Model):
+    """Units of a currency worth one unit of the base currency on a date"""
+    date = db.Column(db.Date, primary_key=True)
+    currency = db.Column(db.String(5), primary_key=True)
+    rate = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<ExchangeRate {self.date} {self.currency}: {self.rate}>'
+
+
+class Task(db.Model):
+    """Background job of the task queue, run by name with JSON arguments
+
+    Jobs are `queued` until claimed by a worker, then `running`, and end up
+    `done` or, after `max_attempts` failures, `failed`. Failed attempts are
+    queued again once `run_after` has passed.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    arguments = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started = db.Column(db.DateTime)
+    # Last time the worker running the task marked it alive
+    heartbeat = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+    progress = db.Column(db.Text)
+    error = db.Column(db.Text)
+
+    __table_args__ = (db.Index('ix_task_status_run_after', 'status', 'run_after'),)
+
+    def __repr__(self):
+        return f'<Task {self.id} {self.name}: {self.status}>'
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'arguments': json.loads(self.arguments),
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_after': self.run_after.isoformat(),
+            'created': self.created.isoformat(),
+            'started': self.started and self.started.isoformat(),
+            'heartbeat': self.heartbeat and self.heartbeat.isoformat(),
+            'finished': self.finished and self.finished.isoformat(),
+            'progress': self.progress,
+            'error': self.error,
+        }
@@ -0,0 +1,45 @@
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional, Union
+
+from sqlalchemy.types import TypeDecorator, BigInteger
+
+# Amounts are stored in minor units, with 2 decimal places in every currency
+MINOR_UNITS = 100
+CENT = Decimal('0.01')
+
+Amount = Union[Decimal, float, int, str]
+
+
+def to_decimal(value: Optional[Amount]) -> Optional[Decimal]:
+    """Rounds an amount to cents, floats are read from their shortest representation, 0.1 as 0.10"""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        value = repr(value)
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_cents(value: Amount) -> int:
+    return int(to_decimal(value) * MINOR_UNITS)
+
+
+def from_cents(cents: int) -> Decimal:
+    return (Decimal(int(cents)) / MINOR_UNITS).quantize(CENT)
+
+
+class Money(TypeDecorator):
+    """Exact amount, stored as an integer number of cents and returned as a Decimal
+
+    Values are rounded half up to cents when bound. SQL sums and differences
+    of Money columns are computed on the integers and also returned as Decimals.
+    """
+    impl = BigInteger
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_cents(value)
+
+    def process_literal_param(self, value, dialect):
+        return None if value is None else str(to_cents(value))
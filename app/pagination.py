@@ -0,0 +1,81 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from app import db
+from app.models import Transaction
+
+
+def encode_cursor(transaction: Transaction) -> str:
+    """Opaque cursor pointing at a transaction of a feed"""
+    key = f'{transaction.datetime.isoformat()}|{transaction.id}'
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """Returns the (datetime, id) key of a cursor, or None if it is malformed"""
+    try:
+        when, _, id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').partition('|')
+        return datetime.fromisoformat(when), int(id)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """Page of a feed ordered newest first, with cursors to its neighbours"""
+    def __init__(self, items: List[Transaction], has_next: bool, has_prev: bool):
+        self.items = items
+        self.next_cursor = encode_cursor(items[-1]) if has_next and items else None
+        self.prev_cursor = encode_cursor(items[0]) if has_prev and items else None
+
+
+def seek(query, key: Optional[Tuple[datetime, int]], newer: bool, limit: int):
+    """Orders the query away from the key and limits it
+
+    The redundant bound on the datetime lets the database seek the
+    (datetime, id) indexes instead of scanning them from the newest row.
+    """
+    if key:
+        when, id = key
+        if newer:
+            query = query.filter(Transaction.datetime >= when,
+                                 db.or_(Transaction.datetime > when,
+                                        db.and_(Transaction.datetime == when, Transaction.id > id)))
+        else:
+            query = query.filter(Transaction.datetime <= when,
+                                 db.or_(Transaction.datetime < when,
+                                        db.and_(Transaction.datetime == when, Transaction.id < id)))
+    if newer:
+        return query.order_by(Transaction.datetime.asc(), Transaction.id.asc()).limit(limit)
+    return query.order_by(Transaction.datetime.desc(), Transaction.id.desc()).limit(limit)
+
+
+def paginate_keyset(query, per_page: int, after: str = None, before: str = None,
+                    partitions: Sequence = ()) -> KeysetPage:
+    """Seeks a page of transactions ordered by (datetime, id), newest first
+
+    `after` returns the page of older transactions following a cursor and
+    `before` the page of newer transactions preceding it. One extra row is
+    fetched to tell whether there is a further page, so no COUNT is issued.
+
+    `partitions` restrict the feed to the transactions matching any of the
+    criteria, like the source and destination sides of an account. Each one
+    is seeked through its own index for a page of ids, so the matches of an
+    OR are not all sorted to return the first few.
+    """
+    key = decode_cursor(before) if before else None
+    newer = key is not None
+    if not newer:
+        key = decode_cursor(after) if after else None
+    if partitions:
+        pages = [seek(db.session.query(Transaction.id).filter(criterion), key, newer, per_page + 1).subquery()
+                 for criterion in partitions]
+        query = seek(query.filter(Transaction.id.in_(db.union_all(*(db.select([page.c.id]) for page in pages)))),
+                     None, newer, per_page + 1)
+    else:
+        query = seek(query, key, newer, per_page + 1)
+    items = query.all()
+    if newer:
+        return KeysetPage(list(reversed(items[:per_page])), has_next=True, has_prev=len(items) > per_page)
+    return KeysetPage(items[:per_page], has_next=len(items) > per_page, has_prev=key is not None)
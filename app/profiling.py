@@ -0,0 +1,177 @@
+import bisect
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict
+
+from flask import g, request, has_request_context, has_app_context, current_app, \
+    before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.search import SearchBackend
+
+
+class Histogram:
+    """Latency histogram over fixed millisecond buckets
+
+    Bucket counts cover every sample, while percentiles are computed over a
+    bounded ring buffer of the most recent ones.
+    """
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, size: int):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.recent = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, ms)] += 1
+        self.recent.append(ms)
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self) -> Dict:
+        labels = [f'<={b}ms' for b in self.BUCKETS] + [f'>{self.BUCKETS[-1]}ms']
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5), 'p95': self.percentile(0.95), 'p99': self.percentile(0.99),
+            'max': self.max,
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class Profiler:
+    """In-memory aggregates of request, SQL, search and template timings
+
+    Distinct SQL statements are tracked up to `size`, later ones are counted
+    under a single 'other' entry.
+    """
+    def __init__(self, size: int = 1000):
+        self.size = size
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = defaultdict(lambda: Histogram(self.size))
+            self.queries = defaultdict(lambda: Histogram(self.size))
+            self.search = defaultdict(lambda: Histogram(self.size))
+            self.templates = defaultdict(lambda: Histogram(self.size))
+            self.requests = deque(maxlen=self.size)
+
+    def record(self, histograms, key: str, ms: float):
+        with self.lock:
+            if histograms is self.queries and key not in histograms and len(histograms) >= self.size:
+                key = 'other'
+            histograms[key].add(ms)
+
+    def record_request(self, endpoint: str, ms: float, profile: Dict):
+        with self.lock:
+            self.endpoints[endpoint].add(ms)
+            self.requests.append(dict(profile, endpoint=endpoint, ms=ms, time=time.time()))
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {
+                'endpoints': {k: h.to_dict() for k, h in self.endpoints.items()},
+                'queries': {k: h.to_dict() for k, h in self.queries.items()},
+                'search': {k: h.to_dict() for k, h in self.search.items()},
+                'templates': {k: h.to_dict() for k, h in self.templates.items()},
+                'requests': list(self.requests),
+            }
+
+
+class ProfiledBackend(SearchBackend):
+    """Search backend recording the duration of every call of the backend it wraps"""
+    def __init__(self, backend: SearchBackend, profiler: Profiler):
+        self.backend = backend
+        self.profiler = profiler
+
+    def timed(self, operation: str, function, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.profiler.record(self.profiler.search, operation, ms)
+            if has_request_context() and 'profile' in g:
+                g.profile['search_ms'] += ms
+
+    def bulk(self, actions):
+        return self.timed('bulk', self.backend.bulk, actions)
+
+    def query(self, index, query, page, per_page, fields=None):
+        return self.timed('query', self.backend.query, index, query, page, per_page, fields=fields)
+
+    def clear(self, index):
+        return self.timed('clear', self.backend.clear, index)
+
+
+def current_profiler() -> Profiler:
+    return current_app.extensions.get('profiler') if has_app_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profiler():
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiler = current_profiler()
+    if not profiler or not conn.info.get('query_start'):
+        return
+    ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+    profiler.record(profiler.queries, statement, ms)
+    if has_request_context() and 'profile' in g:
+        g.profile['sql_count'] += 1
+        g.profile['sql_ms'] += ms
+
+
+def before_template(sender, template, context, **extra):
+    if 'profile' in g:
+        g.template_start = time.perf_counter()
+
+
+def after_template(sender, template, context, **extra):
+    profiler = current_profiler()
+    if not profiler or 'template_start' not in g:
+        return
+    ms = (time.perf_counter() - g.pop('template_start')) * 1000
+    profiler.record(profiler.templates, template.name, ms)
+    g.profile['template_ms'] += ms
+
+
+def init_app(app):
+    """Records timings of every request of the app when PROFILING is enabled"""
+    if not app.config['PROFILING']:
+        return
+    profiler = app.extensions['profiler'] = Profiler(app.config['PROFILING_BUFFER_SIZE'])
+    if app.search_backend:
+        app.search_backend = ProfiledBackend(app.search_backend, profiler)
+    before_render_template.connect(before_template, app)
+    template_rendered.connect(after_template, app)
+
+    @app.before_request
+    def start_profile():
+        g.profile = {'sql_count': 0, 'sql_ms': 0.0, 'search_ms': 0.0, 'template_ms': 0.0}
+        g.profile_start = time.perf_counter()
+
+    @app.after_request
+    def record_profile(response):
+        if 'profile_start' in g:
+            ms = (time.perf_counter() - g.profile_start) * 1000
+            profiler.record_request(request.endpoint or request.path, ms, dict(g.profile, status=response.status_code))
+        return response
@@ -0,0 +1,293 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from flask import current_app
+
+from app import db
+from app.currency import rate_table
+from app.models import Transaction, TransactionType, Account
+from app.money import to_cents, from_cents
+
+GRANULARITIES = ('day', 'week', 'month', 'year')
+
+EPOCH = datetime(1970, 1, 1)
+TYPE_CODES = {t.name: t.value for t in TransactionType}
+
+
+class Columns:
+    """Transaction columns as NumPy arrays
+
+    Transaction types are stored as their enum values, missing source accounts
+    as -1, amounts as integer cents and currencies as indices into `currencies`.
+    """
+    def __init__(self, id, datetime, type, src_account_id, dest_account_id,
+                 value_src, value_dest, currency_src, currency_dest, currencies):
+        self.id = id
+        self.datetime = datetime
+        self.type = type
+        self.src_account_id = src_account_id
+        self.dest_account_id = dest_account_id
+        self.value_src = value_src
+        self.value_dest = value_dest
+        self.currency_src = currency_src
+        self.currency_dest = currency_dest
+        self.currencies = currencies
+
+    def __len__(self):
+        return len(self.datetime)
+
+    def take(self, index) -> "Columns":
+        """Rows at an index, slice or mask of every column, with the same currency dictionary"""
+        return Columns(*(getattr(self, name)[index] for name in COLUMNS), self.currencies)
+
+
+# Array attributes of Columns, in order
+COLUMNS = ('id', 'datetime', 'type', 'src_account_id', 'dest_account_id', 'value_src', 'value_dest',
+           'currency_src', 'currency_dest')
+
+
+def to_datetime64(values: Sequence) -> np.ndarray:
+    """Converts datetimes, or the ISO strings SQLite stores them as, to a datetime64 array"""
+    if values and isinstance(values[0], str):
+        return np.array(values, dtype='datetime64[us]')
+    one = timedelta(microseconds=1)
+    return np.fromiter(((v - EPOCH) // one for v in values), dtype=np.int64, count=len(values)) \
+        .view('datetime64[us]')
+
+
+def fetch_columns(start: date = None, end: date = None) -> Columns:
+    """Columns of the transactions in [start, end], from the column store if enabled"""
+    store = current_app.columns
+    if store is not None:
+        return store.between(start, end)
+    return read_columns(start, end)
+
+
+def read_columns(start: date = None, end: date = None, chunk_size: int = 50000, after_id: int = None) -> Columns:
+    """Reads the transactions in [start, end] with one streamed SELECT, chunk by chunk
+
+    Datetimes, types and amounts are fetched as stored, skipping their per-row
+    conversion to Python objects.
+    """
+    t = Transaction.__table__.c
+    query = db.select([t.id, db.type_coerce(t.datetime, db.String), db.type_coerce(t.type, db.String),
+                       t.src_account_id, t.dest_account_id,
+                       db.type_coerce(t.value_src, db.BigInteger), db.type_coerce(t.value_dest, db.BigInteger),
+                       t.currency_src, t.currency_dest])
+    if start:
+        query = query.where(t.datetime >= start)
+    if end:
+        query = query.where(t.datetime < end + timedelta(days=1))
+    if after_id is not None:
+        query = query.where(t.id > after_id)
+    result = db.session.execute(query.execution_options(stream_results=True))
+
+    chunks = []
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        ids, when, type, src, dest, value_src, value_dest, currency_src, currency_dest = zip(*rows)
+        chunks.append((
+            np.fromiter(ids, dtype=np.int64, count=len(rows)),
+            to_datetime64(when),
+            np.fromiter((TYPE_CODES[k] for k in type), dtype=np.int8, count=len(rows)),
+            np.fromiter((-1 if a is None else a for a in src), dtype=np.int64, count=len(rows)),
+            np.fromiter(dest, dtype=np.int64, count=len(rows)),
+            np.fromiter(value_src, dtype=np.int64, count=len(rows)),
+            np.fromiter(value_dest, dtype=np.int64, count=len(rows)),
+            np.array(currency_src, dtype='U5'),
+            np.array(currency_dest, dtype='U5'),
+        ))
+    if chunks:
+        columns = [np.concatenate(column) for column in zip(*chunks)]
+    else:
+        columns = [np.array([], dtype=dtype) for dtype in
+                   (np.int64, 'datetime64[us]', np.int8, np.int64, np.int64, np.int64, np.int64, 'U5', 'U5')]
+    # Dictionary encode currencies as small integers
+    currencies, codes = np.unique(np.concatenate(columns[7:]), return_inverse=True)
+    codes = codes.astype(np.int16)
+    currency_src, currency_dest = codes[:len(columns[0])], codes[len(columns[0]):]
+    return Columns(*columns[:7], currency_src, currency_dest, currencies)
+
+
+def truncate(datetimes: np.ndarray, granularity: str) -> np.ndarray:
+    """Start day of the day, week (starting on Monday), month or year of each datetime"""
+    days = datetimes.astype('datetime64[D]')
+    if granularity == 'day':
+        return days
+    if granularity == 'week':
+        # 1970-01-01, day 0, was a Thursday
+        return days - (days.astype(np.int64) + 3) % 7
+    if granularity == 'month':
+        return datetimes.astype('datetime64[M]').astype('datetime64[D]')
+    if granularity == 'year':
+        return datetimes.astype('datetime64[Y]').astype('datetime64[D]')
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def period_range(start: date, end: date, granularity: str) -> np.ndarray:
+    """Start days of every period overlapping [start, end]"""
+    first, last = truncate(np.array([start, end], dtype='datetime64[D]'), granularity)
+    if granularity in ('day', 'week'):
+        return np.arange(first, last + 1, 7 if granularity == 'week' else 1)
+    unit = 'M' if granularity == 'month' else 'Y'
+    return np.arange(first.astype(f'datetime64[{unit}]'), last.astype(f'datetime64[{unit}]') + 1) \
+        .astype('datetime64[D]')
+
+
+def sum_by(index: np.ndarray, *values: np.ndarray) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Sums values over equal indices
+
+    Returns the distinct indices, sorted, and a sum column per value column.
+    Values are summed in their own dtype with one sort and `np.add.reduceat`,
+    so integer cents are summed exactly.
+    """
+    order = np.argsort(index, kind='stable')
+    index = index[order]
+    starts = np.flatnonzero(np.concatenate([[True], index[1:] != index[:-1]])) if len(index) else \
+        np.zeros(0, dtype=np.intp)
+    return index[starts], [np.add.reduceat(v[order], starts) if len(starts) else v[:0] for v in values]
+
+
+def group_sum(keys: Sequence[np.ndarray], *values: np.ndarray) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """Sums values over the distinct combinations of keys
+
+    Returns the key columns of each group, sorted by the first key then the next,
+    and a sum column per value column.
+    """
+    if len(keys[0]) == 0:
+        return [k[:0] for k in keys], [v[:0] for v in values]
+    uniques, inverses = zip(*(np.unique(k, return_inverse=True) for k in keys))
+    shape = tuple(len(u) for u in uniques)
+    groups, sums = sum_by(np.ravel_multi_index(inverses, shape), *values)
+    group_keys = [u[i] for u, i in zip(uniques, np.unravel_index(groups, shape))]
+    return group_keys, sums
+
+
+class Report:
+    """Table of results, with rows of Python values and amounts as Decimals"""
+    def __init__(self, title: str, columns: List[str], rows: List[Tuple]):
+        self.title = title
+        self.columns = columns
+        self.rows = rows
+
+    def to_dict(self) -> Dict:
+        """Dates as ISO strings and amounts as exact decimal strings, like the API"""
+        return {'title': self.title, 'columns': self.columns,
+                'rows': [[v.isoformat() if isinstance(v, date) else str(v) if isinstance(v, Decimal) else v
+                          for v in row] for row in self.rows]}
+
+
+def _accounts() -> Dict[int, Account]:
+    return {a.id: a for a in Account.query}
+
+
+def _dates(periods: np.ndarray) -> List[date]:
+    return periods.astype('datetime64[D]').astype(object).tolist()
+
+
+def spending_by_category(start: date, end: date, granularity: str = 'month', currency: str = None) -> Report:
+    """Expenses per category and period, in the currency of each category or converted to `currency`"""
+    columns = fetch_columns(start, end)
+    expense = columns.type == TransactionType.expense.value
+    amounts = columns.value_dest[expense]
+    if currency:
+        amounts = rate_table().convert_cents(amounts, columns.currencies[columns.currency_dest[expense]],
+                                             columns.datetime[expense], currency)
+    (periods, categories), (totals,) = group_sum(
+        (truncate(columns.datetime[expense], granularity), columns.dest_account_id[expense]), amounts)
+    accounts = _accounts()
+    rows = [(period, accounts[c].name, currency or accounts[c].currency, from_cents(total))
+            for period, c, total in zip(_dates(periods), categories.tolist(), totals.tolist())]
+    return Report('Spending by category', ['Period', 'Category', 'Currency', 'Total'], rows)
+
+
+def income_vs_expense(start: date, end: date, granularity: str = 'month', currency: str = None) -> Report:
+    """Income and expenses per period and currency, or per period converted to `currency`"""
+    columns = fetch_columns(start, end)
+    income = columns.type == TransactionType.income.value
+    expense = columns.type == TransactionType.expense.value
+    periods = truncate(columns.datetime, granularity)
+    currencies = np.concatenate([columns.currency_dest[income], columns.currency_src[expense]])
+    incomes = np.concatenate([columns.value_dest[income], np.zeros(expense.sum(), dtype=np.int64)])
+    expenses = np.concatenate([np.zeros(income.sum(), dtype=np.int64), columns.value_src[expense]])
+    labels = columns.currencies
+    if currency:
+        table = rate_table()
+        days = np.concatenate([columns.datetime[income], columns.datetime[expense]])
+        incomes = table.convert_cents(incomes, labels[currencies], days, currency)
+        expenses = table.convert_cents(expenses, labels[currencies], days, currency)
+        currencies, labels = np.zeros(len(currencies), dtype=np.int16), np.array([currency])
+    (periods, currencies), (incomes, expenses) = group_sum(
+        (np.concatenate([periods[income], periods[expense]]), currencies), incomes, expenses)
+    rows = [(period, str(labels[c]), from_cents(i), from_cents(e), from_cents(i - e))
+            for period, c, i, e in zip(_dates(periods), currencies.tolist(), incomes.tolist(), expenses.tolist())]
+    return Report('Income vs expense', ['Period', 'Currency', 'Income', 'Expense', 'Net'], rows)
+
+
+def opening_balances(start: date) -> Dict[int, Decimal]:
+    """Balance of every account before start, from grouped sums over both sides of transactions"""
+    balances = {}
+    for account_id, total in db.session.query(Transaction.dest_account_id, db.func.sum(Transaction.value_dest)) \
+            .filter(Transaction.datetime < start).group_by(Transaction.dest_account_id):
+        balances[account_id] = balances.get(account_id, 0) + total
+    for account_id, total in db.session.query(Transaction.src_account_id, db.func.sum(Transaction.value_src)) \
+            .filter(Transaction.datetime < start, Transaction.src_account_id.isnot(None)) \
+            .group_by(Transaction.src_account_id):
+        balances[account_id] = balances.get(account_id, 0) - total
+    return balances
+
+
+def balance_over_time(start: date, end: date, granularity: str = 'month', currency: str = None) -> Report:
+    """Net flow and closing balance of every account (not category) per period
+
+    With `currency`, flows are converted at the rate of each transaction's date
+    and balances at the rate of the last day of each period.
+    """
+    columns = fetch_columns(start, end)
+    accounts = sorted((a for a in _accounts().values() if not a.is_category), key=lambda a: a.id)
+    periods = period_range(start, end, granularity)
+    ids = np.array([a.id for a in accounts], dtype=np.int64)
+
+    # Both sides of every transaction as (datetime, account, amount, currency) postings
+    has_src = columns.src_account_id >= 0
+    when = np.concatenate([columns.datetime, columns.datetime[has_src]])
+    account_ids = np.concatenate([columns.dest_account_id, columns.src_account_id[has_src]])
+    amounts = np.concatenate([columns.value_dest, -columns.value_src[has_src]])
+    # Dense periods x accounts matrices, ignoring postings to categories
+    account_index = np.searchsorted(ids, account_ids)
+    posted = (account_index < len(ids)) & (ids[np.minimum(account_index, len(ids) - 1)] == account_ids) \
+        if len(ids) else np.zeros(len(account_ids), dtype=bool)
+    cells = np.searchsorted(periods, truncate(when[posted], granularity)) * len(ids) + account_index[posted]
+
+    def matrix(values):
+        dense = np.zeros(len(periods) * len(ids), dtype=np.int64)
+        index, (sums,) = sum_by(cells, values)
+        dense[index] = sums
+        return dense.reshape(len(periods), len(ids))
+
+    opening = opening_balances(start)
+    flows = matrix(amounts[posted])
+    balances = np.array([to_cents(opening.get(a.id, 0)) for a in accounts], dtype=np.int64) + np.cumsum(flows, axis=0)
+    if currency and accounts:
+        table = rate_table()
+        labels = columns.currencies[np.concatenate([columns.currency_dest, columns.currency_src[has_src]])]
+        flows = matrix(table.convert_cents(amounts[posted], labels[posted], when[posted], currency))
+        period_ends = np.append(periods[1:] - 1, np.datetime64(end, 'D'))
+        balances = np.column_stack([
+            table.convert_cents(balances[:, a], np.full(len(periods), account.currency), period_ends, currency)
+            for a, account in enumerate(accounts)])
+
+    rows = [(period, account.name, currency or account.currency, from_cents(flows[p, a]), from_cents(balances[p, a]))
+            for p, period in enumerate(_dates(periods)) for a, account in enumerate(accounts)]
+    return Report('Balance over time', ['Period', 'Account', 'Currency', 'Flow', 'Balance'], rows)
+
+
+REPORTS = {
+    'spending': spending_by_category,
+    'cashflow': income_vs_expense,
+    'balance': balance_over_time,
+}
@@ -1,36 +1,204 @@
+import re
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+from elasticsearch.helpers import bulk, BulkIndexError
 from flask import current_app
 
 
-def add_to_index(index, model):
-    if not current_app.elasticsearch:
-        return
+def payload(model):
     payload = {}
     for field in model.__searchable__:
         # TODO: Cleanup nested attribute code
         split = field.split(".")
         if len(split) == 2:
             account = getattr(model, split[0])
-            if account:
-                payload[field] = getattr(account, split[1])
+            payload[field] = getattr(account, split[1]) if account else None
         else:
             payload[field] = getattr(model, field)
-    current_app.elasticsearch.index(index=index, id=model.id, body=payload)
+    return payload
+
+
+class SearchBackend:
+    """Interface of the search index implementations
+
+    Actions are `('index', index, id, payload)` or `('delete', index, id, None)`
+    tuples, and are applied in order.
+    """
+    def bulk(self, actions: List[Tuple]):
+        raise NotImplementedError
+
+    def query(self, index, query, page, per_page, fields=None) -> Tuple[List[int], int]:
+        raise NotImplementedError
+
+    def clear(self, index):
+        raise NotImplementedError
+
+
+class ElasticsearchBackend(SearchBackend):
+    """Index stored in an Elasticsearch cluster, written through the _bulk API"""
+    def __init__(self, client):
+        self.client = client
+
+    def bulk(self, actions):
+        actions = [{'_op_type': op, '_index': index, '_id': id, '_source': payload} if op == 'index' else
+                   {'_op_type': op, '_index': index, '_id': id}
+                   for op, index, id, payload in actions]
+        _, errors = bulk(self.client, actions, chunk_size=len(actions), raise_on_error=False)
+        # Deleting a document that is not indexed is not considered an error
+        errors = [e for e in errors if e.get('delete', {}).get('status') != 404]
+        if errors:
+            raise BulkIndexError(f"{len(errors)} document(s) failed to index.", errors)
+
+    def query(self, index, query, page, per_page, fields=None):
+        fields = fields or ["*"]
+        search = self.client.search(
+            index=index,
+            body={
+                'query': {'multi_match': {'query': query, 'fields': fields}},
+                'from': (page - 1) * per_page, 'size': per_page})
+        ids = [int(hit['_id']) for hit in search['hits']['hits']]
+        return ids, search['hits']['total']['value']
+
+    def clear(self, index):
+        self.client.indices.delete(index=index, ignore=[404])
+
+
+class SQLiteBackend(SearchBackend):
+    """In-process index stored in SQLite FTS5 tables, ranked with bm25
+
+    Each index is a virtual table with a column per searchable field, created
+    with the fields of the first indexed document. Document ids are the rowids.
+    """
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.columns = {}
+
+    @staticmethod
+    def column(field: str) -> str:
+        return field.replace('.', '_')
+
+    def table(self, index) -> Optional[str]:
+        table = f'{index}_fts'
+        if index not in self.columns:
+            columns = [row[1] for row in self.connection.execute(f'PRAGMA table_info("{table}")')]
+            if not columns:
+                return None
+            self.columns[index] = columns
+        return table
+
+    def create(self, index, fields):
+        self.columns[index] = [self.column(f) for f in fields]
+        columns = ', '.join(f'"{c}"' for c in self.columns[index])
+        self.connection.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS "{index}_fts" USING fts5({columns})')
+
+    def bulk(self, actions):
+        with self.lock, self.connection:
+            for op, index, id, payload in actions:
+                table = self.table(index)
+                if table is None:
+                    if op == 'delete':
+                        continue
+                    self.create(index, payload)
+                    table = self.table(index)
+                self.connection.execute(f'DELETE FROM "{table}" WHERE rowid = ?', (id,))
+                if op == 'index':
+                    values = {self.column(f): v for f, v in payload.items()}
+                    columns = self.columns[index]
+                    names = ', '.join(f'"{c}"' for c in columns)
+                    placeholders = ', '.join('?' * (len(columns) + 1))
+                    self.connection.execute(f'INSERT INTO "{table}" (rowid, {names}) VALUES ({placeholders})',
+                                            [id] + [values.get(c) for c in columns])
+
+    def query(self, index, query, page, per_page, fields=None):
+        # Prefix match any of the terms, like a multi_match query, ranking documents matching more of them first
+        terms = ' OR '.join(f'"{term}"*' for term in re.findall(r'\w+', query))
+        with self.lock:
+            table = self.table(index)
+            if table is None or not terms:
+                return [], 0
+            if fields and fields != ["*"]:
+                columns = [c for c in map(self.column, fields) if c in self.columns[index]]
+                if not columns:
+                    return [], 0
+                terms = f'{{{" ".join(columns)}}} : ({terms})'
+            ids = [row[0] for row in self.connection.execute(
+                f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH ? ORDER BY rank LIMIT ? OFFSET ?',
+                (terms, per_page, (page - 1) * per_page))]
+            total, = self.connection.execute(f'SELECT count(*) FROM "{table}" WHERE "{table}" MATCH ?',
+                                             (terms,)).fetchone()
+        return ids, total
+
+    def clear(self, index):
+        with self.lock, self.connection:
+            self.connection.execute(f'DROP TABLE IF EXISTS "{index}_fts"')
+            self.columns.pop(index, None)
+
+
+def create_backend(app) -> Optional[SearchBackend]:
+    backend = app.config.get('SEARCH_BACKEND')
+    if backend == 'elasticsearch':
+        return ElasticsearchBackend(app.elasticsearch) if app.elasticsearch else None
+    if backend == 'sqlite':
+        return SQLiteBackend(app.config['SEARCH_INDEX_PATH'])
+    return None
+
+
+def add_to_index(index, model):
+    if not current_app.search_backend:
+        return
+    current_app.search_backend.bulk([('index', index, model.id, payload(model))])
 
 
 def remove_from_index(index, model):
-    if not current_app.elasticsearch:
+    if not current_app.search_backend:
         return
-    current_app.elasticsearch.delete(index=index, id=model.id)
+    current_app.search_backend.bulk([('delete', index, model.id, None)])
 
 
 def query_index(index, query, page, per_page, fields=None):
-    fields = fields or ["*"]
-    if not current_app.elasticsearch:
+    if not current_app.search_backend:
         return [], 0
-    search = current_app.elasticsearch.search(
-        index=index,
-        body={
-            'query': {'multi_match': {'query': query, 'fields': fields}},
-            'from': (page - 1) * per_page, 'size': per_page})
-    ids = [int(hit['_id']) for hit in search['hits']['hits']]
-    return ids, search['hits']['total']['value']
+    return current_app.search_backend.query(index, query, page, per_page, fields=fields)
+
+
+class BulkIndexer:
+    """Buffers index and delete actions and sends them to the search backend in batches
+
+    Actions are sent once `batch_size` of them are buffered, and on `flush`.
+    """
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or current_app.config['SEARCH_BULK_SIZE']
+        self.actions = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, index, model):
+        if not current_app.search_backend:
+            return
+        self.append(('index', index, model.id, payload(model)))
+
+    def remove(self, index, model):
+        self.delete(index, model.id)
+
+    def delete(self, index, id: int):
+        if not current_app.search_backend:
+            return
+        self.append(('delete', index, id, None))
+
+    def append(self, action: Tuple):
+        self.actions.append(action)
+        if len(self.actions) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        actions, self.actions = self.actions, []
+        if actions and current_app.search_backend:
+            current_app.search_backend.bulk(actions)
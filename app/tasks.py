@@ -0,0 +1,265 @@
+import json
+import threading
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from flask import current_app
+
+from app import db
+from app.importer import import_files
+from app.models import SearchableMixin, Task, Transaction
+from app.search import BulkIndexer
+
+# Functions run by the workers, by task name, called with the task and its arguments
+TASKS = {}
+
+
+def task(name: str):
+    """Registers a function as the task of a name"""
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+class TaskQueue:
+    """Persistent queue of background tasks, stored in the task table and run by worker threads
+
+    Each web process starts `TASK_WORKERS` threads on its first request, and
+    `flask tasks worker` runs them in a process of its own. Workers claim due
+    tasks with a conditional UPDATE, so any number of them share the queue, and
+    a failed task is retried after TASK_RETRY_DELAY seconds, doubled after
+    each attempt. Running tasks send a heartbeat every TASK_HEARTBEAT_INTERVAL
+    seconds, and are claimed again once it stops for TASK_TIMEOUT seconds. The
+    queue is eager, running nothing in the background, with no workers or an
+    in-memory database, which is private to its connection.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.workers = app.config['TASK_WORKERS']
+        self.eager = self.workers == 0 or \
+            app.config['SQLALCHEMY_DATABASE_URI'] in ('sqlite://', 'sqlite:///:memory:')
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.lock = threading.Lock()
+        if not self.eager:
+            app.before_first_request(self.start)
+
+    def enqueue(self, name: str, session=None, max_attempts: int = None, **arguments) -> Task:
+        """Adds a task to the session, written and visible to the workers with its commit"""
+        session = session or db.session
+        task = Task(name=name, arguments=json.dumps(arguments),
+                    max_attempts=max_attempts or self.app.config['TASK_MAX_ATTEMPTS'])
+        session.add(task)
+        session.info['tasks_enqueued'] = True
+        return task
+
+    def submit(self, name: str, **arguments) -> Task:
+        """Queues a task on its own, committing it at once"""
+        task = self.enqueue(name, **arguments)
+        db.session.commit()
+        return task
+
+    def enqueue_index(self, session, objects: Iterable, deleted: Iterable):
+        """Queues one index task per search index for the ids of objects written and deleted"""
+        changes = defaultdict(lambda: ([], []))
+        for obj in objects:
+            changes[obj.__tablename__][0].append(obj.id)
+        for obj in deleted:
+            changes[obj.__tablename__][1].append(obj.id)
+        for index, (ids, removed) in changes.items():
+            self.enqueue('index', session, index=index, ids=ids, deleted=removed)
+
+    def start(self):
+        """Starts the worker threads of this process, once"""
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.work, name=f'task-worker-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def work(self):
+        """Runs due tasks until stopped, waiting for new ones in between"""
+        while not self.stopping.is_set():
+            ran = False
+            with self.app.app_context():
+                try:
+                    ran = self.run_next()
+                except Exception:
+                    self.app.logger.exception('Task worker failed to claim a task')
+                finally:
+                    db.session.remove()
+            if not ran:
+                self.wakeup.wait(self.app.config['TASK_POLL_INTERVAL'])
+                self.wakeup.clear()
+
+    def run_pending(self) -> int:
+        """Runs the due tasks in this thread until none is left, returns how many ran"""
+        count = 0
+        while self.run_next():
+            count += 1
+        return count
+
+    def run_next(self) -> bool:
+        task = self.claim()
+        if task is None:
+            return False
+        self.run(task)
+        return True
+
+    def claim(self) -> Optional[Task]:
+        """Marks the oldest due task running, including tasks without a heartbeat for TASK_TIMEOUT seconds
+
+        Polls finding nothing to claim end with a rollback, writing nothing.
+        """
+        t = Task.__table__.c
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.app.config['TASK_TIMEOUT'])
+        due = db.or_(db.and_(t.status == 'queued', t.run_after <= now),
+                     db.and_(t.status == 'running', t.heartbeat < stale))
+        while True:
+            row = db.session.execute(db.select([t.id, t.status, t.attempts]).where(due).order_by(t.id).limit(1)) \
+                .first()
+            if row is None:
+                db.session.rollback()
+                return None
+            # Only one of the workers reading the same row updates it
+            claimed = db.session.execute(
+                Task.__table__.update()
+                .where(db.and_(t.id == row.id, t.status == row.status, t.attempts == row.attempts))
+                .values(status='running', started=now, heartbeat=now, attempts=row.attempts + 1)).rowcount
+            if claimed:
+                db.session.commit()
+                return Task.query.get(row.id)
+            db.session.rollback()
+
+    def run(self, task: Task):
+        """Runs a claimed task, queueing it again with a delay if it fails and attempts are left"""
+        try:
+            function = TASKS.get(task.name)
+            if function is None:
+                raise LookupError(f'unknown task {task.name}')
+            with self.heartbeat(task.id):
+                function(task, **json.loads(task.arguments))
+        except Exception as e:
+            db.session.rollback()
+            task.error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+            if task.attempts < task.max_attempts:
+                task.status = 'queued'
+                task.run_after = datetime.utcnow() + timedelta(seconds=self.retry_delay(task.attempts))
+            else:
+                task.status = 'failed'
+                task.finished = datetime.utcnow()
+            self.app.logger.warning(f'{task} attempt {task.attempts} of {task.max_attempts} failed: {task.error}')
+        else:
+            task.status = 'done'
+            task.finished = datetime.utcnow()
+            task.error = None
+        db.session.commit()
+
+    @contextmanager
+    def heartbeat(self, task_id: int):
+        """Marks a task alive every TASK_HEARTBEAT_INTERVAL seconds while it runs, from a thread of its own
+
+        Eager queues run tasks in the process writing them, which nothing else claims.
+        """
+        if self.eager:
+            yield
+            return
+        done = threading.Event()
+        thread = threading.Thread(target=self.beat, args=(task_id, done), name=f'task-heartbeat-{task_id}',
+                                  daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def beat(self, task_id: int, done: threading.Event):
+        # Written through a connection of its own, as the session is busy running the task
+        table = Task.__table__
+        while not done.wait(self.app.config['TASK_HEARTBEAT_INTERVAL']):
+            try:
+                with db.get_engine(self.app).begin() as connection:
+                    connection.execute(table.update().where(db.and_(table.c.id == task_id, table.c.status == 'running'))
+                                       .values(heartbeat=datetime.utcnow()))
+            except Exception:
+                self.app.logger.exception(f'Heartbeat of task {task_id} failed')
+
+    def retry_delay(self, attempts: int) -> float:
+        return self.app.config['TASK_RETRY_DELAY'] * 2 ** (attempts - 1)
+
+
+def notify_workers(session):
+    """Wakes up the idle workers of this process once tasks are committed"""
+    if session.info.pop('tasks_enqueued', None):
+        current_app.tasks.wakeup.set()
+
+
+def forget_tasks(session):
+    session.info.pop('tasks_enqueued', None)
+
+
+db.event.listen(db.session, 'after_commit', notify_workers)
+db.event.listen(db.session, 'after_rollback', forget_tasks)
+
+
+def searchable_model(index: str):
+    return next(model for model in SearchableMixin.__subclasses__() if model.__tablename__ == index)
+
+
+@task('index')
+def index_documents(task: Task, index: str, ids: List[int], deleted: List[int]):
+    """Indexes the documents as they are now, and deletes the ones no longer stored
+
+    Reading the current rows makes the task idempotent, and independent of the
+    order tasks of successive commits run in.
+    """
+    model = searchable_model(index)
+    ids = set(ids) | set(deleted)
+    found = set()
+    with BulkIndexer() as indexer:
+        batch_size = indexer.batch_size
+        ordered = sorted(ids)
+        for i in range(0, len(ordered), batch_size):
+            for obj in model.query.filter(model.id.in_(ordered[i:i + batch_size])).order_by(model.id):
+                indexer.add(index, obj)
+                found.add(obj.id)
+        for id in sorted(ids - found):
+            indexer.delete(index, id)
+
+
+@task('reindex')
+def reindex(task: Task, index: str):
+    searchable_model(index).reindex()
+
+
+@task('import')
+def import_exports(task: Task, csv_files: List[str], chunk_size: int = None, workers: int = None,
+                   rules: str = None):
+    """Imports exports like import.py, storing the progress on the task in the commit of each chunk
+
+    The search index is rebuilt by a task of its own, queued with the completion
+    of this one, so a failing index is retried without importing again.
+    """
+    def progress(count, rate):
+        task.progress = f'Imported {count} transactions ({rate:.0f} rows/s)'
+
+    importer = import_files(csv_files, chunk_size or current_app.config['IMPORT_CHUNK_SIZE'], workers, progress,
+                            reindex=False, rules=rules)
+    task.progress = f'Imported {importer.count} transactions, skipped {importer.skipped} already in the ledger'
+    if importer.count:
+        current_app.tasks.enqueue('reindex', index=Transaction.__tablename__)
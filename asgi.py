@@ -0,0 +1,10 @@
+"""ASGI entry point, e.g. `uvicorn asgi:app --workers 1`
+
+Flask views and SQLAlchemy sessions are synchronous, so the adapter runs
+each request of the WSGI app in the thread pool of the event loop.
+"""
+from app.asgi import ThreadPoolWsgiToAsgi
+
+from xpense import app as wsgi_app
+
+app = ThreadPoolWsgiToAsgi(wsgi_app)
@@ -0,0 +1,4 @@
+"""Benchmarks of the ledger on reproducible synthetic data
+
+Usage: python -m benchmarks [--rows N] [--seed S] [--suite NAME ...] [--output FILE]
+"""
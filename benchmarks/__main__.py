@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import tempfile
+from datetime import date
+
+from app import create_app, db
+from benchmarks import bench_api, bench_categorize, bench_ledger, bench_reports
+from benchmarks.harness import Recorder, bench_config, compare, ROOT
+from benchmarks.ledger import LedgerSpec
+
+SUITES = dict(bench_ledger.SUITES, **bench_reports.SUITES, **bench_categorize.SUITES,
+              **bench_api.SUITES)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks the ledger on a synthetic one")
+    parser.add_argument('--rows', type=int, default=100000, help="Transactions in the ledger")
+    parser.add_argument('--accounts', type=int, default=20)
+    parser.add_argument('--categories', type=int, default=60)
+    parser.add_argument('--currencies', type=int, default=3)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--end', type=date.fromisoformat, help="Last day of the ledger, defaults to today")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--suite', action='append', choices=sorted(SUITES),
+                        help="Suites to run after the import, all by default")
+    parser.add_argument('--workdir', help="Directory for the database and search index, a temporary one by default")
+    parser.add_argument('--output', help="JSON results file, under benchmarks/results by default")
+    parser.add_argument('--compare', help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+
+    spec = LedgerSpec(rows=args.rows, accounts=args.accounts, categories=args.categories,
+                      currencies=args.currencies, years=args.years, end=args.end, seed=args.seed)
+    recorder = Recorder(spec)
+    with tempfile.TemporaryDirectory() as directory:
+        directory = args.workdir or directory
+        os.makedirs(directory, exist_ok=True)
+        app = create_app(bench_config(directory))
+        with app.app_context():
+            db.drop_all()
+            bench_ledger.populate(recorder, app, spec, directory)
+            for name in args.suite or SUITES:
+                SUITES[name](recorder, app, spec)
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         f"{recorder.to_dict()['meta']['time'].replace(':', '')}-{spec.rows}.json")
+    recorder.dump(output)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print()
+        for change in compare(baseline, recorder.to_dict()):
+            print(f"{change['suite'] + '.' + change['name']:<36} {change['change']:+8.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""Requests per second of the HTML pages and the JSON API, served as WSGI and through the ASGI adapter"""
+from app import db
+from app.asgi import ThreadPoolWsgiToAsgi
+from app.models import Account
+from benchmarks.ledger import LedgerSpec
+from benchmarks.load import run, run_asgi, client_fetcher
+
+
+def bench_api(recorder, app, spec: LedgerSpec, clients: int = 8, requests: int = 50):
+    account = Account.query.filter_by(name='Account 0').first()
+    pages = {
+        'feed_html': '/index',
+        'feed_json': '/api/v1/transactions?limit=10',
+        'account_html': f'/account/{account.id}',
+        'account_json': f'/api/v1/transactions?account={account.id}&limit=10',
+        'accounts_html': '/accounts',
+        'accounts_json': '/api/v1/accounts',
+        'summaries_json': f'/api/v1/accounts/{account.id}/summaries',
+    }
+    db.session.remove()
+    fetch = client_fetcher(app)
+    asgi_app = ThreadPoolWsgiToAsgi(app)
+    # The same paths at the same concurrency, from threads calling the WSGI app and tasks calling the ASGI one
+    for name, path in pages.items():
+        recorder.add('api', f'{name}_wsgi', run(fetch, [path], clients, requests))
+        recorder.add('api', f'{name}_asgi', run_asgi(asgi_app, [path], clients, requests))
+
+
+SUITES = {
+    'api': bench_api,
+}
@@ -0,0 +1,38 @@
+"""Throughput of the expense categorizer on the rows of a synthetic ledger"""
+from decimal import Decimal
+from typing import List
+
+from app.categorizer import Categorizer, Rule
+from app.importer import parse_entry
+from benchmarks.ledger import HEADER, PLACES, WORDS, LedgerSpec, generate_entries
+
+
+def synthetic_rules(count: int) -> List[Rule]:
+    """Keyword rules per word and amount band, pattern rules per place, then unmatched keywords up to count"""
+    rules = []
+    for word in WORDS:
+        for low in range(0, 100, 20):
+            rules.append(Rule(f'{word} {low}', keyword=word, field='description',
+                              min_amount=Decimal(low), max_amount=Decimal(low + 20)))
+    rules.extend(Rule(place, pattern=f'^{place}$', field='where') for place in PLACES)
+    rules.extend(Rule(f'Other {i}', keyword=f'shop {i}') for i in range(max(count - len(rules), 0)))
+    return rules
+
+
+def bench_categorize(recorder, app, spec: LedgerSpec, rules: int = 1000):
+    rows = [parse_entry(dict(zip(HEADER, entry))) for entry in generate_entries(spec)]
+    ordered = synthetic_rules(rules)
+    categorizer = recorder.timed('categorize', f'compile_{len(ordered)}_rules', len(ordered), Categorizer, ordered,
+                                 unit='rules')
+    recorder.timed('categorize', f'combined_{len(ordered)}_rules', len(rows),
+                   lambda: [categorizer.classify(values) for values in rows])
+    # Every rule tested in order, on a sample as it slows down with the number of rules
+    sample = rows[:max(len(rows) // 20, 1)]
+    recorder.timed('categorize', f'one_by_one_{len(ordered)}_rules', len(sample),
+                   lambda: [next((i for i, rule in enumerate(ordered) if rule.matches(values)), None)
+                            for values in sample])
+
+
+SUITES = {
+    'categorize': bench_categorize,
+}
@@ -0,0 +1,136 @@
+"""Import, feed paging, account views, search and single writes on a synthetic ledger"""
+import itertools
+import os
+from datetime import datetime, time, timedelta
+
+from app import db
+from app.currency import load_rates_csv
+from app.importer import Importer, read_csv
+from app.ledger import Ledger, reconcile
+from app.models import Account, AccountSummary, BalanceSnapshot, Transaction, TransactionType
+from app.pagination import encode_cursor, paginate_keyset
+from app.search import query_index
+from benchmarks.ledger import LedgerSpec, write_csv, write_rates_csv, WORDS
+
+SUITE = 'ledger'
+
+
+def populate(recorder, app, spec: LedgerSpec, directory: str):
+    """Generates the ledger and writes it through the importer, like import.py"""
+    path = os.path.join(directory, 'ledger.csv')
+    recorder.timed('import', 'generate_csv', spec.rows, write_csv, path, spec)
+    rates = os.path.join(directory, 'rates.csv')
+    count = write_rates_csv(rates, spec, app.config['BASE_CURRENCY'])
+    db.create_all()
+    importer = Importer(chunk_size=app.config['IMPORT_CHUNK_SIZE'])
+    recorder.timed('import', 'importer', spec.rows, lambda: importer.run(read_csv(path)))
+    recorder.timed('import', 'load_rates', count, load_rates_csv, rates)
+    recorder.timed('import', 'rebuild_summaries', spec.rows, AccountSummary.rebuild)
+    recorder.timed('import', 'reindex', spec.rows, Transaction.reindex)
+    recorder.timed('import', 'reconcile', spec.rows, reconcile)
+    recorder.timed('import', 'snapshots', spec.rows, BalanceSnapshot.take, app.config['BALANCE_SNAPSHOT_INTERVAL'])
+    db.session.remove()
+
+
+def bench_paging(recorder, app, spec: LedgerSpec, pages: int = 50):
+    client = app.test_client()
+    recorder.repeat('paging', 'index_first_page', pages, client.get, '/index')
+    # Cursors of consecutive pages from the top, and of pages deep into the feed
+    cursors, page = [], paginate_keyset(Transaction.query, app.config['TRANSACTIONS_PER_PAGE'])
+    while page.next_cursor and len(cursors) < pages:
+        cursors.append(page.next_cursor)
+        page = paginate_keyset(Transaction.query, app.config['TRANSACTIONS_PER_PAGE'], after=page.next_cursor)
+    follow = itertools.cycle(cursors)
+    recorder.repeat('paging', 'index_next_pages', pages, lambda: client.get('/index', query_string={
+        'after': next(follow)}))
+    oldest = Transaction.query.order_by(Transaction.datetime.asc(), Transaction.id.asc()) \
+        .offset(spec.rows // 10).limit(pages).all()
+    deep = itertools.cycle([encode_cursor(t) for t in oldest])
+    recorder.repeat('paging', 'index_deep_pages', pages, lambda: client.get('/index', query_string={
+        'after': next(deep)}))
+    db.session.remove()
+
+
+def bench_views(recorder, app, spec: LedgerSpec, times: int = 20):
+    client = app.test_client()
+    account = Account.query.filter_by(name='Account 0').first()
+    category = Account.query.filter_by(is_category=True).first()
+    recorder.repeat('views', 'accounts', times, client.get, '/accounts')
+    recorder.repeat('views', 'account', times, client.get, f'/account/{account.id}')
+    recorder.repeat('views', 'category', times, client.get, f'/account/{category.id}')
+    recorder.repeat('views', 'sum_cur_month', times, account.sum_cur_month)
+    recorder.repeat('views', 'transactions_cur_month', times, account.transactions_cur_month)
+    recorder.repeat('views', 'trend', times, account.trend)
+    db.session.remove()
+
+
+def bench_search(recorder, app, spec: LedgerSpec, times: int = 20):
+    client = app.test_client()
+    terms = itertools.cycle(WORDS)
+    per_page = app.config['TRANSACTIONS_PER_PAGE']
+    recorder.repeat('search', 'query_index', times, lambda: query_index(
+        Transaction.__tablename__, next(terms), 1, per_page))
+    recorder.repeat('search', 'search_page', times, lambda: client.get('/search', query_string={
+        'q': next(terms)}))
+    db.session.remove()
+
+
+def bench_writes(recorder, app, spec: LedgerSpec, count: int = 200):
+    """Transactions posted one commit each, like the add forms, and as a single batch, like the API"""
+    account = Account.query.filter_by(name='Account 0').first()
+    category = Account.query.filter_by(is_category=True, currency=account.currency).first()
+    when = [datetime.combine(spec.end, time(12)) - timedelta(days=i % 30) for i in range(count)]
+
+    def expense(i):
+        return Transaction(type=TransactionType.expense, description=f'Benchmark {i}', datetime=when[i],
+                           value_src=1.0, currency_src=account.currency,
+                           value_dest=1.0, currency_dest=category.currency)
+
+    def add_one_by_one():
+        for i in range(count):
+            with Ledger() as ledger:
+                ledger.post(expense(i), account, category)
+
+    def add_batch():
+        with Ledger() as ledger:
+            for i in range(count):
+                ledger.post(expense(i), account, category)
+    recorder.timed('writes', 'post_one_by_one', count, add_one_by_one, unit='transactions')
+    recorder.timed('writes', 'post_batch', count, add_batch, unit='transactions')
+    db.session.remove()
+
+
+def bench_journal(recorder, app, spec: LedgerSpec, times: int = 20, intervals=(0, 100, 1000, 10000)):
+    """Past balances and backdated postings with snapshots every interval postings, 0 for none"""
+    account = Account.query.filter_by(name='Account 0').first()
+    category = Account.query.filter_by(is_category=True, currency=account.currency).first()
+    end = datetime.combine(spec.end, time(0))
+    moments = [end - timedelta(days=(365 * spec.years * i) // times) for i in range(times)]
+
+    def backdated_posts():
+        for i, when in enumerate(moments):
+            with Ledger() as ledger:
+                ledger.post(Transaction(type=TransactionType.expense, description=f'Backdated {i}',
+                                        datetime=when + timedelta(hours=12), value_src=1.0,
+                                        currency_src=account.currency, value_dest=1.0,
+                                        currency_dest=category.currency), account, category)
+
+    for interval in intervals:
+        if interval:
+            recorder.timed('journal', f'take_{interval}', spec.rows, BalanceSnapshot.take, interval, True)
+        else:
+            BalanceSnapshot.query.delete()
+            db.session.commit()
+        balances = itertools.cycle(moments)
+        recorder.repeat('journal', f'balance_at_{interval}', times, lambda: account.balance_at(next(balances)))
+        recorder.timed('journal', f'backdated_posts_{interval}', times, backdated_posts, unit='transactions')
+    db.session.remove()
+
+
+SUITES = {
+    'paging': bench_paging,
+    'views': bench_views,
+    'search': bench_search,
+    'writes': bench_writes,
+    'journal': bench_journal,
+}
@@ -0,0 +1,44 @@
+"""Throughput of the report engine and summaries on a synthetic ledger"""
+from app import db
+from app.columns import ColumnStore
+from app.reports import fetch_columns, group_sum, truncate, spending_by_category, income_vs_expense, balance_over_time
+from benchmarks.ledger import LedgerSpec
+
+
+def bench_reports(recorder, app, spec: LedgerSpec):
+    rows = spec.rows
+    columns = recorder.timed('reports', 'fetch_columns', rows, fetch_columns)
+    recorder.add('reports', 'columns_memory', {'mib': sum(a.nbytes for a in vars(columns).values()) / 2 ** 20})
+    # Vectorized aggregation alone, on the fetched columns
+    recorder.timed('reports', 'group_sum', rows, lambda: group_sum(
+        (truncate(columns.datetime, 'month'), columns.dest_account_id), columns.value_dest))
+    # Whole reports, including their fetch
+    run_reports(recorder, app, spec)
+
+    # The same reports answered from the in-memory column store
+    store, app.columns = app.columns, ColumnStore()
+    try:
+        recorder.timed('reports', 'column_store_load', rows, app.columns.load)
+        recorder.add('reports', 'column_store_memory', {
+            'mib_per_million_rows': app.columns.memory()['bytes_per_million_rows'] / 2 ** 20})
+        run_reports(recorder, app, spec, suffix='_store')
+    finally:
+        app.columns = store
+    db.session.remove()
+
+
+def run_reports(recorder, app, spec: LedgerSpec, suffix: str = ''):
+    rows = spec.rows
+    span = (spec.start, spec.end)
+    currency = app.config['BASE_CURRENCY']
+    for granularity in ('day', 'month'):
+        recorder.timed('reports', f'spending_{granularity}{suffix}', rows, spending_by_category, *span, granularity)
+        recorder.timed('reports', f'cashflow_{granularity}{suffix}', rows, income_vs_expense, *span, granularity)
+    recorder.timed('reports', f'cashflow_month_converted{suffix}', rows, income_vs_expense, *span, 'month', currency)
+    recorder.timed('reports', f'balance_month{suffix}', rows, balance_over_time, *span, 'month')
+    recorder.timed('reports', f'balance_month_converted{suffix}', rows, balance_over_time, *span, 'month', currency)
+
+
+SUITES = {
+    'reports': bench_reports,
+}
@@ -0,0 +1,115 @@
+"""Timing and machine-readable results of benchmark runs"""
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from config import Config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_RECORD_QUERIES = False
+    PROFILING = False
+    ELASTICSEARCH_URL = None
+    SEARCH_BACKEND = 'sqlite'
+    WTF_CSRF_ENABLED = False
+
+
+def bench_config(directory: str) -> type:
+    """Configuration storing the database and search index of a run in `directory`"""
+    class RunConfig(BenchConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(directory, 'bench.db')
+        SEARCH_INDEX_PATH = os.path.join(directory, 'search.db')
+    return RunConfig
+
+
+class Recorder:
+    """Collects the results of a run
+
+    `timed` measures one call processing `count` items, `repeat` the latency of
+    a call made `times` times. Results are printed as they are recorded.
+    """
+    def __init__(self, spec):
+        self.spec = spec
+        self.results = []
+
+    def add(self, suite: str, name: str, result: Dict):
+        result = dict(suite=suite, name=name, **result)
+        self.results.append(result)
+        if 'rate' in result:
+            print(f"{suite + '.' + name:<36} {result['seconds']:9.3f}s {result['rate']:12.0f} {result['unit']}/s")
+        elif 'median_ms' in result:
+            print(f"{suite + '.' + name:<36} {result['median_ms']:9.3f}ms median {result['p95_ms']:9.3f}ms p95")
+        else:
+            print(f"{suite + '.' + name:<36} " + ' '.join(f'{k}={v}' for k, v in result.items()
+                                                         if k not in ('suite', 'name')))
+
+    def timed(self, suite: str, name: str, count: int, function: Callable, *args, unit: str = 'rows'):
+        start = time.perf_counter()
+        value = function(*args)
+        seconds = time.perf_counter() - start
+        self.add(suite, name, {'seconds': seconds, 'count': count, 'unit': unit,
+                               'rate': count / seconds if seconds else 0.0})
+        return value
+
+    def repeat(self, suite: str, name: str, times: int, function: Callable, *args):
+        samples = []
+        for _ in range(times):
+            start = time.perf_counter()
+            function(*args)
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        self.add(suite, name, {'times': times, 'median_ms': statistics.median(samples),
+                               'p95_ms': samples[min(times - 1, int(0.95 * times))],
+                               'min_ms': samples[0], 'max_ms': samples[-1]})
+
+    def to_dict(self) -> Dict:
+        return {'meta': metadata(), 'ledger': self.spec.to_dict(), 'results': self.results}
+
+    def dump(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+def metadata() -> Dict:
+    """Environment of a run, to tell apart results of different code and machines"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'time': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(baseline: Dict, current: Dict) -> List[Dict]:
+    """Relative change of every result present in both runs, positive when `current` is faster"""
+    before = {(r['suite'], r['name']): r for r in baseline['results']}
+    changes = []
+    for result in current['results']:
+        old = before.get((result['suite'], result['name']))
+        if not old:
+            continue
+        if 'rate' in result and old.get('rate'):
+            change = result['rate'] / old['rate'] - 1
+        elif 'median_ms' in result and result['median_ms']:
+            change = old['median_ms'] / result['median_ms'] - 1
+        else:
+            continue
+        changes.append({'suite': result['suite'], 'name': result['name'], 'change': change})
+    return changes
@@ -0,0 +1,132 @@
+"""Reproducible synthetic ledgers, written in the `;` delimited export format"""
+import csv
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+HEADER = ['Type', 'Time', 'Source', 'Destination', 'Currency', 'Amount', 'Comment',
+          'Source category currency', 'Source value', 'Destination category currency', 'Destination value']
+
+CURRENCIES = ('EUR', 'CHF', 'USD', 'GBP')
+WORDS = ('coffee', 'groceries', 'rent', 'train', 'dinner', 'books', 'cinema', 'pharmacy', 'fuel', 'gym',
+         'lunch', 'taxi', 'flight', 'hotel', 'insurance', 'phone', 'internet', 'clothes', 'gift', 'bakery')
+PLACES = ('Lisbon', 'Porto', 'Zurich', 'Geneva', 'London', 'Berlin', 'Paris', 'Madrid', 'Online', 'Airport')
+# Entries are drawn in chunks, each from a generator seeded with the seed and offset of the chunk
+CHUNK_SIZE = 100000
+
+
+class LedgerSpec:
+    """Shape of a synthetic ledger
+
+    The same spec and seed always produce the same entries and rates. Entries
+    are spread uniformly over `years` ending on `end`, so the current month
+    views have data when `end` is today.
+    """
+    def __init__(self, rows: int = 100000, accounts: int = 20, categories: int = 60,
+                 currencies: int = 3, years: int = 5, end: date = None, seed: int = 0):
+        self.rows = rows
+        self.accounts = accounts
+        self.categories = categories
+        self.currencies = CURRENCIES[:currencies]
+        self.years = years
+        self.end = end or date.today()
+        self.seed = seed
+
+    @property
+    def start(self) -> date:
+        return self.end - timedelta(days=365 * self.years)
+
+    def to_dict(self) -> Dict:
+        return {'rows': self.rows, 'accounts': self.accounts, 'categories': self.categories,
+                'currencies': list(self.currencies), 'years': self.years,
+                'start': self.start.isoformat(), 'end': self.end.isoformat(), 'seed': self.seed}
+
+
+def generate_entries(spec: LedgerSpec) -> Iterator[List]:
+    """Yields rows of the export, oldest first
+
+    The ledger opens with the initial balance of every account, so the importer
+    creates them as accounts, followed by about 85% expenses, 10% transfers and
+    5% incomes. Accounts and categories get currencies round-robin, and entries
+    between two currencies carry both values like the exports do.
+    """
+    rng = np.random.default_rng(spec.seed)
+    account_currency = [spec.currencies[i % len(spec.currencies)] for i in range(spec.accounts)]
+    category_currency = [spec.currencies[i % len(spec.currencies)] for i in range(spec.categories)]
+    start = datetime.combine(spec.start, datetime.min.time())
+    span = int((spec.end - spec.start).total_seconds()) + 86399
+    # Sorted offsets, drawn in one go so chunking does not change the ledger
+    seconds = np.sort(rng.integers(0, span, size=spec.rows))
+    seconds[:spec.accounts] = 0
+
+    for offset in range(0, spec.rows, CHUNK_SIZE):
+        n = min(CHUNK_SIZE, spec.rows - offset)
+        rng = np.random.default_rng([spec.seed, offset])
+        kinds = rng.choice(3, size=n, p=[0.85, 0.10, 0.05])
+        src = rng.integers(0, spec.accounts, size=n)
+        dest_account = rng.integers(0, spec.accounts, size=n)
+        dest_category = rng.integers(0, spec.categories, size=n)
+        amounts = np.round(rng.lognormal(3, 1, size=n), 2)
+        rates = np.round(rng.uniform(0.8, 1.25, size=n), 4)
+        words = rng.integers(0, len(WORDS), size=n)
+        places = rng.integers(0, len(PLACES), size=n)
+        for i in range(n):
+            when = (start + timedelta(seconds=int(seconds[offset + i]))).strftime('%d/%m/%Y %H:%M:%S')
+            amount = f'{amounts[i]:.2f}'
+            comment = f'{WORDS[words[i]].capitalize()} {offset + i} @ {PLACES[places[i]]}'
+            if offset + i < spec.accounts:
+                account = offset + i
+                yield ['Income', when, '', f'Account {account}', account_currency[account], '1000.00',
+                       'Initial balance', '', '', '', '']
+                continue
+            if kinds[i] == 2:
+                currency = account_currency[dest_account[i]]
+                yield ['Income', when, '', f'Account {dest_account[i]}', currency, amount, comment, '', '', '', '']
+                continue
+            if kinds[i] == 0:
+                kind, dest = 'Expenses', f'Category {dest_category[i]}'
+                dest_currency = category_currency[dest_category[i]]
+            else:
+                kind, dest = 'Transfer', f'Account {dest_account[i]}'
+                dest_currency = account_currency[dest_account[i]]
+            currency = account_currency[src[i]]
+            if dest_currency == currency:
+                yield [kind, when, f'Account {src[i]}', dest, currency, amount, comment, '', '', '', '']
+            else:
+                yield [kind, when, f'Account {src[i]}', dest, currency, amount, comment,
+                       currency, amount, dest_currency, f'{amounts[i] * rates[i]:.2f}']
+
+
+def generate_rates(spec: LedgerSpec, base: str = 'EUR') -> Iterator[List]:
+    """Yields a daily (date, currency, rate) random walk against `base` for every other currency"""
+    rng = np.random.default_rng(spec.seed + 1)
+    days = (spec.end - spec.start).days + 1
+    for currency in spec.currencies:
+        if currency == base:
+            continue
+        rates = rng.uniform(0.8, 1.25) * np.exp(np.cumsum(rng.normal(0, 0.004, size=days)))
+        for day, rate in enumerate(rates):
+            yield [(spec.start + timedelta(days=day)).isoformat(), currency, f'{rate:.6f}']
+
+
+def write_csv(path: str, spec: LedgerSpec) -> int:
+    """Writes the entries of a ledger as an export file, returns the number of entries"""
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file, delimiter=';')
+        writer.writerow(HEADER)
+        for entry in generate_entries(spec):
+            writer.writerow(entry)
+    return spec.rows
+
+
+def write_rates_csv(path: str, spec: LedgerSpec, base: str = 'EUR') -> int:
+    """Writes the exchange rates of a ledger in the format of `flask ledger load-rates`"""
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file, delimiter=';')
+        writer.writerow(['Date', 'Currency', 'Rate'])
+        for row in generate_rates(spec, base):
+            writer.writerow(row)
+            count += 1
+    return count
@@ -0,0 +1,119 @@
+"""Concurrent load on the app, in process or over HTTP against a running server
+
+    python -m benchmarks.load http://localhost:8000 /api/v1/transactions /index --clients 16 --requests 200
+"""
+import argparse
+import asyncio
+import itertools
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, List
+from urllib.parse import urlsplit
+
+
+def run(fetch: Callable[[str], int], paths: List[str], clients: int, requests: int) -> Dict:
+    """Issues `requests` requests from each of `clients` threads, cycling through the paths
+
+    `fetch` returns the status code of a path. Returns the number of
+    requests, of errors (status 400 and above) and the requests per second.
+    """
+    errors = []
+    barrier = threading.Barrier(clients + 1)
+
+    def client(offset):
+        cycle = itertools.islice(itertools.cycle(paths), offset, None)
+        barrier.wait()
+        for path in itertools.islice(cycle, requests):
+            if fetch(path) >= 400:
+                errors.append(path)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    count = clients * requests
+    return {'seconds': seconds, 'count': count, 'errors': len(errors), 'unit': 'requests',
+            'rate': count / seconds if seconds else 0.0}
+
+
+def run_asgi(app, paths: List[str], clients: int, requests: int) -> Dict:
+    """Like `run`, with `clients` tasks of one event loop calling an ASGI app, as an ASGI server does"""
+    errors = []
+
+    async def fetch(path):
+        url = urlsplit(path)
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                 'scheme': 'http', 'path': url.path, 'raw_path': url.path.encode(), 'root_path': '',
+                 'query_string': url.query.encode(), 'headers': [(b'host', b'localhost')],
+                 'client': ('127.0.0.1', 0), 'server': ('localhost', 80)}
+        status = None
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+        await app(scope, receive, send)
+        return status
+
+    async def client(offset):
+        for path in itertools.islice(itertools.cycle(paths), offset, offset + requests):
+            if await fetch(path) >= 400:
+                errors.append(path)
+
+    async def main():
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(clients)))
+        return time.perf_counter() - start
+
+    seconds = asyncio.run(main())
+    count = clients * requests
+    return {'seconds': seconds, 'count': count, 'errors': len(errors), 'unit': 'requests',
+            'rate': count / seconds if seconds else 0.0}
+
+
+def http_fetcher(base_url: str) -> Callable[[str], int]:
+    def fetch(path):
+        try:
+            with urllib.request.urlopen(base_url.rstrip('/') + path) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return fetch
+
+
+def client_fetcher(app) -> Callable[[str], int]:
+    """Requests through a test client of the app per thread, without a server"""
+    local = threading.local()
+
+    def fetch(path):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return local.client.get(path).status_code
+    return fetch
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description="Requests per second of a server")
+    parser.add_argument('base_url', help="e.g. http://localhost:8000")
+    parser.add_argument('paths', nargs='+', help="Paths requested in turn, each measured separately")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent clients")
+    parser.add_argument('--requests', type=int, default=100, help="Requests per client")
+    args = parser.parse_args()
+    fetch = http_fetcher(args.base_url)
+    for path in args.paths:
+        result = run(fetch, [path], args.clients, args.requests)
+        print(f"{path:<48} {result['rate']:9.1f} requests/s {result['errors']:6d} errors")
+
+
+if __name__ == '__main__':
+    main()
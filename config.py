@@ -12,9 +12,112 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'app.db')
     # Disable signaling the application on every DB change
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Report the number and duration of SQL queries of each request
+    SQLALCHEMY_RECORD_QUERIES = bool(os.environ.get('SQLALCHEMY_RECORD_QUERIES'))
+    # Log a warning for requests issuing more queries than this
+    SQL_QUERIES_WARNING_COUNT = 20
+
+    # Connections kept open per database and process, and opened beyond them under load
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 5)
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW') or 10)
+    # Seconds a request waits for a free connection before failing
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT') or 30)
+    # Server databases only, seconds after which a connection is reopened and
+    # whether connections are tested when checked out, surviving server restarts
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE') or 1800)
+    DATABASE_POOL_PRE_PING = True
+    # Run on every connection to a SQLite file, WAL lets pages be read while a
+    # transaction commits, and NORMAL syncs only at checkpoints in WAL mode
+    SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'temp_store': 'MEMORY'}
+
+    # Read replica serving the read-only pages and API, none by default
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL} if DATABASE_REPLICA_URL else None
+    # Seconds the reads of a client go to the primary after it wrote, to see its own changes
+    REPLICA_STICKY_SECONDS = 10
+
+    # Search
 
     # ElasticSearch
     ELASTICSEARCH_URL = os.environ.get('ELASTICSEARCH_URL')
+    # Either 'elasticsearch' or 'sqlite' (in-process FTS5 index), defaults to the former if configured
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or ('elasticsearch' if ELASTICSEARCH_URL else 'sqlite')
+    # Path to the SQLite search index
+    SEARCH_INDEX_PATH = os.environ.get('SEARCH_INDEX_PATH') or os.path.join(basedir, 'search.db')
+    # Number of index/delete actions sent per bulk request
+    SEARCH_BULK_SIZE = int(os.environ.get('SEARCH_BULK_SIZE') or 500)
+
+    # Number of transactions written per commit by the importer
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE') or 1000)
+    # Processes parsing exports ahead of the one written, each holding one parsed export
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS') or 2)
+    # `;` delimited file of rules assigning categories to imported expenses, first match wins
+    CATEGORY_RULES = os.environ.get('CATEGORY_RULES')
+    # Number of transactions fetched and written at a time by exports
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE') or 1000)
+    # Postings of an account between balance snapshots, fewer make past balances
+    # faster to read and backdated postings slower to write
+    BALANCE_SNAPSHOT_INTERVAL = int(os.environ.get('BALANCE_SNAPSHOT_INTERVAL') or 500)
+
+    # Maximum number of transactions posted by one API request
+    API_MAX_BATCH_SIZE = 1000
+    # Default and maximum number of transactions listed per API page
+    API_PAGE_SIZE = 50
+    API_MAX_PAGE_SIZE = 500
+
+    # Profiling
+
+    # Record request, SQL, search and template timings, served at /debug/perf
+    PROFILING = bool(os.environ.get('PROFILING'))
+    # Number of recent samples kept per timing
+    PROFILING_BUFFER_SIZE = 1000
+
+    # Page cache
+
+    # Either 'memory' (per process LRU) or 'filesystem' (shared by processes), disabled by default
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND')
+    # Directory of the filesystem cache
+    CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join(basedir, 'cache')
+    # Number of pages kept by the memory cache
+    CACHE_SIZE = 256
+    # Seconds a cached page is served for, bounding the staleness of today's totals
+    CACHE_TIMEOUT = 300
+    # Seconds a page read from the replica is served for, as it may be older than the ledger version
+    REPLICA_CACHE_TIMEOUT = 5
+
+    # Column store
+
+    # Keep the transaction table in memory as NumPy columns for reports, about
+    # 53 MB per million transactions, loaded on the first report
+    COLUMN_STORE = bool(os.environ.get('COLUMN_STORE'))
+
+    # Background tasks
+
+    # Worker threads of each web process running queued tasks like search index
+    # updates, 0 to index within the committing request as with an in-memory database
+    TASK_WORKERS = int(os.environ.get('TASK_WORKERS') or 2)
+    # Seconds idle workers wait before looking for due tasks again
+    TASK_POLL_INTERVAL = 1
+    # Attempts before a task is marked failed, the first retry after TASK_RETRY_DELAY
+    # seconds and each next one after twice as long
+    TASK_MAX_ATTEMPTS = 5
+    TASK_RETRY_DELAY = 2
+    # Seconds between the heartbeats of running tasks, and without a heartbeat after
+    # which a task still running, whose worker most likely stopped, is run again
+    TASK_HEARTBEAT_INTERVAL = 15
+    TASK_TIMEOUT = 120
+
+    # Account icons
+
+    # Directory of the rendered identicons
+    ICON_DIR = os.environ.get('ICON_DIR') or os.path.join(basedir, 'icons')
+    # Seconds browsers keep an icon, whose content never changes
+    ICON_MAX_AGE = 365 * 24 * 3600
+
+    # Currency in which totals across accounts are reported
+    BASE_CURRENCY = os.environ.get('BASE_CURRENCY') or 'EUR'
+    # Number of (currency pair, date) conversion rates memoized
+    EXCHANGE_RATE_CACHE_SIZE = 4096
 
     # UI
     TRANSACTIONS_PER_PAGE = 10
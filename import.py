@@ -1,28 +1,67 @@
-import csv
-from datetime import datetime
-from typing import Dict, List, Tuple
+import argparse
 import os
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
 from app import create_app, db
-from app.models import Transaction, TransactionType, Account
+from app.categorizer import Categorizer, RuleError
+from app.importer import categorize_files, import_files
+from app.models import Transaction, Account
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Import transactions from ';' delimited exports, "
+                                                 "skipping those already imported")
+    parser.add_argument('csv_files', nargs='*', default=[os.path.join(dir_path, "data", "sample_import.csv")])
+    parser.add_argument('--chunk-size', type=int, help="Transactions written per commit")
+    parser.add_argument('--workers', type=int, help="Processes parsing the exports, IMPORT_WORKERS by default")
+    parser.add_argument('--reset', action='store_true', help="Delete every account and transaction first")
+    parser.add_argument('--background', action='store_true',
+                        help="Queue the import as a task run by the workers of the server or `flask tasks worker`")
+    parser.add_argument('--rules', help="Rules assigning categories to expenses, CATEGORY_RULES by default")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Report the categories the rules assign without importing anything")
+    args = parser.parse_args()
 
     app = create_app()
     app_context = app.app_context()
     app_context.push()
 
-    db.drop_all()
+    rules = args.rules or app.config['CATEGORY_RULES']
+    try:
+        categorizer = Categorizer.from_csv(rules) if rules else None
+    except (OSError, RuleError) as e:
+        parser.error(str(e))
+    if args.dry_run:
+        if categorizer is None:
+            parser.error("--dry-run needs --rules or CATEGORY_RULES")
+        for line in categorize_files(args.csv_files, categorizer).lines():
+            print(line)
+        app_context.pop()
+        return
+
+    if args.reset:
+        db.drop_all()
+        if app.search_backend:
+            app.search_backend.clear(Transaction.__tablename__)
     db.create_all()
-    app.elasticsearch.indices.delete(Transaction.__tablename__)
 
-    # csv_file = "/home/borrego/Downloads/avz_export.csv"
-    csv_file = os.path.join(dir_path, "data", "sample_import.csv")
-    dict_list = to_dict(csv_file)
-    for entry in dict_list:
-        create_transaction(entry)
+    chunk_size = args.chunk_size or app.config['IMPORT_CHUNK_SIZE']
+    if args.background:
+        if app.tasks.eager:
+            parser.error("--background needs TASK_WORKERS > 0 and a database file")
+        task = app.tasks.submit('import', csv_files=[os.path.abspath(f) for f in args.csv_files],
+                                chunk_size=chunk_size, workers=args.workers,
+                                rules=os.path.abspath(rules) if rules else None)
+        print(f"Queued the import as task {task.id}, its progress is at /api/v1/tasks/{task.id}")
+        app_context.pop()
+        return
+
+    importer = import_files(args.csv_files, chunk_size, args.workers,
+                            progress=lambda count, rate: print(f"Imported {count} transactions ({rate:.0f} rows/s)"),
+                            rules=rules)
+    print(f"Imported {importer.count} transactions, skipped {importer.skipped} already in the ledger")
+    for account in importer.accounts.created:
+        print(f"Added {account}")
 
     print("\n----Accounts----\n")
     for account in Account.query.filter_by(is_category=False).order_by(Account.name.asc()):
@@ -35,64 +74,5 @@ def main():
     app_context.pop()
 
 
-def extract_where(entry) -> Tuple[str, str]:
-    description, _, where = entry.get('Comment').partition(" @ ")
-    return description, where
-
-
-def extract_participants(entry) -> Tuple[str, List[str]]:
-    participants = []
-    description = entry.get('Comment')
-    return description, participants
-
-
-def get_account(name: str, currency: str, is_category=False):
-    account = Account.query.filter_by(name=name, currency=currency).first()
-    if account is None:
-        account = Account(name=name, currency=currency, balance=0.0, is_category=is_category)
-        account.generate_icon()
-        db.session.add(account)
-        db.session.commit()
-        print(f"Added {account}")
-    return account
-
-
-def create_transaction(entry: Dict):
-    transaction_type = TransactionType.from_str(entry['Type'])
-
-    value_src = entry.get('Source value') or entry['Amount']
-    currency_src = entry.get('Source category currency') or entry['Currency']
-    value_dest = entry.get('Destination value') or entry['Amount']
-    currency_dest = entry.get('Destination category currency') or entry['Currency']
-    description, where = extract_where(entry)
-    datetime_obj = datetime.strptime(entry['Time'], '%d/%m/%Y %H:%M:%S')
-
-    # TODO Extract participants e.g. (Person1, Person2, ...)
-
-    t = Transaction(type=transaction_type, datetime=datetime_obj,
-                    value_src=float(value_src), currency_src=currency_src,
-                    value_dest=float(value_dest), currency_dest=currency_dest,
-                    description=description, where=where)
-
-    is_category = transaction_type == TransactionType.expense
-    dest_account = get_account(entry['Destination'], currency_dest, is_category)
-    if transaction_type != TransactionType.income:
-        src_account = get_account(entry['Source'], currency_src, is_category)
-        src_account.add_transaction(t, dest_account)
-    else:
-        dest_account.add_transaction(t)
-
-    print(t)
-
-
-def to_dict(csv_file):
-    dict_list = []
-    with open(csv_file, 'r', encoding="utf-8-sig") as file:
-        reader = csv.DictReader(file, delimiter=';')
-        for line in reader:
-            dict_list.append(line)
-    return dict_list
-
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,32 @@
+"""Add transaction feed indexes
+
+Revision ID: 2b8d4e7f1a63
+Revises: 9e6f1b4c2d87
+Create Date: 2026-10-18 21:12:05.634190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b8d4e7f1a63'
+down_revision = '9e6f1b4c2d87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_transaction_datetime', table_name='transaction')
+    op.create_index('ix_transaction_datetime_id', 'transaction', ['datetime', 'id'], unique=False)
+    op.create_index('ix_transaction_src_account_id_datetime', 'transaction', ['src_account_id', 'datetime'],
+                    unique=False)
+    op.create_index('ix_transaction_dest_account_id_datetime', 'transaction', ['dest_account_id', 'datetime'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_transaction_dest_account_id_datetime', table_name='transaction')
+    op.drop_index('ix_transaction_src_account_id_datetime', table_name='transaction')
+    op.drop_index('ix_transaction_datetime_id', table_name='transaction')
+    op.create_index('ix_transaction_datetime', 'transaction', ['datetime'], unique=False)
@@ -0,0 +1,61 @@
+"""Add transaction content hash
+
+Revision ID: 4a6d2c8e1f37
+Revises: 7c3e9a5d2f10
+Create Date: 2026-10-18 23:05:41.218406
+
+"""
+from decimal import Decimal
+from hashlib import blake2b
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a6d2c8e1f37'
+down_revision = '7c3e9a5d2f10'
+branch_labels = None
+depends_on = None
+
+# Columns of Transaction.__hashed__, at this revision
+HASHED = ('type', 'datetime', 'src_account_id', 'dest_account_id', 'value_src', 'currency_src',
+          'value_dest', 'currency_dest', 'description', 'where')
+
+transaction = sa.table('transaction', sa.column('id', sa.Integer), sa.column('type', sa.String),
+                       sa.column('datetime', sa.DateTime), sa.column('src_account_id', sa.Integer),
+                       sa.column('dest_account_id', sa.Integer), sa.column('value_src', sa.BigInteger),
+                       sa.column('currency_src', sa.String), sa.column('value_dest', sa.BigInteger),
+                       sa.column('currency_dest', sa.String), sa.column('description', sa.String),
+                       sa.column('where', sa.String), sa.column('content_hash', sa.String))
+
+
+def digest(row) -> str:
+    parts = []
+    for column in HASHED:
+        value = row[column]
+        if column == 'datetime':
+            value = value.isoformat(sep=' ')
+        elif column.startswith('value_'):
+            value = (Decimal(value) / 100).quantize(Decimal('0.01'))
+        parts.append('' if value is None else str(value))
+    return blake2b('\x1f'.join(parts).encode(), digest_size=16).hexdigest()
+
+
+def upgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=32), nullable=True))
+        batch_op.create_index(batch_op.f('ix_transaction_content_hash'), ['content_hash'], unique=False)
+
+    connection = op.get_bind()
+    rows = connection.execute(sa.select([transaction.c[c] for c in ('id',) + HASHED])).fetchall()
+    updates = [{'row_id': row['id'], 'hash': digest(row)} for row in rows]
+    if updates:
+        connection.execute(transaction.update().where(transaction.c.id == sa.bindparam('row_id'))
+                           .values(content_hash=sa.bindparam('hash')), updates)
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_transaction_content_hash'))
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,26 @@
+"""Add account version
+
+Revision ID: 5d0c7a3e9b12
+Revises: 8b41e6d2a9f0
+Create Date: 2026-10-18 18:04:41.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c7a3e9b12'
+down_revision = '8b41e6d2a9f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('account', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('account', schema=None) as batch_op:
+        batch_op.drop_column('version')
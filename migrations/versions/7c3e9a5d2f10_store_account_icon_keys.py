@@ -0,0 +1,40 @@
+"""Store account icon keys
+
+Revision ID: 7c3e9a5d2f10
+Revises: 2b8d4e7f1a63
+Create Date: 2026-10-18 22:31:47.905126
+
+"""
+import re
+from hashlib import md5
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e9a5d2f10'
+down_revision = '2b8d4e7f1a63'
+branch_labels = None
+depends_on = None
+
+account = sa.table('account', sa.column('id', sa.Integer), sa.column('name', sa.String),
+                   sa.column('icon', sa.String))
+GRAVATAR = re.compile(r'^https://www\.gravatar\.com/avatar/([0-9a-f]{32})')
+
+
+def upgrade():
+    # Gravatar urls already embed the md5 of the lower-cased name, which is the key of the local identicon
+    connection = op.get_bind()
+    for id, name, icon in connection.execute(sa.select([account.c.id, account.c.name, account.c.icon])).fetchall():
+        match = GRAVATAR.match(icon or '')
+        key = match.group(1) if match else md5(name.lower().encode('utf-8')).hexdigest()
+        connection.execute(account.update().where(account.c.id == id).values(icon=key))
+
+
+def downgrade():
+    connection = op.get_bind()
+    for id, icon in connection.execute(sa.select([account.c.id, account.c.icon])).fetchall():
+        if icon:
+            connection.execute(account.update().where(account.c.id == id)
+                               .values(icon=f'https://www.gravatar.com/avatar/{icon}?d=identicon&s=50'))
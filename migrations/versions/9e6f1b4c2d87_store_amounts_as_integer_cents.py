@@ -0,0 +1,40 @@
+"""Store amounts as integer cents
+
+Revision ID: 9e6f1b4c2d87
+Revises: 5d0c7a3e9b12
+Create Date: 2026-10-18 18:41:09.330175
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e6f1b4c2d87'
+down_revision = '5d0c7a3e9b12'
+branch_labels = None
+depends_on = None
+
+AMOUNTS = {
+    'transaction': ('value_src', 'value_dest'),
+    'account': ('balance',),
+    'account_summary': ('inflow', 'outflow'),
+}
+
+
+def upgrade():
+    for table, columns in AMOUNTS.items():
+        op.execute(sa.text(f'UPDATE "{table}" SET ' + ', '.join(
+            f'{c} = ROUND({c} * 100)' for c in columns)))
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.Float(), type_=sa.BigInteger())
+
+
+def downgrade():
+    for table, columns in AMOUNTS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.BigInteger(), type_=sa.Float())
+        op.execute(sa.text(f'UPDATE "{table}" SET ' + ', '.join(
+            f'{c} = {c} / 100.0' for c in columns)))
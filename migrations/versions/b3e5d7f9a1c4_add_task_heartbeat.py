@@ -0,0 +1,31 @@
+"""Add task heartbeat
+
+Revision ID: b3e5d7f9a1c4
+Revises: 66f8d536f54b
+Create Date: 2026-10-19 10:12:08.417325
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e5d7f9a1c4'
+down_revision = '66f8d536f54b'
+branch_labels = None
+depends_on = None
+
+task = sa.table('task', sa.column('status', sa.String), sa.column('started', sa.DateTime),
+                sa.column('heartbeat', sa.DateTime))
+
+
+def upgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('heartbeat', sa.DateTime(), nullable=True))
+    # Tasks running during the upgrade last beat when they started
+    op.execute(task.update().where(task.c.status == 'running').values(heartbeat=task.c.started))
+
+
+def downgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat')
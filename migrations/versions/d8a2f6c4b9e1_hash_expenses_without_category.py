@@ -0,0 +1,62 @@
+"""Hash expenses without their category
+
+Revision ID: d8a2f6c4b9e1
+Revises: b3e5d7f9a1c4
+Create Date: 2026-10-19 14:37:52.604118
+
+"""
+from decimal import Decimal
+from hashlib import blake2b
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a2f6c4b9e1'
+down_revision = 'b3e5d7f9a1c4'
+branch_labels = None
+depends_on = None
+
+# Columns of Transaction.__hashed__, at this revision
+HASHED = ('type', 'datetime', 'src_account_id', 'dest_account_id', 'value_src', 'currency_src',
+          'value_dest', 'currency_dest', 'description', 'where')
+
+transaction = sa.table('transaction', sa.column('id', sa.Integer), sa.column('type', sa.String),
+                       sa.column('datetime', sa.DateTime), sa.column('src_account_id', sa.Integer),
+                       sa.column('dest_account_id', sa.Integer), sa.column('value_src', sa.BigInteger),
+                       sa.column('currency_src', sa.String), sa.column('value_dest', sa.BigInteger),
+                       sa.column('currency_dest', sa.String), sa.column('description', sa.String),
+                       sa.column('where', sa.String), sa.column('content_hash', sa.String))
+
+
+def digest(row, with_category: bool) -> str:
+    parts = []
+    for column in HASHED:
+        value = row[column]
+        if column == 'dest_account_id' and not with_category:
+            value = None
+        elif column == 'datetime':
+            value = value.isoformat(sep=' ')
+        elif column.startswith('value_'):
+            value = (Decimal(value) / 100).quantize(Decimal('0.01'))
+        parts.append('' if value is None else str(value))
+    return blake2b('\x1f'.join(parts).encode(), digest_size=16).hexdigest()
+
+
+def rehash(with_category: bool):
+    connection = op.get_bind()
+    rows = connection.execute(sa.select([transaction.c[c] for c in ('id',) + HASHED])
+                              .where(transaction.c.type == 'expense')).fetchall()
+    updates = [{'row_id': row['id'], 'hash': digest(row, with_category)} for row in rows]
+    if updates:
+        connection.execute(transaction.update().where(transaction.c.id == sa.bindparam('row_id'))
+                           .values(content_hash=sa.bindparam('hash')), updates)
+
+
+def upgrade():
+    rehash(with_category=False)
+
+
+def downgrade():
+    rehash(with_category=True)
@@ -0,0 +1,106 @@
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app import create_app, db
+from app.ledger import Ledger
+from app.models import Transaction, TransactionType, Account
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+
+
+class ApiCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        self.wallet = Account(name='Wallet', currency='EUR', balance=0.0)
+        self.bank = Account(name='Bank', currency='EUR', balance=0.0)
+        self.food = Account(name='Food', currency='EUR', is_category=True, balance=0.0)
+        db.session.add_all([self.wallet, self.bank, self.food])
+        db.session.commit()
+        self.start = datetime(2020, 7, 1, 12)
+        with Ledger() as ledger:
+            ledger.post(Transaction(type=TransactionType.income, datetime=self.start, value_src=100,
+                                    currency_src='EUR', value_dest=100, currency_dest='EUR'),
+                        dest_account=self.bank)
+            for i in range(1, 12):
+                ledger.post(Transaction(type=TransactionType.expense, datetime=self.start + timedelta(days=i),
+                                        description=f'Lunch {i}', value_src=1.1, currency_src='EUR',
+                                        value_dest=1.1, currency_dest='EUR'),
+                            src_account=self.wallet if i % 2 else self.bank, dest_account=self.food)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, status=200):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status, response.get_json())
+        return response.get_json()
+
+    def follow(self, url):
+        """Descriptions of every page from the url on, following the next links"""
+        pages = []
+        while url:
+            page = self.get(url)
+            pages.append([t['description'] for t in page['items']])
+            url = page['_links']['next']
+        return pages
+
+    def test_list_transactions(self):
+        page = self.get('/api/v1/transactions?limit=5')
+        self.assertEqual([t['description'] for t in page['items']], [f'Lunch {i}' for i in range(11, 6, -1)])
+        self.assertEqual(page['items'][0]['value_src'], '1.10')
+        self.assertEqual(page['items'][0]['dest_account'], self.food.id)
+        self.assertIsNone(page['_links']['prev'])
+        self.assertEqual(sum(len(p) for p in self.follow('/api/v1/transactions?limit=5')), 12)
+
+        newer = self.get(self.get(page['_links']['next'])['_links']['prev'])
+        self.assertEqual(newer['items'], page['items'])
+
+    def test_filter_transactions(self):
+        pages = self.follow(f'/api/v1/transactions?account={self.wallet.id}&limit=2')
+        self.assertEqual(sum(pages, []), [f'Lunch {i}' for i in range(11, 0, -2)])
+        self.assertEqual(len(pages), 3)
+        incomes = self.get(f'/api/v1/transactions?account={self.bank.id}&type=income')['items']
+        self.assertEqual([t['value_dest'] for t in incomes], ['100.00'])
+        window = self.get('/api/v1/transactions?since=2020-07-03&until=2020-07-05')['items']
+        self.assertEqual([t['description'] for t in window], ['Lunch 3', 'Lunch 2'])
+
+    def test_invalid_arguments(self):
+        self.get('/api/v1/transactions?limit=0', 400)
+        self.get('/api/v1/transactions?limit=many', 400)
+        self.get('/api/v1/transactions?type=gift', 400)
+        self.get('/api/v1/transactions?since=yesterday', 400)
+        self.assertEqual(self.get('/api/v1/transactions?account=99', 404)['message'], 'unknown account 99')
+
+    def test_accounts(self):
+        accounts = self.get('/api/v1/accounts?category=false')['items']
+        self.assertEqual([(a['name'], a['balance']) for a in accounts], [('Bank', '94.50'), ('Wallet', '-6.60')])
+        food = self.get(f'/api/v1/accounts/{self.food.id}')
+        self.assertEqual((food['is_category'], food['balance']), (True, '12.10'))
+        self.get('/api/v1/accounts/99', 404)
+
+    def test_summaries(self):
+        summaries = self.get(f'/api/v1/accounts/{self.bank.id}/summaries')
+        self.assertEqual(summaries['items'], [{'period': 'month', 'start': '2020-07-01', 'inflow': '100.00',
+                                               'outflow': '5.50', 'net': '94.50', 'count': 6}])
+        days = self.get(f'/api/v1/accounts/{self.bank.id}/summaries?period=day&since=2020-07-10')['items']
+        self.assertEqual([d['start'] for d in days], ['2020-07-11'])
+        self.assertEqual(Decimal(days[0]['outflow']), Decimal('1.10'))
+        self.get(f'/api/v1/accounts/{self.bank.id}/summaries?period=year', 400)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
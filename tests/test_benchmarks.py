@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date
+
+from app import create_app, db
+from app.asgi import ThreadPoolWsgiToAsgi
+from app.importer import Importer, read_csv
+from app.models import Account, AccountSummary, Transaction
+from benchmarks.harness import Recorder, compare
+from benchmarks.ledger import LedgerSpec, generate_entries, generate_rates, write_csv
+from benchmarks.load import run, run_asgi
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+    ELASTICSEARCH_URL = None
+
+
+class LedgerCase(unittest.TestCase):
+
+    def setUp(self):
+        self.spec = LedgerSpec(rows=500, accounts=4, categories=6, years=2, end=date(2020, 12, 31), seed=7)
+
+    def test_reproducible(self):
+        self.assertEqual(list(generate_entries(self.spec)), list(generate_entries(self.spec)))
+        self.assertEqual(list(generate_rates(self.spec)), list(generate_rates(self.spec)))
+        other = LedgerSpec(rows=500, accounts=4, categories=6, years=2, end=date(2020, 12, 31), seed=8)
+        self.assertNotEqual(list(generate_entries(self.spec)), list(generate_entries(other)))
+
+    def test_import(self):
+        app = create_app(TestConfig)
+        with app.app_context(), tempfile.TemporaryDirectory() as directory:
+            db.create_all()
+            path = os.path.join(directory, 'ledger.csv')
+            write_csv(path, self.spec)
+            self.assertEqual(Importer(chunk_size=100).run(read_csv(path)), 500)
+            self.assertEqual(Transaction.query.count(), 500)
+            self.assertEqual(Account.query.filter_by(is_category=True).count(), 6)
+            self.assertEqual({a.currency for a in Account.query}, {'EUR', 'CHF', 'USD'})
+            first, last = db.session.query(db.func.min(Transaction.datetime), db.func.max(Transaction.datetime)).one()
+            self.assertGreaterEqual(first.date(), self.spec.start)
+            self.assertLessEqual(last.date(), self.spec.end)
+
+            # Summaries maintained chunk by chunk match the ones rebuilt at once
+            incremental = {(s.account_id, s.period, s.start): (round(s.inflow, 2), round(s.outflow, 2), s.count)
+                           for s in AccountSummary.query}
+            AccountSummary.rebuild()
+            rebuilt = {(s.account_id, s.period, s.start): (round(s.inflow, 2), round(s.outflow, 2), s.count)
+                       for s in AccountSummary.query}
+            self.assertEqual(incremental, rebuilt)
+            db.session.remove()
+            db.drop_all()
+
+
+class RecorderCase(unittest.TestCase):
+
+    def test_compare(self):
+        spec = LedgerSpec(rows=10)
+        baseline, current = Recorder(spec), Recorder(spec)
+        baseline.add('suite', 'rate', {'seconds': 2.0, 'count': 10, 'unit': 'rows', 'rate': 5.0})
+        baseline.add('suite', 'latency', {'times': 1, 'median_ms': 4.0, 'p95_ms': 4.0})
+        current.add('suite', 'rate', {'seconds': 1.0, 'count': 10, 'unit': 'rows', 'rate': 10.0})
+        current.add('suite', 'latency', {'times': 1, 'median_ms': 8.0, 'p95_ms': 8.0})
+        changes = {c['name']: c['change'] for c in compare(baseline.to_dict(), current.to_dict())}
+        self.assertEqual(changes, {'rate': 1.0, 'latency': -0.5})
+        self.assertEqual(current.to_dict()['ledger']['rows'], 10)
+
+    def test_load(self):
+        result = run(lambda path: 404 if path == '/missing' else 200, ['/index', '/missing'], clients=3, requests=4)
+        self.assertEqual((result['count'], result['errors'], result['unit']), (12, 6, 'requests'))
+        self.assertGreater(result['rate'], 0)
+
+    def test_load_asgi(self):
+        threads = set()
+
+        def wsgi_app(environ, start_response):
+            threads.add(threading.get_ident())
+            time.sleep(0.05)
+            start_response('404 Not Found' if environ['PATH_INFO'] == '/missing' else '200 OK', [])
+            return [environ['QUERY_STRING'].encode()]
+
+        result = run_asgi(ThreadPoolWsgiToAsgi(wsgi_app), ['/index?page=2', '/missing'], clients=4, requests=2)
+        self.assertEqual((result['count'], result['errors']), (8, 4))
+        # Requests of concurrent clients run in threads of their own
+        self.assertGreater(len(threads), 1)
+        self.assertLess(result['seconds'], 8 * 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,180 @@
+import multiprocessing
+import re
+import shutil
+import tempfile
+import time
+import unittest
+
+from flask import g
+
+from app import create_app, db
+from app.cache import MemoryCache, FileSystemCache
+from app.importer import Importer, read_csv
+from app.ledger import Ledger
+from app.models import Transaction, TransactionType, Account
+from config import Config
+from tests.test_importer import SAMPLE_CSV
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+    SQLALCHEMY_RECORD_QUERIES = True
+    CACHE_BACKEND = 'memory'
+
+
+class CachedPagesCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        self.account = Account(name='Account 1', currency='EUR', balance=0.0)
+        self.category = Account(name='Category 1', currency='EUR', is_category=True, balance=0.0)
+        db.session.add_all([self.account, self.category])
+        db.session.commit()
+        self.post('Coffee')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post(self, description):
+        with Ledger() as ledger:
+            ledger.post(Transaction(type=TransactionType.expense, description=description, value_src=2.0,
+                                    currency_src='EUR', value_dest=2.0, currency_dest='EUR'),
+                        src_account=self.account, dest_account=self.category)
+
+    def get(self, url, client=None):
+        response = (client or self.client).get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_pages_served_from_cache_until_commit(self):
+        for url in ('/index', '/accounts', f'/account/{self.account.id}'):
+            self.assertEqual(self.get(url).headers['X-Cache'], 'MISS')
+            self.assertEqual(self.get(url).headers['X-Cache'], 'HIT')
+        stats = self.app.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 3))
+
+        version = self.app.cache.version()
+        self.post('Croissant')
+        self.assertEqual(self.app.cache.version(), version + 1)
+        response = self.get('/index')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertIn('Croissant', response.get_data(as_text=True))
+
+    def test_only_ledger_writes_invalidate(self):
+        version = self.app.cache.version()
+        for _ in range(3):
+            self.app.tasks.run_next()
+        db.session.commit()
+        # Written and rolled back, not carried over to the next commit
+        Account.apply_balance_deltas({self.account.id: 1})
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(self.app.cache.version(), version)
+
+        Importer().run(read_csv(SAMPLE_CSV))
+        self.assertGreater(self.app.cache.version(), version)
+        version = self.app.cache.version()
+        self.account.name = 'Renamed'
+        db.session.commit()
+        self.assertEqual(self.app.cache.version(), version + 1)
+
+    def test_hit_issues_no_queries(self):
+        self.get('/index')
+        response = self.get('/index')
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertEqual(response.headers['X-SQL-Queries'], self.get('/index').headers['X-SQL-Queries'])
+
+    def test_pages_with_arguments_not_cached(self):
+        self.get('/index')
+        self.assertNotIn('X-Cache', self.get('/index?after=bogus').headers)
+
+    def test_cached_page_carries_csrf_token_of_session(self):
+        first = CSRF_TOKEN.search(self.get('/index').get_data(as_text=True)).group(1)
+        # Requests share the app context pushed by the test, and so the token cached in g
+        g.pop('csrf_token')
+        other = self.app.test_client()
+        response = self.get('/index', other)
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        token = CSRF_TOKEN.search(response.get_data(as_text=True)).group(1)
+        self.assertNotEqual(token, first)
+
+        transaction = Transaction.query.first()
+        other.post(f'/transaction/remove/{transaction.id}', data={'csrf_token': token})
+        self.assertIsNone(Transaction.query.get(transaction.id))
+
+    def test_flashed_messages_bypass_cache(self):
+        self.get('/index')
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('message', 'Saved')]
+        response = self.get('/index')
+        self.assertNotIn('X-Cache', response.headers)
+        self.assertIn('Saved', response.get_data(as_text=True))
+
+
+def bump_times(directory, count):
+    cache = FileSystemCache(directory, 60)
+    for _ in range(count):
+        cache.bump()
+
+
+class CacheBackendCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory_evicts_least_recently_used(self):
+        cache = MemoryCache(size=2, timeout=60)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), ('1', None, '3'))
+
+    def test_memory_bump_clears_entries(self):
+        cache = MemoryCache(size=2, timeout=60)
+        cache.set('a', '1')
+        cache.bump()
+        self.assertEqual(cache.version(), 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_filesystem_shared_by_processes(self):
+        writer, reader = FileSystemCache(self.directory, 60), FileSystemCache(self.directory, 60)
+        writer.set('page', 'body\nwith lines')
+        self.assertEqual(reader.get('page'), 'body\nwith lines')
+        writer.bump()
+        self.assertEqual(reader.version(), 1)
+        self.assertIsNone(reader.get('page'))
+        self.assertEqual((reader.hits, reader.misses), (1, 1))
+
+    def test_filesystem_bumps_of_processes_never_lost(self):
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=bump_times, args=(self.directory, 50)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(FileSystemCache(self.directory, 60).version(), 200)
+
+    def test_filesystem_entries_expire(self):
+        cache = FileSystemCache(self.directory, timeout=0)
+        cache.set('page', 'body')
+        time.sleep(0.01)
+        self.assertIsNone(cache.get('page'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,170 @@
+import itertools
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+from app import cli, create_app, db
+from app.categorizer import Categorizer, Rule, RuleError, read_rules, trie_pattern
+from app.exporter import export
+from app.importer import import_files
+from app.models import Account, Transaction, TransactionType
+from config import Config, basedir
+
+SAMPLE_CSV = os.path.join(basedir, 'data', 'sample_import.csv')
+SAMPLE_RULES = os.path.join(basedir, 'data', 'sample_rules.csv')
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+
+
+def expense(description: str, where: str = '', amount: str = '1.00', src: str = 'PT Account',
+            dest: str = 'Other') -> dict:
+    return {'type': TransactionType.expense, 'description': description, 'where': where,
+            'value_src': Decimal(amount), 'src': src, 'dest': dest}
+
+
+class CategorizerCase(unittest.TestCase):
+
+    def classify(self, rules, values):
+        index = Categorizer(rules).classify(values)
+        # The same rule as testing each one in order
+        self.assertEqual(index, next((i for i, rule in enumerate(rules) if rule.matches(values)), None))
+        return index
+
+    def test_first_matching_rule_wins(self):
+        rules = [Rule('Coffee', keyword='Coffee', max_amount=Decimal('5')),
+                 Rule('Bar', keyword='coffee'),
+                 Rule('Groceries', pattern=r'migros|leclerc', field='where'),
+                 Rule('Wallet', source='Wallet')]
+        self.assertEqual(self.classify(rules, expense('Morning COFFEE', amount='3')), 0)
+        self.assertEqual(self.classify(rules, expense('Morning coffee', amount='9')), 1)
+        self.assertEqual(self.classify(rules, expense('Bread', 'E.Leclerc')), 2)
+        # Only the where field
+        self.assertIsNone(self.classify(rules, expense('Leclerc')))
+        self.assertEqual(self.classify(rules, expense('Bread', src='Wallet')), 3)
+
+    def test_overlapping_keywords(self):
+        self.assertEqual(trie_pattern(['bar', 'barber', 'beer']), r'b(?:ar(?:ber)?|eer)')
+        rules = [Rule('Hair', keyword='barber', min_amount=Decimal('10')),
+                 Rule('Drinks', keyword='bar'),
+                 Rule('Beer', keyword='arbe')]
+        self.assertEqual(self.classify(rules, expense('barber', amount='12')), 0)
+        self.assertEqual(self.classify(rules, expense('barber', amount='2')), 1)
+        rules.reverse()
+        self.assertEqual(self.classify(rules, expense('barber', amount='12')), 0)
+
+    def test_patterns_hidden_at_the_same_position(self):
+        rules = [Rule('Cheap', pattern=r'cof+ee', max_amount=Decimal('1')),
+                 Rule('Any', pattern=r'coffee'),
+                 Rule('Later', pattern=r'ee')]
+        self.assertEqual(self.classify(rules, expense('coffee', amount='3')), 1)
+        self.assertEqual(self.classify(rules, expense('coffee', amount='0.5')), 0)
+        self.assertEqual(self.classify(rules[1:], expense('toffee')), 1)
+
+    def test_matches_rules_one_by_one(self):
+        rules = [Rule('A', keyword='coffee', max_amount=Decimal('4')), Rule('B', keyword='fee', field='where'),
+                 Rule('C', pattern=r'\bbeans?\b', min_amount=Decimal('2')), Rule('D', keyword='co'),
+                 Rule('E', pattern=r'^lis', field='where', source='Wallet'), Rule('F', pattern=r'ee', max_amount=0),
+                 Rule('G', keyword='bean', source='PT Account')]
+        descriptions = ('Coffee beans', 'coffee', 'bean', 'Beans', 'toffee', '')
+        places = ('Lisbon', 'Coffee shop', 'fee', '')
+        categorizer = Categorizer(rules)
+        for description, where, amount, src in itertools.product(descriptions, places, ('0', '3', '9'),
+                                                                 ('Wallet', 'PT Account')):
+            values = expense(description, where, amount, src)
+            self.assertEqual(categorizer.classify(values),
+                             next((i for i, rule in enumerate(rules) if rule.matches(values)), None), values)
+
+    def test_invalid_rules(self):
+        with self.assertRaisesRegex(RuleError, 'either a keyword or a pattern'):
+            Rule('A', keyword='a', pattern='a')
+        with self.assertRaisesRegex(RuleError, 'unknown field'):
+            Rule('A', keyword='a', field='comment')
+        with self.assertRaisesRegex(RuleError, 'invalid pattern'):
+            Rule('A', pattern='(')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rules.csv')
+            with open(path, 'w') as file:
+                file.write('Category;Keyword;Min amount\nCoffee;coffee;1\n;tea;\n')
+            with self.assertRaisesRegex(RuleError, 'line 3: missing category'):
+                read_rules(path)
+
+    def test_report(self):
+        categorizer = Categorizer(read_rules(SAMPLE_RULES))
+        categorizer.apply(expense('Coffee', amount='2', dest='Bar&Pub'))
+        categorized = categorizer.apply(expense('Fuel', 'Migrolino', dest='Car Fuel'))
+        self.assertEqual((categorized['dest'], categorized['category']), ('Car Fuel', 'Car Fuel'))
+        categorizer.apply(expense('Coffee', amount='9', src='Wallet'))
+        categorizer.apply(dict(expense('Salary'), type=TransactionType.income))
+        report = categorizer.report
+        self.assertEqual((report.rows, report.expenses, report.matched, report.changed), (4, 3, 2, 1))
+        self.assertEqual(report.by_category, {'Coffee': 1, 'Car Fuel': 1})
+        self.assertEqual(report.unmatched, {'Coffee': 1})
+
+
+class ImportCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_import_with_rules(self):
+        importer = import_files([SAMPLE_CSV], rules=SAMPLE_RULES)
+        self.assertEqual(importer.categorizer.report.matched, 4)
+        categories = {t.description: t.dest_account.name
+                      for t in Transaction.query.filter_by(type=TransactionType.expense)}
+        self.assertEqual(categories, {'10 Beers': 'Bar&Pub', 'Francesinha': 'Meal', 'Morning Coffee': 'Bar&Pub',
+                                      'Fuel': 'Car Fuel', 'Groceries': 'Groceries'})
+        self.assertTrue(Account.query.filter_by(name='Meal').one().is_category)
+
+    def test_rules_do_not_change_identity(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rules.csv')
+            with open(path, 'w') as file:
+                file.write('Category;Keyword\nDrinks;beer\nTransport;fuel\n')
+            import_files([SAMPLE_CSV], rules=path)
+            # No account for the category of the export a rule overrode
+            self.assertIsNone(Account.query.filter_by(name='Car Fuel').first())
+            count = Transaction.query.count()
+            self.assertEqual(import_files([SAMPLE_CSV]).skipped, count)
+            self.assertEqual(import_files([SAMPLE_CSV], rules=SAMPLE_RULES).skipped, count)
+            self.assertEqual(Transaction.query.count(), count)
+            beers = Transaction.query.filter_by(description='10 Beers').one()
+            self.assertEqual(beers.dest_account.name, 'Drinks')
+
+            # Edited, and exported with the category of the rule, identified all the same
+            content_hash = beers.content_hash
+            beers.where = 'Lisbon'
+            db.session.commit()
+            beers.where = 'Arco do Cego'
+            db.session.commit()
+            self.assertEqual(beers.content_hash, content_hash)
+            export_path = os.path.join(directory, 'export.csv')
+            export(export_path)
+            self.assertEqual(import_files([export_path]).skipped, count)
+        self.assertEqual(Transaction.query.count(), count)
+
+    def test_categorize_command(self):
+        cli.register(self.app)
+        result = self.app.test_cli_runner().invoke(args=['ledger', 'categorize', SAMPLE_RULES, SAMPLE_CSV])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('4 of 5 expenses matched a rule', result.output)
+        self.assertIn('Morning Coffee', result.output)
+        # Nothing imported
+        self.assertEqual(Transaction.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import event
+
+from app import cli, create_app, db
+from app.cache import FileSystemCache
+from app.importer import Importer, read_csv
+from app.ledger import Ledger
+from app.models import Account, Transaction, TransactionType
+from app.reports import read_columns, spending_by_category, income_vs_expense, balance_over_time
+from config import Config, basedir
+
+SAMPLE_CSV = os.path.join(basedir, 'data', 'sample_import.csv')
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+    COLUMN_STORE = True
+
+
+class ColumnStoreCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Importer().run(read_csv(SAMPLE_CSV))
+        self.store = self.app.columns
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def assertMatchesTable(self):
+        """The store holds the rows of the table, in datetime then id order"""
+        stored, table = self.store.current(), read_columns()
+        order = np.lexsort((table.id, table.datetime))
+        self.assertEqual(stored.id.tolist(), table.id[order].tolist())
+        self.assertEqual(stored.datetime.tolist(), table.datetime[order].tolist())
+        self.assertEqual(stored.value_src.tolist(), table.value_src[order].tolist())
+        self.assertEqual(stored.currencies[stored.currency_dest].tolist(),
+                         table.currencies[table.currency_dest[order]].tolist())
+
+    def post(self, when: datetime, value: str, currency: str = 'EUR') -> Transaction:
+        wallet = Account.query.filter_by(name='PT Account').one()
+        category = Account.query.filter_by(currency=currency, is_category=True).first()
+        if category is None:
+            category = Account(name=f'Food {currency}', currency=currency, is_category=True, balance=0.0)
+            db.session.add(category)
+            db.session.flush()
+        with Ledger() as ledger:
+            return ledger.post(Transaction(type=TransactionType.expense, datetime=when, value_src=Decimal(value),
+                                           currency_src='EUR', value_dest=Decimal(value), currency_dest=currency),
+                               src_account=wallet, dest_account=category)
+
+    def test_reports_match_database(self):
+        self.assertFalse(self.store.loaded)
+        span = (date(2020, 1, 1), date(2020, 12, 31))
+        for report in (spending_by_category, income_vs_expense, balance_over_time):
+            with_store = report(*span, 'month').rows
+            self.assertTrue(self.store.loaded)
+            self.app.columns = None
+            self.assertEqual(with_store, report(*span, 'month').rows)
+            self.app.columns = self.store
+        self.assertEqual(len(self.store.between(date(2020, 8, 1), date(2020, 8, 31))),
+                         len(read_columns(date(2020, 8, 1), date(2020, 8, 31))))
+
+    def test_commits_are_staged(self):
+        self.store.current()
+        latest = self.post(datetime(2021, 1, 2), '3.00')
+        backdated = self.post(datetime(2020, 1, 2), '4.00')
+        self.assertEqual(set(self.store.staged), {latest.id, backdated.id})
+        self.assertMatchesTable()
+        self.assertEqual(self.store.staged, {})
+
+        with Ledger() as ledger:
+            ledger.remove(latest)
+        self.assertEqual(self.store.removed, {latest.id})
+        # Loaded before the commit, as the search index reads them once it is done
+        self.assertTrue(backdated.src_account.is_category is False and backdated.dest_account.is_category)
+        backdated.value_src = backdated.value_dest = Decimal('5.00')
+        db.session.commit()
+        self.assertMatchesTable()
+        self.assertNotIn(latest.id, self.store.current().id)
+
+    def test_rolled_back_changes_are_dropped(self):
+        self.store.current()
+        with self.assertRaises(ZeroDivisionError):
+            with Ledger() as ledger:
+                ledger.post(Transaction(type=TransactionType.income, value_src=1, currency_src='EUR', value_dest=1,
+                                        currency_dest='EUR'),
+                            dest_account=Account.query.filter_by(name='PT Account').one())
+                db.session.flush()
+                1 / 0
+        self.assertEqual(self.store.staged, {})
+        self.assertMatchesTable()
+
+    def test_new_currencies(self):
+        self.store.current()
+        self.post(datetime(2020, 9, 1), '2.00', currency='AUD')
+        self.assertMatchesTable()
+        self.assertEqual(self.store.current().currencies.tolist()[0], 'AUD')
+
+    def test_catches_up_with_bulk_imports(self):
+        before = len(self.store.current())
+        Importer().run([{'Type': 'Expenses', 'Time': '01/10/2020 10:00:00', 'Source': 'PT Account',
+                         'Destination': 'Groceries', 'Currency': 'EUR', 'Amount': '7', 'Comment': 'Bulk'}])
+        self.assertEqual(len(self.store.current()), before + 1)
+        self.assertMatchesTable()
+
+    def test_queries_check_only_the_largest_id(self):
+        self.store.current()
+        self.post(datetime(2021, 1, 2), '3.00')
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.store.current()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(len(statements), 1)
+        self.assertIn('max(', statements[0])
+        self.assertNotIn('count(', statements[0])
+        self.assertMatchesTable()
+
+    def test_reloads_after_writes_of_other_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.app.cache = FileSystemCache(directory, 300)
+        self.store.current()
+        self.post(datetime(2021, 1, 2), '3.00')
+        # Commits of this process keep the columns
+        self.assertEqual(self.store.version, self.app.cache.version())
+        loaded = self.store.columns
+
+        # Another process deletes a row and bumps the shared version
+        table = Transaction.__table__
+        removed = db.session.query(db.func.min(Transaction.id)).scalar()
+        db.engine.execute(table.delete().where(table.c.id == removed))
+        self.app.cache.bump()
+        self.assertNotIn(removed, self.store.current().id)
+        self.assertIsNot(self.store.columns, loaded)
+        self.assertMatchesTable()
+
+    def test_memory(self):
+        memory = self.store.memory()
+        self.assertEqual(memory['rows'], Transaction.query.count())
+        self.assertEqual(memory['columns']['datetime'], 8 * memory['rows'])
+        self.assertEqual(memory['bytes'], sum(memory['columns'].values()))
+        self.assertEqual(memory['bytes_per_million_rows'], 53 * 10 ** 6)
+
+    def test_memory_command(self):
+        cli.register(self.app)
+        result = self.app.test_cli_runner().invoke(args=['ledger', 'column-memory'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('50.5 MiB per million transactions', result.output)
+
+    def test_disabled(self):
+        class DisabledConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite://'
+            SEARCH_INDEX_PATH = ':memory:'
+            COLUMN_STORE = False
+        self.assertIsNone(create_app(DisabledConfig).columns)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
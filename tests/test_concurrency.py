@@ -0,0 +1,128 @@
+import os
+import random
+import tempfile
+import threading
+import unittest
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from app import create_app, db
+from app.ledger import Ledger
+from app.models import Transaction, TransactionType, Account
+from config import Config
+
+POSTERS = 6
+POSTS = 20
+
+
+class TestConfig(Config):
+    TESTING = True
+    SEARCH_BACKEND = None
+    ELASTICSEARCH_URL = None
+    # Writers wait for the database lock instead of failing at once
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}}
+
+
+class ConcurrencyCase(unittest.TestCase):
+    """Concurrent writers sharing one SQLite database file, each with its own session and connection"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app(TestConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory.name, 'test.db')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([Account(name=f'Account {i}', currency='EUR', balance=0.0) for i in range(3)] +
+                           [Account(name='Category', currency='EUR', balance=0.0, is_category=True)])
+        db.session.commit()
+        self.ids = [a.id for a in Account.query.order_by(Account.id)]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def run_concurrently(self, target, count):
+        barrier = threading.Barrier(count)
+        errors = []
+
+        def run(n):
+            try:
+                with self.app.app_context():
+                    barrier.wait()
+                    target(n)
+                    db.session.remove()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_posting_keeps_balances(self):
+        expected = [defaultdict(Decimal) for _ in range(POSTERS)]
+
+        def post(n):
+            rng = random.Random(n)
+            for i in range(POSTS):
+                src, dest = rng.sample(self.ids, 2)
+                value = Decimal(rng.randint(1, 10000)) / 100
+                # Accounts are loaded before posting, as the routes do, leaving a window for other writers
+                accounts = {a.id: a for a in Account.query.filter(Account.id.in_([src, dest]))}
+                transaction = Transaction(type=TransactionType.expense if dest == self.ids[-1] else
+                                          TransactionType.transfer, value_src=value, currency_src='EUR',
+                                          value_dest=value, currency_dest='EUR', description=f'{n} {i}')
+                if i % 2:
+                    with Ledger() as ledger:
+                        ledger.post(transaction, accounts[src], accounts[dest])
+                else:
+                    accounts[src].add_transaction(transaction, accounts[dest])
+                    db.session.commit()
+                expected[n][src] -= value
+                expected[n][dest] += value
+        self.run_concurrently(post, POSTERS)
+
+        db.session.expire_all()
+        self.assertEqual(Transaction.query.count(), POSTERS * POSTS)
+        recomputed = defaultdict(Decimal)
+        for src, dest, value_src, value_dest in db.session.query(
+                Transaction.src_account_id, Transaction.dest_account_id, Transaction.value_src, Transaction.value_dest):
+            recomputed[src] -= value_src
+            recomputed[dest] += value_dest
+        for account in Account.query:
+            self.assertEqual(account.balance, sum(e[account.id] for e in expected))
+            self.assertEqual(account.balance, recomputed[account.id])
+
+    def test_stale_account_edit_fails(self):
+        account = Account.query.get(self.ids[0])
+        self.assertEqual(account.balance, 0.0)
+
+        def deposit(n):
+            with Ledger() as ledger:
+                ledger.post(Transaction(type=TransactionType.income, value_src=10.0, currency_src='EUR',
+                                        value_dest=10.0, currency_dest='EUR'), dest_account=Account.query.get(self.ids[0]))
+        self.run_concurrently(deposit, 1)
+
+        # The account was loaded before the deposit, so editing it fails instead of overwriting it
+        account.name = 'Renamed'
+        with self.assertRaises(StaleDataError):
+            db.session.commit()
+        db.session.rollback()
+        self.assertEqual(Account.query.get(self.ids[0]).balance, 10.0)
+
+        # Balance changes in the same session reload the version
+        account.add_transaction(Transaction(type=TransactionType.income, value_src=5.0, currency_src='EUR',
+                                            value_dest=5.0, currency_dest='EUR'))
+        account.name = 'Savings'
+        db.session.commit()
+        self.assertEqual((account.name, account.balance, account.version), ('Savings', 15.0, 4))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,106 @@
+import os
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+
+from app import create_app, db
+from app.currency import MissingRateError, load_rates_csv, net_worth, rate_table
+from app.importer import Importer, read_csv
+from app.models import ExchangeRate
+from app.reports import income_vs_expense, balance_over_time
+from config import Config, basedir
+
+SAMPLE_CSV = os.path.join(basedir, 'data', 'sample_import.csv')
+SAMPLE_RATES = os.path.join(basedir, 'data', 'sample_rates.csv')
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+
+
+class CurrencyCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.assertEqual(load_rates_csv(SAMPLE_RATES), 10)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_rate_lookup(self):
+        table = rate_table()
+        self.assertEqual(table.rate('EUR', 'CHF', date(2020, 8, 3)), 1.0771)
+        # Latest rate published on or before the date
+        self.assertEqual(table.rate('EUR', 'USD', datetime(2020, 8, 24, 7, 50)), 1.1766)
+        self.assertAlmostEqual(table.rate('USD', 'CHF', date(2020, 12, 25)), 1.0791 / 1.1731)
+        self.assertEqual(table.rate('GBP', 'GBP', date(2020, 8, 3)), 1.0)
+        with self.assertRaises(MissingRateError):
+            table.rate('EUR', 'CHF', date(2020, 5, 31))
+        with self.assertRaises(MissingRateError):
+            table.rate('EUR', 'GBP', date(2020, 8, 3))
+
+    def test_rates_are_cached(self):
+        table = rate_table()
+        for _ in range(3):
+            table.rate('CHF', 'USD', date(2020, 9, 2))
+        self.assertEqual(table._rate.cache_info().hits, 2)
+        self.assertIs(rate_table(), table)
+
+    def test_convert_array(self):
+        converted = rate_table().convert_array(
+            np.array([10.0, 10.0, 10.0, 10.0]), np.array(['EUR', 'CHF', 'USD', 'CHF']),
+            np.array(['2020-07-15', '2020-07-15', '2020-09-01', '2020-09-01'], dtype='datetime64[D]'), 'EUR')
+        np.testing.assert_allclose(converted, [10.0, 10.0 / 1.0640, 10.0 / 1.1933, 10.0 / 1.0788])
+
+    def test_reloading_replaces_rates(self):
+        table = rate_table()
+        self.assertEqual(load_rates_csv(SAMPLE_RATES), 10)
+        self.assertIsNot(rate_table(), table)
+        self.assertEqual(rate_table().rate('EUR', 'CHF', date(2020, 8, 3)), 1.0771)
+
+    def test_rates_loaded_by_another_process(self):
+        table = rate_table()
+        with self.assertRaises(MissingRateError):
+            table.rate('EUR', 'GBP', date(2020, 8, 3))
+        # As `flask ledger load-rates` would, without touching this process
+        rates = ExchangeRate.__table__
+        db.session.execute(rates.insert().values(date=date(2020, 8, 1), currency='GBP', rate=0.9))
+        db.session.commit()
+        self.assertEqual(rate_table().rate('EUR', 'GBP', date(2020, 8, 3)), 0.9)
+        # Rates replaced on the same dates
+        db.session.execute(rates.update().where(rates.c.currency == 'CHF').where(rates.c.date == date(2020, 8, 3))
+                           .values(rate=1.1))
+        db.session.commit()
+        self.assertEqual(rate_table().rate('EUR', 'CHF', date(2020, 8, 3)), 1.1)
+        self.assertIs(rate_table(), rate_table())
+
+    def test_net_worth_and_converted_reports(self):
+        Importer().run(read_csv(SAMPLE_CSV))
+        today = date(2020, 10, 1)
+        # Each balance is converted and rounded to cents, 261.0 / 1.0791 and 140.83 / 1.1731
+        expected = Decimal('89.50') + Decimal('100.00') + Decimal('100.00') + Decimal('241.87') + Decimal('120.05')
+        self.assertEqual(net_worth('EUR', today), expected)
+
+        report = income_vs_expense(date(2020, 1, 1), date(2020, 12, 31), 'year', currency='EUR')
+        self.assertEqual(len(report.rows), 1)
+        period, currency, income, expense, net = report.rows[0]
+        self.assertEqual(currency, 'EUR')
+        # 300.0 / 1.0723 and 200.0 / 1.1219, rounded to cents
+        self.assertEqual(income, Decimal('300.00') + Decimal('279.77') + Decimal('178.27'))
+
+        report = balance_over_time(date(2020, 6, 1), date(2020, 10, 1), 'year', currency='EUR')
+        self.assertEqual(sum(row[4] for row in report.rows), expected)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import time
+import unittest
+
+from sqlalchemy.pool import QueuePool
+
+from app import create_app, db
+from app.database import REPLICA, PRIMARY_UNTIL
+from app.models import Account
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite databases, the replica holding different rows than the primary
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_BINDS = {REPLICA: 'sqlite://'}
+    SEARCH_INDEX_PATH = ':memory:'
+    CACHE_BACKEND = 'memory'
+
+
+class ReplicaCase(unittest.TestCase):
+    """Reads of read-only views go to the replica bind, everything else to the primary"""
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        self.replica = db.get_engine(self.app, REPLICA)
+        db.Model.metadata.create_all(bind=self.replica)
+        db.session.add_all([Account(name='Primary wallet', currency='EUR', balance=0.0),
+                            Account(name='Food', currency='EUR', balance=0.0, is_category=True)])
+        db.session.commit()
+        self.replica.execute(Account.__table__.insert(), name='Replica wallet', currency='EUR', balance=0,
+                             is_category=False)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.Model.metadata.drop_all(bind=self.replica)
+        self.app_context.pop()
+
+    def names(self):
+        return [a['name'] for a in self.client.get('/api/v1/accounts?category=false').get_json()['items']]
+
+    def test_reads_from_replica(self):
+        self.assertEqual(self.names(), ['Replica wallet'])
+        self.assertIn(b'Replica wallet', self.client.get('/accounts').data)
+        # Outside of read-only views the primary is used
+        self.assertEqual([a.name for a in Account.query.filter_by(is_category=False)], ['Primary wallet'])
+
+    def test_writes_go_to_primary_and_stick(self):
+        wallet, food = [a.id for a in Account.query.order_by(Account.id)]
+        response = self.client.post('/api/v1/transactions', json={'transactions': [
+            {'type': 'expense', 'src_account': wallet, 'dest_account': food, 'value_src': '2.50'}]})
+        self.assertEqual(response.status_code, 201, response.get_json())
+        self.assertEqual(db.session.get_bind(Account.__mapper__).execute(
+            'SELECT count(*) FROM "transaction"').scalar(), 1)
+        self.assertEqual(self.replica.execute('SELECT count(*) FROM "transaction"').scalar(), 0)
+
+        # The client that wrote reads its own changes from the primary for a while
+        with self.client.session_transaction() as session:
+            self.assertGreater(session[PRIMARY_UNTIL], time.time())
+        self.assertEqual(self.names(), ['Primary wallet'])
+        other = self.app.test_client().get('/api/v1/accounts?category=false').get_json()
+        self.assertEqual([a['name'] for a in other['items']], ['Replica wallet'])
+
+        with self.client.session_transaction() as session:
+            session[PRIMARY_UNTIL] = time.time() - 1
+        self.assertEqual(self.names(), ['Replica wallet'])
+
+    def test_replica_pages_expire_quickly(self):
+        self.client.get('/accounts')
+        (expires, _), = self.app.cache.entries.values()
+        self.assertLessEqual(expires - time.monotonic(), self.app.config['REPLICA_CACHE_TIMEOUT'])
+
+    def test_pool_stats(self):
+        self.names()
+        stats = db.pool_stats()
+        self.assertEqual(set(stats), {'primary', REPLICA})
+        self.assertGreater(stats[REPLICA]['checkouts'], 0)
+
+
+class FileTestConfig(Config):
+    TESTING = True
+    SEARCH_INDEX_PATH = ':memory:'
+    DATABASE_POOL_SIZE = 2
+    DATABASE_MAX_OVERFLOW = 1
+
+
+class FileDatabaseCase(unittest.TestCase):
+    """SQLite database files are pooled and opened in WAL mode"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app(FileTestConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory.name, 'test.db')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.get_engine().dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def test_pool_and_pragmas(self):
+        engine = db.get_engine()
+        self.assertIsInstance(engine.pool, QueuePool)
+        self.assertEqual(engine.pool.size(), 2)
+        self.assertEqual(db.session.execute('PRAGMA journal_mode').scalar(), 'wal')
+        self.assertEqual(db.session.execute('PRAGMA synchronous').scalar(), 1)
+
+    def test_pool_stats(self):
+        db.session.add(Account(name='Wallet', currency='EUR', balance=0.0))
+        db.session.commit()
+        db.session.remove()
+        stats = db.pool_stats()
+        self.assertEqual(list(stats), ['primary'])
+        self.assertEqual(stats['primary']['pool'], 'QueuePool')
+        self.assertEqual(stats['primary']['checked_out'], 0)
+        self.assertGreaterEqual(stats['primary']['checkouts'], 2)
+        # Connections are reused rather than opened for each checkout
+        self.assertEqual(stats['primary']['connects'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
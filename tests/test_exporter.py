@@ -0,0 +1,135 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from app import create_app, db, cli
+from app.exporter import HEADER, export
+from app.importer import Importer, read_csv
+from app.ledger import Ledger
+from app.models import Transaction, TransactionType, Account
+from config import Config, basedir
+
+SAMPLE_CSV = os.path.join(basedir, 'data', 'sample_import.csv')
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+    EXPORT_CHUNK_SIZE = 4
+
+
+class ExporterCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        cli.register(self.app)
+        db.create_all()
+        Importer().run(read_csv(SAMPLE_CSV))
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def ledger():
+        return sorted((t.type.name, t.datetime, t.src_account.name if t.src_account else '', t.dest_account.name,
+                       t.value_src, t.currency_src, t.value_dest, t.currency_dest, t.description or '', t.where or '')
+                      for t in Transaction.query)
+
+    def test_csv_round_trip(self):
+        path = os.path.join(self.directory, 'export.csv')
+        self.assertEqual(export(path, chunk_size=3), 11)
+        exported = self.ledger()
+        db.drop_all()
+        db.create_all()
+        self.assertEqual(Importer().run(read_csv(path)), 11)
+        self.assertEqual(self.ledger(), exported)
+
+    def test_sub_second_times_round_trip(self):
+        account = Account.query.filter_by(name='PT Account').one()
+        category = Account.query.filter_by(name='Meal').one()
+        with Ledger() as ledger:
+            ledger.post(Transaction(type=TransactionType.expense, datetime=datetime(2020, 7, 3, 12, 0, 0, 250000),
+                                    value_src=1.0, currency_src=account.currency, value_dest=1.0,
+                                    currency_dest=account.currency), account, category)
+        path = os.path.join(self.directory, 'export.csv')
+        count = export(path)
+        self.assertIn('03/07/2020 12:00:00.250000', open(path, encoding='utf-8').read())
+        # Every exported transaction is already in the ledger
+        importer = Importer()
+        self.assertEqual(importer.run(read_csv(path)), 0)
+        self.assertEqual(importer.skipped, count)
+        self.assertEqual(Transaction.query.count(), count)
+
+    def test_cli_filters(self):
+        path = os.path.join(self.directory, 'swiss.csv')
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['ledger', 'export', path, '--account', 'Swiss Account', '--type', 'expense'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        rows = list(read_csv(path))
+        self.assertIn(f'Exported {len(rows)} transactions', result.output)
+        self.assertTrue(rows)
+        self.assertTrue(all(r['Type'] == 'Expenses' and 'Swiss Account' in (r['Source'], r['Destination'])
+                            for r in rows))
+        self.assertNotEqual(runner.invoke(args=['ledger', 'export', path, '--account', 'Nobody']).exit_code, 0)
+
+    def test_endpoint_streams_csv(self):
+        response = self.client.get('/api/v1/transactions/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True)), delimiter=';'))
+        self.assertEqual(rows[0], HEADER)
+        self.assertEqual(len(rows), 12)
+        times = [datetime.strptime(r[1], '%d/%m/%Y %H:%M:%S') for r in rows[1:]]
+        self.assertEqual(times, sorted(times))
+
+    def test_endpoint_filters(self):
+        account = Account.query.filter_by(name='USA Account').one()
+        response = self.client.get(f'/api/v1/transactions/export?account={account.id}&since=2000-01-01')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True)), delimiter=';'))
+        self.assertEqual(len(rows), account.transactions().count())
+        self.assertEqual(self.client.get('/api/v1/transactions/export?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/transactions/export?account=99').status_code, 404)
+
+    @unittest.skipIf(pyarrow, 'pyarrow is installed')
+    def test_columnar_requires_pyarrow(self):
+        self.assertEqual(self.client.get('/api/v1/transactions/export?format=arrow').status_code, 501)
+        result = self.app.test_cli_runner().invoke(
+            args=['ledger', 'export', os.path.join(self.directory, 'export.parquet'), '--format', 'parquet'])
+        self.assertIn('require pyarrow', result.output)
+
+    @unittest.skipUnless(pyarrow, 'requires pyarrow')
+    def test_parquet_and_arrow(self):
+        import pyarrow.parquet as pq
+        path = os.path.join(self.directory, 'export.parquet')
+        self.assertEqual(export(path, format='parquet', chunk_size=4), 11)
+        table = pq.read_table(path)
+        self.assertEqual(table.num_rows, 11)
+        self.assertEqual(pq.ParquetFile(path).num_row_groups, 3)
+
+        response = self.client.get('/api/v1/transactions/export?format=arrow')
+        self.assertTrue(response.is_streamed)
+        streamed = pyarrow.ipc.open_stream(response.get_data()).read_all()
+        self.assertEqual(streamed.to_pydict(), table.to_pydict())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app, db
+from app.icons import icon_key, render_identicon
+from app.models import Transaction, TransactionType, Account
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+
+
+class IconCase(unittest.TestCase):
+
+    def setUp(self):
+        TestConfig.ICON_DIR = self.directory = tempfile.mkdtemp()
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        self.account = Account(name='Account 1', currency='EUR', balance=0.0)
+        self.category = Account(name='Category 1', currency='EUR', is_category=True, balance=0.0)
+        self.account.add_transaction(Transaction(type=TransactionType.expense, description='Coffee',
+                                                 value_src=2.0, currency_src='EUR',
+                                                 value_dest=2.0, currency_dest='EUR'),
+                                     dest_account=self.category)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_icon_assigned_on_insert(self):
+        self.assertEqual(self.account.icon, icon_key('Account 1'))
+        self.assertEqual(self.category.icon, icon_key('category 1'))
+
+    def test_get_renders_write_nothing(self):
+        # Accounts stored before icons were assigned on insert
+        Account.query.update({Account.icon: None})
+        db.session.commit()
+        statements, commits = [], []
+        db.event.listen(db.engine, 'before_cursor_execute',
+                        lambda conn, cursor, statement, *args: statements.append(statement))
+        count_commit = commits.append
+        db.event.listen(db.session, 'after_commit', count_commit)
+        try:
+            for url in ('/index', '/accounts', f'/account/{self.account.id}', f'/account/{self.category.id}'):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        finally:
+            db.event.remove(db.session, 'after_commit', count_commit)
+        self.assertEqual([s for s in statements if not s.lstrip().upper().startswith('SELECT')], [])
+        self.assertEqual(commits, [])
+
+    def test_icon_rendered_on_insert(self):
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted([f'{self.account.icon}.svg',
+                                                                     f'{self.category.icon}.svg']))
+        html = self.client.get('/index').get_data(as_text=True)
+        url = f'/icon/{self.account.icon}.svg'
+        self.assertIn(url, html)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/svg+xml')
+        self.assertEqual(response.get_data(as_text=True), render_identicon(self.account.icon))
+        self.assertGreaterEqual(response.cache_control.max_age, 30 * 24 * 3600)
+        self.assertTrue(response.cache_control.immutable)
+        response.close()
+
+    def test_missing_icons_of_accounts_rendered_once(self):
+        # Accounts stored before icons were rendered on insert, or assigned
+        Account.query.filter_by(id=self.category.id).update({Account.icon: None})
+        db.session.commit()
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        for key in (self.account.icon, icon_key('Category 1'), icon_key('Income')):
+            response = self.client.get(f'/icon/{key}.svg')
+            self.assertEqual(response.status_code, 200)
+            response.close()
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+
+    def test_unknown_key_not_found(self):
+        self.assertEqual(self.client.get('/icon/..%2Fconfig.svg').status_code, 404)
+        self.assertEqual(self.client.get('/icon/nothex.svg').status_code, 404)
+        self.assertEqual(self.client.get(f'/icon/{icon_key("Nobody")}.svg').status_code, 404)
+        self.assertNotIn(f'{icon_key("Nobody")}.svg', os.listdir(self.directory))
+
+    def test_identicons_differ_by_key(self):
+        first, second = render_identicon(icon_key('Groceries')), render_identicon(icon_key('Rent'))
+        self.assertTrue(first.startswith('<svg'))
+        self.assertNotEqual(first, second)
+        self.assertEqual(first, render_identicon(icon_key('groceries')))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
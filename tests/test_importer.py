@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from app import create_app, db
+from app.importer import Importer, parse_ahead, read_csv
+from app.ledger import Ledger
+from app.models import Transaction, TransactionType, Account, AccountSummary
+from config import Config, basedir
+
+SAMPLE_CSV = os.path.join(basedir, 'data', 'sample_import.csv')
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+
+
+class ImporterCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_import_sample(self):
+        reports = []
+        importer = Importer(chunk_size=4, progress=lambda count, rate: reports.append(count))
+        self.assertEqual(importer.run(read_csv(SAMPLE_CSV)), 11)
+        self.assertEqual(reports, [4, 8, 11])
+        self.assertEqual(Transaction.query.count(), 11)
+
+        def balance(name, currency):
+            return Account.query.filter_by(name=name, currency=currency).one().balance
+
+        self.assertEqual(balance('PT Account', 'EUR'), Decimal('89.50'))
+        self.assertEqual(balance('Swiss Account', 'CHF'), Decimal('261.00'))
+        self.assertEqual(balance('USA Account', 'USD'), Decimal('140.83'))
+        self.assertEqual(balance('EUR Account', 'EUR'), Decimal('100.00'))
+        self.assertEqual(balance('Bar&Pub', 'EUR'), Decimal('13.35'))
+
+    def test_import_links_accounts(self):
+        Importer(chunk_size=100).run(read_csv(SAMPLE_CSV))
+        fuel = Transaction.query.filter_by(description='Fuel').one()
+        self.assertEqual(fuel.type, TransactionType.expense)
+        self.assertEqual(fuel.where, 'Migrolino')
+        self.assertEqual(fuel.src_account.name, 'Swiss Account')
+        self.assertEqual(fuel.dest_account.name, 'Car Fuel')
+        self.assertTrue(fuel.dest_account.is_category)
+        self.assertIsNotNone(fuel.dest_account.icon)
+        self.assertEqual(Account.query.filter_by(name='PT Account').count(), 1)
+
+    def test_import_maintains_summaries(self):
+        Importer(chunk_size=3).run(read_csv(SAMPLE_CSV))
+
+        def summaries():
+            return sorted((s.account_id, s.period.name, s.start, round(s.inflow, 2), round(s.outflow, 2), s.count)
+                          for s in AccountSummary.query)
+
+        imported = summaries()
+        AccountSummary.rebuild()
+        self.assertEqual(summaries(), imported)
+
+    def write_export(self, name, lines):
+        with open(SAMPLE_CSV, encoding='utf-8-sig') as sample:
+            header = sample.readline()
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(header + ''.join(line + '\n' for line in lines))
+        return path
+
+    def test_import_twice_adds_nothing(self):
+        Importer().run(read_csv(SAMPLE_CSV))
+        balances = sorted((a.name, a.balance) for a in Account.query)
+        importer = Importer()
+        self.assertEqual(importer.run(read_csv(SAMPLE_CSV)), 0)
+        self.assertEqual(importer.skipped, 11)
+        self.assertEqual(Transaction.query.count(), 11)
+        self.assertEqual(sorted((a.name, a.balance) for a in Account.query), balances)
+
+    def test_overlapping_exports(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        coffee = 'Expenses;02/07/2020 08:00:00;Bank;Coffee;EUR;2.50;Espresso;;;;'
+        transfer = 'Transfer;03/07/2020 10:00:00;Bank;Savings;EUR;100.00;Monthly;;;;'
+        # The same coffee twice in one export, the transfer listed by both banks
+        bank = self.write_export('bank.csv', [coffee, coffee, transfer])
+        interest = 'Income;04/07/2020 09:00:00;;Savings;EUR;1.20;Interest;;;;'
+        savings = self.write_export('savings.csv', [transfer, interest])
+        importer = Importer(chunk_size=2)
+        self.assertEqual(importer.run_files([bank, savings], workers=2), 4)
+        self.assertEqual(importer.skipped, 1)
+        self.assertEqual(Importer().run_files([savings, bank, bank], workers=1), 0)
+        self.assertEqual(Transaction.query.filter_by(description='Espresso').count(), 2)
+        self.assertEqual(Account.query.filter_by(name='Bank').one().balance, Decimal('-105.00'))
+        self.assertEqual(Account.query.filter_by(name='Savings').one().balance, Decimal('101.20'))
+
+    def test_parses_a_bounded_number_of_exports_ahead(self):
+        started = []
+        lock = threading.Lock()
+
+        def parse(csv_file):
+            with lock:
+                started.append(csv_file)
+            return [csv_file]
+
+        files = [f'{i}.csv' for i in range(10)]
+        with ThreadPoolExecutor(4) as pool:
+            for written, parsed in enumerate(parse_ahead(pool, parse, files, 2)):
+                self.assertEqual(parsed, [files[written]])
+                # The export yielded, and at most two after it
+                self.assertLessEqual(len(started), written + 3)
+
+    def test_skips_transactions_posted_before(self):
+        Importer().run(read_csv(SAMPLE_CSV))
+        fuel = Transaction.query.filter_by(description='Fuel').one()
+        with Ledger() as ledger:
+            ledger.post(Transaction(type=fuel.type, datetime=datetime(2020, 7, 9, 8), value_src=Decimal('1.5'),
+                                    value_dest=Decimal('1.5'), currency_src='CHF', currency_dest='CHF',
+                                    description='Snack', where=''),
+                        fuel.src_account, fuel.dest_account)
+        posted = Transaction.query.filter_by(description='Snack').one()
+        self.assertEqual(len(posted.content_hash), 32)
+        self.assertEqual(fuel.content_hash, Transaction.digest({c: getattr(fuel, c) for c in Transaction.__hashed__}))
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        snack = 'Expenses;09/07/2020 08:00:00;Swiss Account;Car Fuel;CHF;1.50;Snack;;;;'
+        export = self.write_export('export.csv', [snack])
+        self.assertEqual(Importer().run(read_csv(export)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,167 @@
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app import create_app, db, cli
+from app.importer import Importer, read_csv
+from app.ledger import Ledger
+from app.models import Transaction, TransactionType, Account, Posting, BalanceSnapshot
+from config import Config
+from tests.test_importer import SAMPLE_CSV
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+
+
+def expense(value, when):
+    return Transaction(type=TransactionType.expense, datetime=when, value_src=value, currency_src='EUR',
+                       value_dest=value, currency_dest='EUR')
+
+
+class JournalCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        cli.register(self.app)
+        db.create_all()
+        self.account = Account(name='Account', currency='EUR', balance=0.0)
+        self.category = Account(name='Category', currency='EUR', balance=0.0, is_category=True)
+        db.session.add_all([self.account, self.category])
+        db.session.commit()
+        self.start = datetime(2020, 7, 1, 12)
+        with Ledger() as ledger:
+            ledger.post(Transaction(type=TransactionType.income, datetime=self.start, value_src=500,
+                                    currency_src='EUR', value_dest=500, currency_dest='EUR'),
+                        dest_account=self.account)
+            for day in range(1, 21):
+                ledger.post(expense(Decimal(day), self.start + timedelta(days=day)), self.account, self.category)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def replayed(self, account, when):
+        """Balance before a time, from the transactions"""
+        balance = Decimal('0.00')
+        for t in Transaction.query.filter(Transaction.datetime < when):
+            balance += t.value_dest if t.dest_account_id == account.id else 0
+            balance -= t.value_src if t.src_account_id == account.id else 0
+        return balance
+
+    def assert_balances(self):
+        for days in (0, 1, 2, 5, 10, 11, 15, 20, 21, 40):
+            when = self.start + timedelta(days=days)
+            for account in (self.account, self.category):
+                self.assertEqual(account.balance_at(when), self.replayed(account, when), (account, when))
+
+    def test_postings_journaled(self):
+        self.assertEqual(Posting.query.count(), 41)
+        for account in (self.account, self.category):
+            total = db.session.query(db.func.sum(Posting.amount, type_=Posting.amount.type)) \
+                .filter_by(account_id=account.id).scalar()
+            self.assertEqual(total, account.balance)
+        self.assertEqual(self.account.balance_at(self.start + timedelta(days=3)), Decimal('497.00'))
+
+    def test_remove_appends_reversal(self):
+        transaction = Transaction.query.filter_by(value_src=Decimal(3)).one()
+        transaction_id = transaction.id
+        with Ledger() as ledger:
+            ledger.remove(transaction)
+        postings = Posting.query.filter_by(transaction_id=transaction_id).order_by(Posting.id).all()
+        self.assertEqual([(p.account_id, p.amount) for p in postings],
+                         [(self.category.id, Decimal('3.00')), (self.account.id, Decimal('-3.00')),
+                          (self.category.id, Decimal('-3.00')), (self.account.id, Decimal('3.00'))])
+        self.assertIsNone(Transaction.query.get(transaction_id))
+        self.assertEqual(self.account.balance_at(self.start + timedelta(days=30)), self.account.balance)
+        self.assert_balances()
+
+    def test_account_methods_journal(self):
+        BalanceSnapshot.take(4)
+        transaction = expense(Decimal('2.50'), self.start + timedelta(days=2, hours=1))
+        self.account.add_transaction(transaction, self.category)
+        db.session.commit()
+        self.assertEqual(Posting.query.filter_by(transaction_id=transaction.id).count(), 2)
+        self.assertEqual(self.account.balance_at(self.start + timedelta(days=30)), self.account.balance)
+        self.assert_balances()
+
+        transaction_id = transaction.id
+        self.account.remove_transaction(transaction)
+        db.session.commit()
+        postings = Posting.query.filter_by(transaction_id=transaction_id).order_by(Posting.id)
+        self.assertEqual([p.amount for p in postings],
+                         [Decimal('2.50'), Decimal('-2.50'), Decimal('-2.50'), Decimal('2.50')])
+        self.assert_balances()
+
+    def test_balances_from_snapshots(self):
+        self.assert_balances()
+        for interval in (1, 4, 7, 100):
+            BalanceSnapshot.take(interval, rebuild=True)
+            self.assertEqual(BalanceSnapshot.query.filter_by(account_id=self.account.id).count(), 21 // interval)
+            self.assert_balances()
+
+    def test_snapshots_taken_incrementally(self):
+        self.assertEqual(BalanceSnapshot.take(5), 8)
+        self.assertEqual(BalanceSnapshot.take(5), 0)
+        with Ledger() as ledger:
+            for day in range(21, 26):
+                ledger.post(expense(Decimal(1), self.start + timedelta(days=day)), self.account, self.category)
+        self.assertEqual(BalanceSnapshot.take(5), 2)
+        self.assert_balances()
+
+    def test_ledger_takes_due_snapshots(self):
+        self.app.config['BALANCE_SNAPSHOT_INTERVAL'] = 5
+        with Ledger() as ledger:
+            ledger.post(expense(Decimal(1), self.start + timedelta(days=21)), self.account, self.category)
+        # 22 postings of the account and 21 of the category since no snapshot
+        self.assertEqual(BalanceSnapshot.query.filter_by(account_id=self.account.id).count(), 4)
+        self.assertEqual(BalanceSnapshot.query.filter_by(account_id=self.category.id).count(), 4)
+        with Ledger() as ledger:
+            for day in range(22, 25):
+                ledger.post(expense(Decimal(1), self.start + timedelta(days=day)), self.account, self.category)
+        self.assertEqual(BalanceSnapshot.query.filter_by(account_id=self.account.id).count(), 5)
+        self.assertEqual(BalanceSnapshot.take(5), 0)
+        self.assert_balances()
+
+    def test_backdated_postings_shift_snapshots(self):
+        BalanceSnapshot.take(4)
+        latest = BalanceSnapshot.query.filter_by(account_id=self.account.id) \
+            .order_by(BalanceSnapshot.datetime.desc()).first()
+        before = latest.balance
+        with Ledger() as ledger:
+            ledger.post(expense(Decimal('0.50'), self.start + timedelta(days=2, hours=1)), self.account, self.category)
+        db.session.refresh(latest)
+        self.assertEqual(latest.balance, before - Decimal('0.50'))
+        self.assert_balances()
+        with Ledger() as ledger:
+            ledger.remove(Transaction.query.filter_by(value_src=Decimal('0.50')).one())
+        db.session.refresh(latest)
+        self.assertEqual(latest.balance, before)
+        self.assert_balances()
+
+    def test_import_journals_once(self):
+        Importer().run(read_csv(SAMPLE_CSV))
+        Importer().run(read_csv(SAMPLE_CSV))
+        sides = Transaction.query.count() + Transaction.query.filter(Transaction.src_account_id.isnot(None)).count()
+        self.assertEqual(Posting.query.count(), sides)
+        BalanceSnapshot.take(2)
+        for account in Account.query:
+            self.assertEqual(account.balance_at(datetime(2030, 1, 1)), account.balance, account)
+
+    def test_balance_endpoint_and_command(self):
+        client, url = self.app.test_client(), f'/api/v1/accounts/{self.account.id}/balance'
+        result = self.app.test_cli_runner().invoke(args=['ledger', 'snapshot', '--interval', '10'])
+        self.assertEqual(result.output, 'Took 4 balance snapshots\n')
+        self.assertEqual(client.get(f'{url}?at=2020-07-04').get_json()['balance'], '497.00')
+        self.assertEqual(client.get(url).get_json()['balance'], '290.00')
+        self.assertEqual(client.get(f'{url}?at=soon').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
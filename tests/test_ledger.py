@@ -0,0 +1,217 @@
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from app import create_app, db, cli
+from app.ledger import Ledger, LedgerError, computed_balances, reconcile
+from app.models import Transaction, TransactionType, Account, AccountSummary, Period
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+    ELASTICSEARCH_URL = None
+    API_MAX_BATCH_SIZE = 5
+
+
+def expense(value, currency_src='EUR', currency_dest='EUR', **kwargs):
+    return Transaction(type=TransactionType.expense, value_src=value, currency_src=currency_src,
+                       value_dest=value, currency_dest=currency_dest, **kwargs)
+
+
+class LedgerCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        self.a1 = Account(name='Account 1', currency='EUR', balance=0.0)
+        self.a2 = Account(name='Account 2', currency='CHF', balance=0.0)
+        self.c1 = Account(name='Category 1', currency='EUR', balance=0.0, is_category=True)
+        db.session.add_all([self.a1, self.a2, self.c1])
+        db.session.commit()
+        self.commits = 0
+
+        def count_commit(session):
+            self.commits += 1
+        event.listen(db.session, 'after_commit', count_commit)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_post_batch(self):
+        when = datetime(2020, 7, 3, 12)
+        with Ledger() as ledger:
+            for value in (1.0, 2.0, 3.0):
+                ledger.post(expense(value, datetime=when), self.a1, self.c1)
+            ledger.post(Transaction(type=TransactionType.income, datetime=when, value_src=100.0, currency_src='CHF',
+                                    value_dest=100.0, currency_dest='CHF'), dest_account=self.a2)
+            ledger.post(Transaction(type=TransactionType.transfer, datetime=when, value_src=10.0, currency_src='CHF',
+                                    value_dest=9.0, currency_dest='EUR'), self.a2, self.a1)
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(Transaction.query.count(), 5)
+        self.assertEqual((self.a1.balance, self.a2.balance, self.c1.balance), (3.0, 90.0, 6.0))
+        month = AccountSummary.query.get((self.a1.id, Period.month, date(2020, 7, 1)))
+        self.assertEqual((month.inflow, month.outflow, month.count), (9.0, 6.0, 4))
+        self.assertEqual(Transaction.search('Account', 1, 10)[1], 5)
+
+    def test_remove(self):
+        with Ledger() as ledger:
+            first, second = ledger.post(expense(1.0), self.a1, self.c1), ledger.post(expense(2.0), self.a1, self.c1)
+        with Ledger() as ledger:
+            ledger.remove(first)
+        self.assertEqual(Transaction.query.all(), [second])
+        self.assertEqual((self.a1.balance, self.c1.balance), (-2.0, 2.0))
+        self.assertEqual(self.a1.sum_cur_month(), -2.0)
+
+    def test_summary_inserted_meanwhile(self):
+        when = datetime(2020, 7, 3, 12)
+        table = AccountSummary.__table__
+        inserted = []
+
+        # Another transaction inserts the day summary between the lookup and the insert
+        def insert_behind(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT account_summary.account_id, account_summary.period') and not inserted:
+                inserted.append(statement)
+                conn.execute(table.insert(), account_id=self.a1.id, period=Period.day, start=when.date(),
+                             inflow=0, outflow=5.0, count=1)
+        event.listen(db.engine, 'after_cursor_execute', insert_behind)
+        try:
+            with Ledger() as ledger:
+                ledger.post(expense(1.0, datetime=when), self.a1, self.c1)
+        finally:
+            event.remove(db.engine, 'after_cursor_execute', insert_behind)
+        self.assertTrue(inserted)
+        day = AccountSummary.query.get((self.a1.id, Period.day, when.date()))
+        self.assertEqual((day.outflow, day.count), (6.0, 2))
+        month = AccountSummary.query.get((self.a1.id, Period.month, date(2020, 7, 1)))
+        self.assertEqual((month.outflow, month.count), (1.0, 1))
+        self.assertEqual(self.a1.balance, -1.0)
+
+    def test_post_to_new_accounts(self):
+        wallet = Account(name='Wallet', currency='EUR', balance=0.0)
+        category = Account(name='Category 2', currency='USD', balance=0.0, is_category=True)
+        with Ledger() as ledger:
+            ledger.post(Transaction(type=TransactionType.income, value_src=3.0, currency_src='EUR', value_dest=3.0,
+                                    currency_dest='EUR'), dest_account=wallet)
+            ledger.post(expense(1.0), wallet, self.c1)
+            # Checked against the new category, not the currencies of another new account
+            with self.assertRaises(LedgerError):
+                ledger.post(expense(1.0), wallet, category)
+        self.assertEqual((wallet.balance, self.c1.balance), (2.0, 1.0))
+        self.assertEqual(wallet.balance_at(datetime.utcnow()), 2.0)
+
+    def test_invalid_batch_is_not_written(self):
+        with self.assertRaises(LedgerError):
+            with Ledger() as ledger:
+                ledger.post(expense(1.0), self.a1, self.c1)
+                ledger.post(expense(1.0, currency_src='USD'), self.a1, self.c1)
+        with self.assertRaises(LedgerError):
+            Ledger().post(expense(1.0))
+        self.assertEqual(Transaction.query.count(), 0)
+        self.assertEqual(AccountSummary.query.count(), 0)
+        self.assertEqual(self.a1.balance, 0.0)
+
+    def test_api_post(self):
+        response = self.client.post('/api/v1/transactions', json={'transactions': [
+            {'type': 'expense', 'src_account': self.a1.id, 'dest_account': self.c1.id, 'value_src': 4.5,
+             'datetime': '2020-07-03T12:00:00', 'description': 'Lunch', 'where': 'Lisbon'},
+            {'type': 'income', 'dest_account': self.a2.id, 'value_src': 50},
+            {'type': 'transfer', 'src_account': self.a2.id, 'dest_account': self.a1.id,
+             'value_src': 10, 'value_dest': 9.2},
+        ]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json()['count'], 3)
+        lunch = Transaction.query.get(response.get_json()['ids'][0])
+        self.assertEqual((lunch.description, lunch.where, lunch.currency_dest), ('Lunch', 'Lisbon', 'EUR'))
+        self.assertEqual((self.a1.balance, self.a2.balance, self.c1.balance),
+                         (Decimal('4.70'), Decimal('40.00'), Decimal('4.50')))
+        self.assertEqual(self.commits, 1)
+
+    def test_api_rejects_whole_batch(self):
+        valid = {'type': 'expense', 'src_account': self.a1.id, 'dest_account': self.c1.id, 'value_src': 1}
+        for entries, message in (
+                ([valid, dict(valid, currency_src='USD')], 'Incorrect currency at source: USD, expected EUR'),
+                ([valid, dict(valid, dest_account=99)], 'unknown dest_account 99'),
+                ([valid, dict(valid, type='gift')], 'unknown type gift'),
+                ([valid, {'type': 'income', 'dest_account': self.a1.id}], 'missing value_src')):
+            response = self.client.post('/api/v1/transactions', json={'transactions': entries})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()['message'], message)
+            self.assertEqual(response.get_json()['index'], 1)
+        self.assertEqual(self.client.post('/api/v1/transactions', json={'transactions': [valid] * 6}).status_code, 400)
+        self.assertEqual(self.client.post('/api/v1/transactions', json={}).status_code, 400)
+        self.assertEqual(Transaction.query.count(), 0)
+        self.assertEqual(self.a1.balance, 0.0)
+
+    def test_reconcile(self):
+        with Ledger() as ledger:
+            ledger.post(expense(1.5), self.a1, self.c1)
+            ledger.post(Transaction(type=TransactionType.income, value_src=20.0, currency_src='CHF',
+                                    value_dest=20.0, currency_dest='CHF'), dest_account=self.a2)
+        self.assertEqual(computed_balances(), {self.a1.id: -1.5, self.a2.id: 20.0, self.c1.id: 1.5})
+        self.assertEqual(reconcile(), [])
+
+        # Lost or duplicated updates
+        table = Account.__table__
+        db.session.execute(table.update().where(table.c.id == self.a1.id).values(balance=7.0))
+        db.session.execute(table.update().where(table.c.id == self.c1.id).values(balance=1.504))
+        db.session.commit()
+        drifts = reconcile()
+        self.assertEqual([(d.account, d.stored, d.computed) for d in drifts], [(self.a1, 7.0, -1.5)])
+        self.assertEqual(self.a1.balance, 7.0)
+        self.assertEqual(len(reconcile(repair=True)), 1)
+        self.assertEqual(self.a1.balance, -1.5)
+        self.assertEqual(reconcile(), [])
+
+    def test_reconcile_reads_balances_in_one_statement(self):
+        with Ledger() as ledger:
+            ledger.post(expense(1.5), self.a1, self.c1)
+        self.assertEqual(self.a1.balance, -1.5)
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            # Stored balances loaded before are read again
+            table = Account.__table__
+            db.session.execute(table.update().where(table.c.id == self.a1.id).values(balance=0.0))
+            statements.clear()
+            drifts = reconcile()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual([(d.account, d.stored, d.computed) for d in drifts], [(self.a1, 0.0, -1.5)])
+
+    def test_recompute_command(self):
+        cli.register(self.app)
+        runner = self.app.test_cli_runner()
+        with Ledger() as ledger:
+            ledger.post(expense(2.0), self.a1, self.c1)
+        result = runner.invoke(args=['ledger', 'recompute'])
+        self.assertEqual((result.exit_code, result.output), (0, 'All balances match their transactions\n'))
+
+        table = Account.__table__
+        db.session.execute(table.update().where(table.c.id == self.c1.id).values(balance=0.0))
+        db.session.commit()
+        result = runner.invoke(args=['ledger', 'recompute'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('Category 1: stored 0.00, computed 2.00 EUR (+2.00)', result.output)
+        result = runner.invoke(args=['ledger', 'recompute', '--repair'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Repaired 1 account balances', result.output)
+        self.assertEqual(runner.invoke(args=['ledger', 'recompute']).exit_code, 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,70 @@
+import unittest
+
+from app import create_app, db
+from app.models import Transaction, TransactionType, Account
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+    PROFILING = True
+
+
+class ProfilingCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        account = Account(name='Account 1', currency='EUR', balance=0.0)
+        category = Account(name='Category 1', currency='EUR', is_category=True, balance=0.0)
+        account.add_transaction(Transaction(type=TransactionType.expense, description='Coffee',
+                                            value_src=2.0, currency_src='EUR', value_dest=2.0, currency_dest='EUR'),
+                                dest_account=category)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_records_requests(self):
+        for _ in range(7):
+            self.client.get('/index')
+        self.client.get('/search?q=coffee')
+        profile = self.client.get('/debug/perf.json').get_json()
+
+        index = profile['endpoints']['main.index']
+        self.assertEqual(index['count'], 7)
+        self.assertEqual(sum(index['buckets'].values()), 7)
+        self.assertEqual(len(profile['requests']), 8)
+        self.assertEqual(profile['requests'][-1]['endpoint'], 'main.search')
+        self.assertGreater(profile['requests'][-1]['sql_count'], 0)
+        self.assertGreater(profile['requests'][-1]['template_ms'], 0)
+        self.assertEqual(profile['search']['query']['count'], 1)
+        self.assertIn('index.html', profile['templates'])
+        self.assertTrue(any(q.startswith('SELECT') for q in profile['queries']))
+        self.assertGreater(profile['pools']['primary']['checkouts'], 0)
+
+    def test_dashboard(self):
+        self.client.get('/index')
+        response = self.client.get('/debug/perf')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('main.index', response.get_data(as_text=True))
+        self.assertIn('Connection pools', response.get_data(as_text=True))
+
+    def test_disabled_by_default(self):
+        class Disabled(TestConfig):
+            PROFILING = False
+        app = create_app(Disabled)
+        self.assertEqual(app.test_client().get('/debug/perf').status_code, 404)
+        self.assertNotIn('profiler', app.extensions)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,110 @@
+import re
+import unittest
+from datetime import datetime, timedelta
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Transaction, TransactionType, Account, Posting, BalanceSnapshot
+from app.pagination import encode_cursor
+from config import Config
+
+# Plan lines reading every row of a table, e.g. 'SCAN transaction' or 'SCAN TABLE transaction'
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?$')
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+    SQLALCHEMY_RECORD_QUERIES = True
+    WTF_CSRF_ENABLED = False
+
+
+class QueryPlanCase(unittest.TestCase):
+    """Runs EXPLAIN QUERY PLAN on the statements issued by the account-scoped and feed queries"""
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        self.accounts = [Account(name=f'Account {i}', currency='EUR', balance=0.0) for i in range(3)]
+        self.categories = [Account(name=f'Category {i}', currency='EUR', is_category=True) for i in range(5)]
+        db.session.add_all(self.accounts + self.categories)
+        now = datetime.utcnow()
+        for i in range(300):
+            db.session.add(Transaction(type=TransactionType.expense, description=f'Expense {i}',
+                                       datetime=now - timedelta(hours=7 * i),
+                                       value_src=1.0, currency_src='EUR', value_dest=1.0, currency_dest='EUR',
+                                       src_account=self.accounts[i % 3], dest_account=self.categories[i % 5]))
+        db.session.commit()
+        self.account = self.accounts[0]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def plans(self, function, *args):
+        """Returns the query plan of every statement issued while running the function"""
+        before = len(get_debug_queries())
+        function(*args)
+        plans = []
+        for query in get_debug_queries()[before:]:
+            if query.statement.lstrip().upper().startswith('SELECT'):
+                rows = db.session.connection().execute(f'EXPLAIN QUERY PLAN {query.statement}', query.parameters)
+                plans.append((query.statement, [row[-1] for row in rows]))
+        return plans
+
+    def get(self, url):
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def assert_seeks(self, plans, *indexes):
+        """Fails if a transaction, summary or journal table is fully scanned, or one of the indexes is unused"""
+        used = set()
+        for statement, plan in plans:
+            for line in plan:
+                scan = FULL_SCAN.match(line)
+                self.assertFalse(scan and scan.group(1) in ('transaction', 'account_summary', 'posting',
+                                                            'balance_snapshot'),
+                                 f'{line} in the plan of\n{statement}')
+                used.update(re.findall(r'USING (?:COVERING )?INDEX (\w+)', line))
+        for index in indexes:
+            self.assertIn(index, used)
+
+    def test_home_feed(self):
+        self.assert_seeks(self.plans(self.get, '/index'), 'ix_transaction_datetime_id')
+
+    def test_home_feed_deep_page(self):
+        cursor = encode_cursor(Transaction.query.order_by(Transaction.datetime.desc()).offset(200).first())
+        plans = self.plans(self.get, f'/index?after={cursor}')
+        self.assert_seeks(plans, 'ix_transaction_datetime_id')
+        self.assertTrue(any('SEARCH transaction USING INDEX ix_transaction_datetime_id (datetime<?)' in line
+                            for _, plan in plans for line in plan))
+
+    def test_account_view(self):
+        cursor = encode_cursor(self.account.transactions().order_by(Transaction.datetime.desc()).offset(50).first())
+        for url in (f'/account/{self.account.id}', f'/account/{self.account.id}?after={cursor}'):
+            self.assert_seeks(self.plans(self.get, url),
+                              'ix_transaction_src_account_id_datetime', 'ix_transaction_dest_account_id_datetime')
+
+    def test_transactions_cur_month(self):
+        self.assert_seeks(self.plans(self.account.transactions_cur_month),
+                          'ix_transaction_src_account_id_datetime', 'ix_transaction_dest_account_id_datetime')
+
+    def test_sum_cur_month(self):
+        self.assert_seeks(self.plans(self.account.sum_cur_month), 'sqlite_autoindex_account_summary_1')
+
+    def test_balance_at(self):
+        Posting.record(Transaction.id.isnot(None))
+        BalanceSnapshot.take(20)
+        when = datetime.utcnow() - timedelta(days=30)
+        self.assert_seeks(self.plans(self.account.balance_at, when),
+                          'sqlite_autoindex_balance_snapshot_1', 'ix_posting_account_id_datetime_id')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
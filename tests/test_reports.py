@@ -0,0 +1,93 @@
+import os
+import unittest
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+
+from app import create_app, db
+from app.importer import Importer, read_csv
+from app.models import Account
+from app.reports import group_sum, truncate, period_range, \
+    spending_by_category, income_vs_expense, balance_over_time
+from config import Config, basedir
+
+SAMPLE_CSV = os.path.join(basedir, 'data', 'sample_import.csv')
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+
+
+class GroupingCase(unittest.TestCase):
+
+    def test_truncate(self):
+        when = np.array(['2020-08-04T07:40', '2020-08-31T23:59', '2021-01-01T00:00'], dtype='datetime64[us]')
+        self.assertEqual(truncate(when, 'week').astype(str).tolist(), ['2020-08-03', '2020-08-31', '2020-12-28'])
+        self.assertEqual(truncate(when, 'month').astype(str).tolist(), ['2020-08-01', '2020-08-01', '2021-01-01'])
+        self.assertEqual(truncate(when, 'year').astype(str).tolist(), ['2020-01-01', '2020-01-01', '2021-01-01'])
+        self.assertEqual(len(period_range(date(2020, 6, 15), date(2020, 9, 1), 'month')), 4)
+
+    def test_group_sum(self):
+        (a, b), (s,) = group_sum((np.array([2, 1, 2, 1, 2]), np.array([5, 5, 6, 5, 5])),
+                                 np.array([1.0, 2.0, 3.0, 4.0, 5.0]))
+        self.assertEqual(list(zip(a.tolist(), b.tolist(), s.tolist())), [(1, 5, 6.0), (2, 5, 6.0), (2, 6, 3.0)])
+
+
+class ReportsCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Importer().run(read_csv(SAMPLE_CSV))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_spending_by_category(self):
+        report = spending_by_category(date(2020, 1, 1), date(2020, 12, 31), 'month')
+        self.assertIn((date(2020, 8, 1), 'Bar&Pub', 'EUR', Decimal('13.35')), report.rows)
+        self.assertIn((date(2020, 9, 1), 'Groceries', 'EUR', Decimal('50.00')), report.rows)
+        self.assertEqual(len(report.rows), 4)
+
+    def test_income_vs_expense(self):
+        report = income_vs_expense(date(2020, 1, 1), date(2020, 12, 31), 'year')
+        self.assertEqual(report.rows, [
+            (date(2020, 1, 1), 'CHF', Decimal('300.00'), Decimal('39.00'), Decimal('261.00')),
+            (date(2020, 1, 1), 'EUR', Decimal('300.00'), Decimal('60.50'), Decimal('239.50')),
+            (date(2020, 1, 1), 'USD', Decimal('200.00'), Decimal('0.00'), Decimal('200.00'))])
+
+    def test_balance_over_time(self):
+        report = balance_over_time(date(2020, 8, 1), date(2020, 9, 30), 'month')
+        closing = {name: balance for period, name, _, _, balance in report.rows if period == date(2020, 9, 1)}
+        for account in Account.query.filter_by(is_category=False):
+            self.assertEqual(closing[account.name], account.balance)
+        self.assertIn((date(2020, 8, 1), 'PT Account', 'EUR', Decimal('-10.50'), Decimal('89.50')), report.rows)
+
+    def test_report_route(self):
+        response = self.app.test_client().get('/reports/cashflow?start=2020-01-01&end=2020-12-31&granularity=year'
+                                               '&format=json')
+        self.assertEqual(response.get_json()['rows'][0], ['2020-01-01', 'CHF', '300.00', '39.00', '261.00'])
+        self.assertEqual(self.app.test_client().get('/reports/balance').status_code, 200)
+        self.assertEqual(self.app.test_client().get('/reports/unknown').status_code, 404)
+
+    def test_report_route_rejects_invalid_arguments(self):
+        client = self.app.test_client()
+        self.assertEqual(client.get('/reports/cashflow?granularity=bogus&format=json').status_code, 400)
+        self.assertEqual(client.get('/reports/cashflow?start=yesterday&format=json').status_code, 400)
+        response = client.get('/reports/cashflow?granularity=bogus&start=yesterday')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('Not a valid choice', html)
+        self.assertIn('<option selected value="month">', html)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,103 @@
+import re
+import unittest
+from datetime import datetime, timedelta
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Transaction, TransactionType, Account
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+    SQLALCHEMY_RECORD_QUERIES = True
+    ELASTICSEARCH_URL = None
+    WTF_CSRF_ENABLED = False
+
+
+class RoutesCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        self.account = Account(name='Account 1', currency='EUR', balance=0.0)
+        self.category_count = 0
+        db.session.add(self.account)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_expenses(self, count):
+        now = datetime.utcnow()
+        for i in range(count):
+            # A category per expense, so lazy loads could not be served from the identity map
+            category = Account(name=f'Category {self.category_count}', currency='EUR', is_category=True)
+            self.category_count += 1
+            db.session.add(Transaction(type=TransactionType.expense, description=f'Expense {i}',
+                                       datetime=now - timedelta(hours=i),
+                                       value_src=1.0, currency_src='EUR', value_dest=1.0, currency_dest='EUR',
+                                       src_account=self.account, dest_account=category))
+        db.session.commit()
+
+    def query_count(self, url):
+        # Requests reuse the test app context, which already recorded the setup queries
+        before = len(get_debug_queries())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return int(response.headers['X-SQL-Queries']) - before
+
+    def test_index_query_count_independent_of_page_size(self):
+        self.add_expenses(30)
+        self.app.config['TRANSACTIONS_PER_PAGE'] = 5
+        few = self.query_count('/index')
+        self.app.config['TRANSACTIONS_PER_PAGE'] = 25
+        self.assertEqual(self.query_count('/index'), few)
+
+    def test_account_query_count_independent_of_transactions(self):
+        self.add_expenses(2)
+        few = self.query_count(f'/account/{self.account.id}')
+        self.add_expenses(10)
+        self.assertEqual(self.query_count(f'/account/{self.account.id}'), few)
+
+    def follow(self, url):
+        """Follows the Older or Newer pager link, returning the expense numbers and the pages' links"""
+        html = self.client.get(url.replace('&amp;', '&')).get_data(as_text=True)
+        numbers = [int(n) for n in re.findall(r'Expense (\d+)', html)]
+        links = dict((label, href) for href, label in re.findall(r'<a href="([^"#]+)">(?:<[^>]+>[^<]*</span> )?(\w+)', html)
+                     if label in ('Older', 'Newer'))
+        return numbers, links
+
+    def test_index_keyset_pages(self):
+        self.add_expenses(25)
+        self.app.config['TRANSACTIONS_PER_PAGE'] = 10
+        before = len(get_debug_queries())
+        numbers, links = self.follow('/index')
+        self.assertEqual(numbers, list(range(10)))
+        self.assertNotIn('Newer', links)
+        self.assertFalse(any('count(' in q.statement.lower() for q in get_debug_queries()[before:]))
+
+        numbers, links = self.follow(links['Older'])
+        self.assertEqual(numbers, list(range(10, 20)))
+        numbers, last = self.follow(links['Older'])
+        self.assertEqual(numbers, list(range(20, 25)))
+        self.assertNotIn('Older', last)
+
+        numbers, links = self.follow(last['Newer'])
+        self.assertEqual(numbers, list(range(10, 20)))
+        numbers, links = self.follow(links['Newer'])
+        self.assertEqual(numbers, list(range(10)))
+        self.assertNotIn('Newer', links)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,137 @@
+import json
+import unittest
+from types import SimpleNamespace
+
+from elasticsearch.serializer import JSONSerializer
+
+from app import create_app, db
+from app.models import Transaction, TransactionType, Account
+from app.search import ElasticsearchBackend
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    # Use in-memory SQLite database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
+    ELASTICSEARCH_URL = None
+    SEARCH_BULK_SIZE = 3
+
+
+class RecordingElasticsearch:
+    """Stands in for the cluster, recording the actions of each _bulk request"""
+    def __init__(self):
+        self.transport = SimpleNamespace(serializer=JSONSerializer())
+        self.requests = []
+
+    def bulk(self, body, *args, **kwargs):
+        lines = [json.loads(line) for line in body.splitlines() if line]
+        actions = []
+        items = []
+        while lines:
+            (op_type, meta), = lines.pop(0).items()
+            actions.append((op_type, meta['_id']))
+            if op_type != 'delete':
+                lines.pop(0)
+            items.append({op_type: {'_id': meta['_id'], 'status': 200 if op_type != 'delete' else 404}})
+        self.requests.append(actions)
+        return {'errors': False, 'items': items}
+
+
+class SearchCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.account = Account(name='Account 1', currency='EUR', balance=0.0)
+        self.category = Account(name='Category 1', currency='EUR', balance=0.0, is_category=True)
+        db.session.add_all([self.account, self.category])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_expenses(self, count, description='Expense', where=None):
+        for i in range(count):
+            db.session.add(Transaction(type=TransactionType.expense, description=f'{description} {i}', where=where,
+                                       value_src=1.0, currency_src='EUR', value_dest=1.0, currency_dest='EUR',
+                                       src_account=self.account, dest_account=self.category))
+
+
+class BulkIndexCase(SearchCase):
+
+    def test_commit_sends_batched_bulk_requests(self):
+        es = RecordingElasticsearch()
+        self.app.search_backend = ElasticsearchBackend(es)
+        self.add_expenses(4)
+        db.session.commit()
+        self.assertEqual([len(r) for r in es.requests], [3, 1])
+        self.assertTrue(all(op == 'index' for r in es.requests for op, _ in r))
+
+    def test_deleting_unindexed_document_is_ignored(self):
+        self.add_expenses(1)
+        db.session.commit()
+        es = RecordingElasticsearch()
+        self.app.search_backend = ElasticsearchBackend(es)
+        db.session.delete(Transaction.query.first())
+        db.session.commit()
+        self.assertEqual(es.requests, [[('delete', 1)]])
+
+    def test_reindex_pages_through_table(self):
+        self.add_expenses(7)
+        db.session.commit()
+        es = RecordingElasticsearch()
+        self.app.search_backend = ElasticsearchBackend(es)
+        Transaction.reindex()
+        self.assertEqual([len(r) for r in es.requests], [3, 3, 1])
+        self.assertEqual([i for r in es.requests for _, i in r], list(range(1, 8)))
+
+
+class SQLiteSearchCase(SearchCase):
+
+    def test_ranked_multi_field_match(self):
+        db.session.add(Transaction(type=TransactionType.income, description='Salary', where='Work',
+                                   value_src=10.0, value_dest=10.0, dest_account=self.account))
+        self.add_expenses(2, description='Coffee')
+        self.add_expenses(1, description='Coffee beans', where='Beans shop')
+        db.session.commit()
+
+        ids, total = Transaction.search('coffee beans', 1, 10)
+        self.assertEqual(total, 3)
+        self.assertEqual(ids.first().where, 'Beans shop')
+        ids, total = Transaction.search('sal', 1, 10)
+        self.assertEqual([t.description for t in ids], ['Salary'])
+        ids, total = Transaction.search('category', 1, 10, fields=['dest_account.name'])
+        self.assertEqual(total, 3)
+        ids, total = Transaction.search('category', 1, 10, fields=['description'])
+        self.assertEqual(total, 0)
+
+    def test_pagination_and_removal(self):
+        self.add_expenses(5, description='Coffee')
+        db.session.commit()
+        pages = [[t.id for t in Transaction.search('coffee', page, 2)[0]] for page in (1, 2, 3)]
+        self.assertEqual(sorted(sum(pages, [])), [1, 2, 3, 4, 5])
+        self.assertEqual([len(p) for p in pages], [2, 2, 1])
+
+        db.session.delete(Transaction.query.get(3))
+        db.session.commit()
+        ids, total = Transaction.search('coffee', 1, 10)
+        self.assertEqual(total, 4)
+        self.assertNotIn(3, [t.id for t in ids])
+
+    def test_reindex_after_clear(self):
+        self.add_expenses(4, description='Coffee')
+        db.session.commit()
+        self.app.search_backend.clear(Transaction.__tablename__)
+        self.assertEqual(Transaction.search('coffee', 1, 10)[1], 0)
+        Transaction.reindex()
+        self.assertEqual(Transaction.search('coffee', 1, 10)[1], 4)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
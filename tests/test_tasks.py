@@ -0,0 +1,229 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.ledger import Ledger
+from app.models import Task, Transaction, TransactionType, Account
+from app.tasks import task
+from config import Config, basedir
+
+SAMPLE_CSV = os.path.join(basedir, 'data', 'sample_import.csv')
+
+failures = {'flaky': 0}
+
+
+@task('slow')
+def slow(task, seconds):
+    time.sleep(seconds)
+
+
+@task('flaky')
+def flaky(task, fail):
+    """Fails the first `fail` times it runs"""
+    failures['flaky'] += 1
+    if failures['flaky'] <= fail:
+        raise ConnectionError('cluster unavailable')
+
+
+class TestConfig(Config):
+    TESTING = True
+    SEARCH_INDEX_PATH = ':memory:'
+    ELASTICSEARCH_URL = None
+    TASK_WORKERS = 2
+    TASK_POLL_INTERVAL = 0.05
+    TASK_MAX_ATTEMPTS = 3
+    TASK_HEARTBEAT_INTERVAL = 0.05
+
+
+class TaskQueueCase(unittest.TestCase):
+    """Tasks queued in a database file, run by calling the queue or by its worker threads"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'test.db')
+
+        class FileConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        self.app = create_app(FileConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.queue = self.app.tasks
+        db.create_all()
+        self.account = Account(name='Account 1', currency='EUR', balance=0.0)
+        self.category = Account(name='Category 1', currency='EUR', balance=0.0, is_category=True)
+        db.session.add_all([self.account, self.category])
+        db.session.commit()
+        failures['flaky'] = 0
+
+    def tearDown(self):
+        self.queue.stop(timeout=5)
+        db.session.remove()
+        db.drop_all()
+        db.get_engine().dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def post(self, description: str) -> Transaction:
+        with Ledger() as ledger:
+            return ledger.post(Transaction(type=TransactionType.expense, description=description, value_src=1,
+                                           currency_src='EUR', value_dest=1, currency_dest='EUR'),
+                               self.account, self.category)
+
+    def found(self, query: str) -> int:
+        return Transaction.search(query, 1, 10)[1]
+
+    def test_commits_queue_index_updates(self):
+        self.assertFalse(self.queue.eager)
+        coffee = self.post('Coffee').id
+        self.post('Coffee beans')
+        self.assertEqual(self.found('coffee'), 0)
+        # One task per commit, written by it
+        self.assertEqual([(t.name, t.status) for t in Task.query], [('index', 'queued')] * 2)
+
+        self.assertEqual(self.queue.run_pending(), 2)
+        self.assertEqual(self.found('coffee'), 2)
+        self.assertEqual({t.status for t in Task.query}, {'done'})
+
+        with Ledger() as ledger:
+            ledger.remove(Transaction.query.get(coffee))
+        self.assertEqual(self.queue.run_pending(), 1)
+        self.assertEqual(self.found('coffee'), 1)
+
+    def test_rolled_back_commits_queue_nothing(self):
+        with self.assertRaises(ZeroDivisionError):
+            with Ledger() as ledger:
+                ledger.post(Transaction(type=TransactionType.income, value_src=1, currency_src='EUR', value_dest=1,
+                                        currency_dest='EUR'), dest_account=self.account)
+                db.session.flush()
+                1 / 0
+        self.assertEqual(Task.query.count(), 0)
+
+    def test_retries_with_backoff(self):
+        flaky_id = self.queue.submit('flaky', fail=1).id
+        self.assertEqual(self.queue.run_pending(), 1)
+        queued = Task.query.get(flaky_id)
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertIn('ConnectionError: cluster unavailable', queued.error)
+        self.assertGreater(queued.run_after, datetime.utcnow() + timedelta(seconds=1))
+        # Not due before its delay
+        self.assertEqual(self.queue.run_pending(), 0)
+        self.assertEqual(self.queue.retry_delay(3), 8)
+
+        queued.run_after = datetime.utcnow()
+        db.session.commit()
+        self.assertEqual(self.queue.run_pending(), 1)
+        done = Task.query.get(flaky_id)
+        self.assertEqual((done.status, done.attempts, done.error), ('done', 2, None))
+
+    def test_fails_after_max_attempts(self):
+        failed_id = self.queue.submit('flaky', fail=5, max_attempts=1).id
+        self.queue.submit('missing')
+        self.assertEqual(self.queue.run_pending(), 2)
+        failed, missing = Task.query.order_by(Task.id)
+        self.assertEqual((failed.id, failed.status), (failed_id, 'failed'))
+        self.assertEqual(missing.status, 'queued')
+        self.assertIn('unknown task missing', missing.error)
+
+    def test_stale_tasks_run_again(self):
+        stale_id = self.queue.submit('flaky', fail=0).id
+        self.assertTrue(self.queue.claim())
+        self.assertEqual(self.queue.run_pending(), 0)
+        Task.query.get(stale_id).heartbeat = datetime.utcnow() - timedelta(seconds=TestConfig.TASK_TIMEOUT + 1)
+        db.session.commit()
+        self.assertEqual(self.queue.run_pending(), 1)
+        self.assertEqual(Task.query.get(stale_id).attempts, 2)
+
+    def test_running_tasks_send_heartbeats(self):
+        slow_id = self.queue.submit('slow', seconds=0.3).id
+        self.assertEqual(self.queue.run_pending(), 1)
+        done = Task.query.get(slow_id)
+        self.assertEqual(done.status, 'done')
+        # Long running tasks are not stale as long as they beat
+        self.assertGreater(done.heartbeat, done.started + timedelta(seconds=0.1))
+
+    def test_idle_polls_write_nothing(self):
+        commits = []
+
+        def count_commit(session):
+            commits.append(session)
+        event.listen(db.session, 'after_commit', count_commit)
+        try:
+            for _ in range(3):
+                self.assertFalse(self.queue.run_next())
+        finally:
+            event.remove(db.session, 'after_commit', count_commit)
+        self.assertEqual(commits, [])
+
+    def test_workers(self):
+        self.queue.start()
+        self.assertEqual(len(self.queue.threads), 2)
+        self.post('Coffee')
+        db.session.remove()
+        deadline = time.monotonic() + 10
+        while Task.query.filter(Task.status != 'done').count() and time.monotonic() < deadline:
+            db.session.remove()
+            time.sleep(0.05)
+        self.assertEqual(self.found('coffee'), 1)
+
+    def test_import_task(self):
+        import_id = self.queue.submit('import', csv_files=[SAMPLE_CSV]).id
+        # The import, then the reindex it queued
+        self.assertEqual(self.queue.run_pending(), 2)
+        imported, reindexed = Task.query.order_by(Task.id)
+        self.assertEqual((imported.id, imported.status), (import_id, 'done'))
+        self.assertRegex(imported.progress, r'^Imported \d+ transactions, skipped 0')
+        self.assertEqual((reindexed.name, reindexed.status), ('reindex', 'done'))
+        self.assertGreater(self.found('coffee'), 0)
+
+    def test_import_progress_written_with_chunks(self):
+        import_id = self.queue.submit('import', csv_files=[SAMPLE_CSV], chunk_size=4).id
+        stored = []
+
+        def read_progress(session):
+            # What another process reads once the commit is durable
+            with db.engine.connect() as connection:
+                progress = connection.execute(db.select([Task.progress]).where(Task.id == import_id)).scalar()
+                count = connection.execute(db.select([db.func.count()]).select_from(Transaction.__table__)).scalar()
+            stored.append((progress, count))
+        event.listen(db.session, 'after_commit', read_progress)
+        try:
+            self.queue.run_next()
+        finally:
+            event.remove(db.session, 'after_commit', read_progress)
+        chunks = [(progress, count) for progress, count in stored if progress and '/s)' in progress]
+        self.assertEqual(sorted({count for _, count in chunks}), [4, 8, 11])
+        for progress, count in chunks:
+            self.assertTrue(progress.startswith(f'Imported {count} transactions'), (progress, count))
+
+    def test_no_index_tasks_without_search(self):
+        self.app.search_backend = None
+        self.post('Coffee')
+        self.assertEqual(Task.query.count(), 0)
+
+    def test_status_routes(self):
+        # The first request starts no worker, leaving the tasks as they are
+        self.queue.workers = 0
+        client = self.app.test_client()
+        flaky_id = self.queue.submit('flaky', fail=0).id
+        self.queue.submit('flaky', fail=0)
+        self.queue.claim()
+        self.assertEqual(client.get(f'/api/v1/tasks/{flaky_id}').get_json()['status'], 'running')
+        queued = client.get('/api/v1/tasks?status=queued').get_json()['items']
+        self.assertEqual([(t['name'], t['arguments']) for t in queued], [('flaky', {'fail': 0})])
+        self.assertEqual(len(client.get('/api/v1/tasks?limit=1').get_json()['items']), 1)
+        self.assertEqual(client.get('/api/v1/tasks?status=lost').status_code, 400)
+        self.assertEqual(client.get('/api/v1/tasks/99').status_code, 404)
+
+    def test_eager_with_memory_database(self):
+        class MemoryConfig(TestConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        self.assertTrue(create_app(MemoryConfig).tasks.eager)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
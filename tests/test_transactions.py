@@ -1,6 +1,9 @@
 import unittest
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
 from app import create_app, db
-from app.models import Transaction, TransactionType, Account
+from app.models import Transaction, TransactionType, Account, AccountSummary, Period
 from config import Config
 
 ACCOUNTS = [
@@ -14,6 +17,7 @@ class TestConfig(Config):
     TESTING = True
     # Use in-memory SQLite database
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SEARCH_INDEX_PATH = ':memory:'
 
 
 class TransactionModelCase(unittest.TestCase):
@@ -61,6 +65,14 @@ class TransactionModelCase(unittest.TestCase):
         self.assertEqual(a2.balance, 0.0)
         self.assertNotIn(t2, a2.transactions_to.all())
 
+    def test_add_to_new_account(self):
+        account = Account(name='Account 3', currency='EUR', balance=0.0)
+        account.add_transaction(Transaction(type=TransactionType.income, value_src=7.0, currency_src="EUR",
+                                            value_dest=7.0, currency_dest="EUR"))
+        db.session.commit()
+        self.assertIsNotNone(account.id)
+        self.assertEqual(account.balance, 7.0)
+
     def test_wrong_currency(self):
         a1 = Account.query.filter_by(name="Account 1").first()
         t1 = Transaction(type=TransactionType.expense, value_src=50.0, currency_src="CHF")
@@ -69,6 +81,69 @@ class TransactionModelCase(unittest.TestCase):
         with self.assertRaises(RuntimeError) as _:
             a1.add_transaction(t1, dest_account=c1)
 
+    def test_summaries_follow_transactions(self):
+        a1 = Account.query.filter_by(name="Account 1").first()
+        c1 = Account.query.filter_by(name="Category 1").first()
+        now = datetime.utcnow()
+        t1 = Transaction(type=TransactionType.expense, datetime=now,
+                         value_src=20.0, currency_src="EUR", value_dest=20.0, currency_dest="EUR")
+        t2 = Transaction(type=TransactionType.expense, datetime=now,
+                         value_src=5.0, currency_src="EUR", value_dest=5.0, currency_dest="EUR")
+        t3 = Transaction(type=TransactionType.income, datetime=now - timedelta(days=62),
+                         value_src=100.0, currency_src="EUR", value_dest=100.0, currency_dest="EUR")
+        a1.add_transaction(t1, dest_account=c1)
+        a1.add_transaction(t2, dest_account=c1)
+        a1.add_transaction(t3)
+        self.assertEqual(a1.sum_cur_month(), -25.0)
+        self.assertEqual(c1.sum_cur_month(), 25.0)
+        month = AccountSummary.query.get((a1.id, Period.month, date.today().replace(day=1)))
+        self.assertEqual((month.inflow, month.outflow, month.count), (0.0, 25.0, 2))
+        self.assertEqual([s.inflow for s in a1.trend()], [100.0, 0.0])
+
+        a1.remove_transaction(t2)
+        self.assertEqual(a1.sum_cur_month(), -20.0)
+        self.assertEqual(c1.sum_cur_month(), 20.0)
+
+    def test_rebuild_summaries(self):
+        a1 = Account.query.filter_by(name="Account 1").first()
+        a2 = Account.query.filter_by(name="Account 2").first()
+        c1 = Account.query.filter_by(name="Category 1").first()
+        for days in (0, 1, 40, 400):
+            a1.add_transaction(Transaction(type=TransactionType.expense,
+                                           datetime=datetime.utcnow() - timedelta(days=days),
+                                           value_src=days + 1.0, currency_src="EUR",
+                                           value_dest=days + 1.0, currency_dest="EUR"), dest_account=c1)
+            a1.add_transaction(Transaction(type=TransactionType.transfer,
+                                           datetime=datetime.utcnow() - timedelta(days=days),
+                                           value_src=2.0, currency_src="EUR",
+                                           value_dest=2.0, currency_dest="EUR"), dest_account=a2)
+
+        def summaries():
+            return sorted((s.account_id, s.period.name, s.start, s.inflow, s.outflow, s.count)
+                          for s in AccountSummary.query)
+
+        incremental = summaries()
+        AccountSummary.query.delete()
+        db.session.commit()
+        self.assertEqual(AccountSummary.rebuild(), len(incremental))
+        self.assertEqual(summaries(), incremental)
+
+    def test_amounts_are_exact(self):
+        a1 = Account.query.filter_by(name="Account 1").first()
+        c1 = Account.query.filter_by(name="Category 1").first()
+        for value in (0.1, 0.2, '0.005', Decimal('1.999')):
+            a1.add_transaction(Transaction(type=TransactionType.expense, value_src=value, currency_src="EUR",
+                                           value_dest=value, currency_dest="EUR"), dest_account=c1)
+        db.session.commit()
+        # Amounts are rounded half up to cents, and summed as integers
+        self.assertEqual(sorted(t.value_src for t in Transaction.query), [Decimal('0.01'), Decimal('0.10'),
+                                                                          Decimal('0.20'), Decimal('2.00')])
+        self.assertEqual((a1.balance, c1.balance), (Decimal('-2.31'), Decimal('2.31')))
+        self.assertEqual(a1.sum_cur_month(), Decimal('-2.31'))
+        raw, = db.session.execute(db.select([db.type_coerce(Account.balance, db.BigInteger)])
+                                  .where(Account.id == a1.id)).fetchone()
+        self.assertEqual(raw, -231)
+
     @staticmethod
     def create_accounts():
         for a in ACCOUNTS:
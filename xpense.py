@@ -1,8 +1,9 @@
-from app import create_app, db
-from app.models import Transaction, TransactionType, Account
+from app import create_app, db, cli
+from app.models import Transaction, TransactionType, Account, AccountSummary, ExchangeRate
 
 
 app = create_app()
+cli.register(app)
 
 
 @app.shell_context_processor
@@ -12,4 +13,6 @@ def make_shell_context():
         'Transaction': Transaction,
         'TransactionType': TransactionType,
         'Account': Account,
+        'AccountSummary': AccountSummary,
+        'ExchangeRate': ExchangeRate,
     }